@@ -1,69 +1,50 @@
 import os
 import logging
-from openai import OpenAI
-from langfuse import Langfuse
+from app.llm import chat_completion
+from app.keywords import keyword_tags
+from app.knowledge_base import get_knowledge_base
+from app.retrieval import retrieve_answer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Model used to answer from retrieved clinic passages
+RETRIEVAL_MODEL = os.getenv("RETRIEVAL_MODEL", "gpt-4o-mini")
 
-# Initialize Langfuse for logging
-langfuse = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-    host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
-)
-
-# Simple knowledge base for demo purposes
-KNOWLEDGE_BASE = {
-    "hours": {
-        "question": ["what are your hours", "when are you open", "office hours"],
-        "answer": "Our clinic is open Monday through Friday from 9:00 AM to 5:00 PM, and on Saturdays from 9:00 AM to 1:00 PM. We are closed on Sundays and major holidays."
-    },
-    "services": {
-        "question": ["what services do you offer", "what do you treat", "what medical services", "what can you help with"],
-        "answer": "Our clinic offers primary care services, including annual check-ups, vaccinations, illness treatment, and management of chronic conditions. We also provide specialist referrals and basic laboratory services."
-    },
-    "location": {
-        "question": ["where are you located", "what's your address", "how do i get to your clinic", "directions"],
-        "answer": "Our clinic is located at 123 Medical Drive, Suite 100, in downtown. We are easily accessible by public transportation and have free parking available for patients."
-    },
-    "insurance": {
-        "question": ["do you accept insurance", "what insurance plans", "is my insurance covered", "payment options"],
-        "answer": "We accept most major insurance plans, including Medicare and Medicaid. Please bring your insurance card to your appointment so we can verify your coverage. We also offer affordable self-pay options for those without insurance."
-    },
-    "covid": {
-        "question": ["covid protocols", "covid testing", "covid vaccine", "mask requirements", "coronavirus"],
-        "answer": "We offer COVID-19 testing and vaccinations. We follow CDC guidelines for safety protocols. Masks are currently optional but recommended for those who are immunocompromised or experiencing respiratory symptoms."
-    },
-    "doctors": {
-        "question": ["who are your doctors", "medical staff", "specialists", "practitioners"],
-        "answer": "Our clinic has a team of board-certified physicians specializing in family medicine, internal medicine, and pediatrics. We also have nurse practitioners and physician assistants who work alongside our doctors to provide comprehensive care."
-    },
-    "greeting": {
-        "question": ["hello", "hi", "hey", "good morning", "good afternoon", "good evening", "howdy", "greetings"],
-        "answer": "Hello! I'm your healthcare AI assistant. How can I help you today with your healthcare needs?"
-    },
-    "thanks": {
-        "question": ["thank you", "thanks", "appreciate it", "thank you so much", "thx"],
-        "answer": "You're welcome! I'm happy to help with any other questions you might have about our clinic or your health concerns."
-    },
-    "goodbye": {
-        "question": ["goodbye", "bye", "see you", "talk to you later", "good night"],
-        "answer": "Goodbye! Please don't hesitate to reach out if you have any other questions. Have a great day!"
-    },
-    "name": {
-        "question": ["what's your name", "who are you", "what should I call you", "your name", "can I know your name"],
-        "answer": "I'm MedAgent, your AI healthcare assistant. I'm here to help you with scheduling appointments, answering questions about our services, and providing general health information."
-    },
-    "patient_name": {
-        "question": ["my name", "what's my name", "do you know my name", "can I know my name"],
-        "answer": "I can see information you've shared during our conversation, including your name if you've provided it earlier. How else can I assist you today?"
-    }
-}
+def answer_from_passages(question, passages):
+    """
+    Answer a general question using only the retrieved clinic passages
+    
+    Args:
+        question: The patient's question
+        passages: A few short passages from the clinic documents
+    
+    Returns:
+        str: The model's answer
+    """
+    system_prompt = (
+        "You are an AI assistant for a healthcare clinic. Answer the patient's question in one or two "
+        "friendly sentences using only the clinic information below. If it does not answer the question, "
+        "say so and suggest contacting the clinic.\n\nClinic information:\n" + "\n".join(passages)
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+    
+    response = chat_completion(
+        "general_inquiry_retrieval",
+        messages,
+        model=RETRIEVAL_MODEL,
+        temperature=0.3,
+        max_tokens=150,
+        metadata={"query_type": "general_inquiry", "passages": len(passages)}
+    )
+    answer = response.choices[0].message.content
+    
+    logger.info(f"General inquiry answered from {len(passages)} passages via {RETRIEVAL_MODEL} (tokens: {response.usage.total_tokens})")
+    return answer
 
 def call_center_agent(state):
     """
@@ -86,30 +67,10 @@ def call_center_agent(state):
     try:
         # First, prioritize health-related queries over simple keyword matching
         # Check if it's a health-related query (including specialist recommendations)
-        is_health_query = False
-        health_terms = ["pain", "hurt", "sick", "fever", "headache", "cough", "symptom", 
-                      "heart", "blood", "doctor", "medicine", "prescription", "allergy", 
-                      "condition", "medical", "health", "treatment", "cancer", "disease", 
-                      "infection", "diagnosis", "surgery", "emergency", "specialist", 
-                      "test", "lab", "results"]
-        
-        for term in health_terms:
-            if term in transcript.lower():
-                is_health_query = True
-                break
-                
-        # Additional check for doctor recommendation queries
-        doctor_recommendation_patterns = [
-            "which doctor", "recommend a doctor", "suggest a doctor", "which specialist",
-            "need a doctor for", "doctor would you suggest", "doctor should i see",
-            "specialist for", "what kind of doctor"
-        ]
-        
-        if not is_health_query:
-            for pattern in doctor_recommendation_patterns:
-                if pattern in transcript.lower():
-                    is_health_query = True
-                    break
+        # Both the health terms and the doctor recommendation phrases come from
+        # the shared keyword engine, which scans the transcript once per turn
+        tags = keyword_tags(transcript)
+        is_health_query = "health" in tags or "doctor_recommendation" in tags
         
         # If it's a health query, handle it with the health-specific GPT logic
         if is_health_query:
@@ -147,107 +108,75 @@ def call_center_agent(state):
                 {"role": "user", "content": transcript}
             ]
             
-            # Create a Langfuse generation for proper cost tracking
-            generation = langfuse.start_generation(
-                name="health_inquiry_gpt4",
-                model="gpt-4o",
-                input=messages,
-                metadata={"temperature": 0.5, "query_type": "health_related"}
-            )
-            
-            response = client.chat.completions.create(
+            response = chat_completion(
+                "health_inquiry_gpt4",
+                messages,
                 model="gpt-4o",
-                messages=messages,
-                temperature=0.5
+                temperature=0.5,
+                metadata={"query_type": "health_related"}
             )
             
             state["response"] = response.choices[0].message.content
             
-            # Update generation with output and usage data for cost tracking
-            generation.update(
-                output=state["response"],
-                usage_details={
-                    "input": response.usage.prompt_tokens,
-                    "output": response.usage.completion_tokens,
-                    "total": response.usage.total_tokens
-                }
-            )
-            generation.end()
-            
             logger.info(f"Health inquiry response generated (tokens: {response.usage.total_tokens})")
             
         else:
             # Continue with the regular flow for non-health queries
             # Check if the query matches any knowledge base items
-            knowledge_base_match = None
-            matched_category = None
-            
-            for category, data in KNOWLEDGE_BASE.items():
-                for phrase in data["question"]:
-                    if phrase.lower() in transcript.lower():
-                        knowledge_base_match = data["answer"]
-                        matched_category = category
-                        break
-                if knowledge_base_match:
-                    break
+            knowledge_base_match = get_knowledge_base().lookup(transcript)
             
             # If we found a match, respond with the knowledge base answer
             if knowledge_base_match:
-                state["response"] = knowledge_base_match
-                logger.info(f"Response generated from knowledge base: '{matched_category}' category")
+                matched_category, answer, score = knowledge_base_match
+                state["response"] = answer
+                logger.info(f"Response generated from knowledge base: '{matched_category}' category (score: {score:.2f})")
             else:
-                # If no direct match, use GPT-4o for a response
-                system_prompt = """
-                You are an AI assistant for a healthcare clinic. Your goal is to provide helpful, accurate, 
-                and concise responses to patient inquiries about clinic services, policies, and general 
-                medical information. 
-                
-                Here are some guidelines:
-                1. Provide accurate information about clinic services, hours, and policies.
-                2. For general medical information, provide widely accepted information but avoid making specific diagnoses.
-                3. If asked about emergencies, always advise patients to call 911 or go to the nearest emergency room.
-                4. Keep responses friendly, professional, and concise.
-                5. Do not provide information on prescription drugs or treatment recommendations.
-                6. If you're unsure about something, acknowledge that and suggest the patient speak with a healthcare provider.
-                7. For simple greetings or brief remarks, respond naturally and warmly.
-                8. If asked about personal information, respond in a friendly way while respecting privacy boundaries.
+                # If no direct match, look for the answer in the clinic documents
+                retrieval = retrieve_answer(transcript)
                 
-                Remember, you represent a healthcare clinic, so maintain professionalism at all times.
-                """
+                if retrieval["mode"] == "direct":
+                    # A strong passage match answers the question without any model call
+                    state["response"] = retrieval["answer"]
+                    logger.info(f"Response generated from clinic documents (score: {retrieval['score']:.2f})")
+                elif retrieval["mode"] == "llm":
+                    # Partial match: let the cheaper model answer from a few short passages
+                    state["response"] = answer_from_passages(transcript, retrieval["passages"])
+                else:
+                    # Nothing relevant in the documents, use GPT-4o for a response
+                    system_prompt = """
+                    You are an AI assistant for a healthcare clinic. Your goal is to provide helpful, accurate, 
+                    and concise responses to patient inquiries about clinic services, policies, and general 
+                    medical information. 
                 
-                messages = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": transcript}
-                ]
+                    Here are some guidelines:
+                    1. Provide accurate information about clinic services, hours, and policies.
+                    2. For general medical information, provide widely accepted information but avoid making specific diagnoses.
+                    3. If asked about emergencies, always advise patients to call 911 or go to the nearest emergency room.
+                    4. Keep responses friendly, professional, and concise.
+                    5. Do not provide information on prescription drugs or treatment recommendations.
+                    6. If you're unsure about something, acknowledge that and suggest the patient speak with a healthcare provider.
+                    7. For simple greetings or brief remarks, respond naturally and warmly.
+                    8. If asked about personal information, respond in a friendly way while respecting privacy boundaries.
                 
-                # Create a Langfuse generation for proper cost tracking
-                generation = langfuse.start_generation(
-                    name="general_inquiry_gpt4",
-                    model="gpt-4o",
-                    input=messages,
-                    metadata={"temperature": 0.7, "query_type": "general_inquiry"}
-                )
+                    Remember, you represent a healthcare clinic, so maintain professionalism at all times.
+                    """
                 
-                response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=messages,
-                    temperature=0.7
-                )
+                    messages = [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": transcript}
+                    ]
                 
-                state["response"] = response.choices[0].message.content
+                    response = chat_completion(
+                        "general_inquiry_gpt4",
+                        messages,
+                        model="gpt-4o",
+                        temperature=0.7,
+                        metadata={"query_type": "general_inquiry"}
+                    )
                 
-                # Update generation with output and usage data for cost tracking
-                generation.update(
-                    output=state["response"],
-                    usage_details={
-                        "input": response.usage.prompt_tokens,
-                        "output": response.usage.completion_tokens,
-                        "total": response.usage.total_tokens
-                    }
-                )
-                generation.end()
+                    state["response"] = response.choices[0].message.content
                 
-                logger.info(f"General inquiry response generated via GPT-4o (tokens: {response.usage.total_tokens})")
+                    logger.info(f"General inquiry response generated via GPT-4o (tokens: {response.usage.total_tokens})")
         
         logger.info(f"Call Center Agent: Response processing complete")
     
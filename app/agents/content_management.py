@@ -1,33 +1,15 @@
 import os
 import logging
-from openai import OpenAI
-from langfuse import Langfuse
+from app.llm import chat_completion
+from app.compliance import get_compliance_engine
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize Langfuse for logging
-langfuse = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-    host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
-)
-
-# Define healthcare compliance guidelines
-COMPLIANCE_GUIDELINES = [
-    "No specific treatment recommendations should be made.",
-    "No diagnoses should be provided.",
-    "No prescription drug information should be given.",
-    "Emergency situations should direct patients to call 911 or go to the ER.",
-    "Patient privacy should be maintained at all times.",
-    "Responses should be professionally worded.",
-    "Medical information should be factually accurate.",
-    "Responses should not promise medical outcomes."
-]
+# Healthcare compliance guidelines and the compiled rules that enforce them
+# live in app/data/compliance_rules.json
+COMPLIANCE_GUIDELINES = get_compliance_engine().guidelines
 
 def content_management_agent(state):
     """
@@ -52,34 +34,27 @@ def content_management_agent(state):
         # Extract the response from the state
         response = state["response"]
         
-        # For demo purposes, perform a simple validation check
-        # In a real system, this would be more sophisticated
-        problematic_phrases = [
-            "I diagnose you with",
-            "you should take",
-            "I recommend this medication",
-            "this drug will help",
-            "I can prescribe",
-            "you definitely have"
-        ]
-        
-        # Check if any problematic phrases are in the response
-        issues_found = []
-        for phrase in problematic_phrases:
-            if phrase.lower() in response.lower():
-                issues_found.append(phrase)
+        # Scan once with the compiled rules; most violations are rewritten locally
+        engine = get_compliance_engine()
+        result = engine.check(response)
         
-        # If issues were found, modify the response
-        if issues_found:
+        if result.compliant:
+            logger.info(f"Response passed compliance validation")
+        elif not result.needs_llm:
+            state["response"] = result.text
+            issues_found = sorted({violation.rule_id for violation in result.violations})
+            logger.info(f"Compliance issues corrected locally: {', '.join(issues_found)}")
+        else:
+            # Only rules without a safe rewrite (e.g. dosing details) reach the model
+            issues_found = [violation.text for violation in result.violations if violation.rule_id in result.needs_llm]
             logger.warning(f"Compliance issues detected: {', '.join(issues_found)} - correcting response")
             
-            # Use GPT-4o to fix the response
             system_prompt = f"""
             You are an AI content reviewer for a healthcare clinic. Review the following response 
             for compliance issues and modify it to be compliant with these guidelines:
             
             Guidelines:
-            {', '.join(COMPLIANCE_GUIDELINES)}
+            {', '.join(engine.guidelines)}
             
             The following problematic phrases were identified:
             {', '.join(issues_found)}
@@ -89,42 +64,24 @@ def content_management_agent(state):
             
             messages = [
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": response}
+                {"role": "user", "content": result.text}
             ]
             
-            # Create a Langfuse generation for proper cost tracking
-            generation = langfuse.start_generation(
-                name="content_correction_gpt4",
-                model="gpt-4o",
-                input=messages,
-                metadata={"temperature": 0.3, "issues_found": issues_found}
-            )
-            
-            correction_response = client.chat.completions.create(
+            correction_response = chat_completion(
+                "content_correction_gpt4",
+                messages,
                 model="gpt-4o",
-                messages=messages,
-                temperature=0.3
+                temperature=0.3,
+                metadata={"issues_found": issues_found}
             )
             
             # Update the response
             state["response"] = correction_response.choices[0].message.content
             
-            # Update generation with output and usage data for cost tracking
-            generation.update(
-                output=state["response"],
-                usage_details={
-                    "input": correction_response.usage.prompt_tokens,
-                    "output": correction_response.usage.completion_tokens,
-                    "total": correction_response.usage.total_tokens
-                }
-            )
-            
-            # End the generation
-            generation.end()
+            # The same response (e.g. a templated reply) is never sent for correction twice
+            engine.remember(response, state["response"])
             
             logger.info(f"Response corrected for compliance (tokens: {correction_response.usage.total_tokens})")
-        else:
-            logger.info(f"Response passed compliance validation")
         
         # In a more advanced system, we could also:
         # 1. Check response against a vector store of previous responses
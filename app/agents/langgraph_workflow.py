@@ -1,16 +1,26 @@
+import os
 import logging
 from langgraph.graph import StateGraph
 from typing import Dict, Any, TypedDict, List
-from app.agents.receptionist import receptionist_agent
+from app.agents.receptionist import receptionist_agent, detect_interrupt, detect_appointment_intent
 from app.agents.appointment import appointment_agent
 from app.agents.call_center import call_center_agent
 from app.agents.content_management import content_management_agent
 from app.agents.notification import notification_agent
+from app.keywords import keyword_tags
+from app.metrics import instrument_node, TURN_LATENCY, INTENT_CLASSIFICATIONS, intent_label, appointment_state_label
+from app.costs import cost_scope, track_node, finish as finish_costs
+from app.dispatch import DirectDispatchGraph
+from app.checkpoints import checkpoint_values
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# How turns run: "langgraph" (StateGraph) or "direct" (the same nodes and routers
+# dispatched in a plain loop, skipping the framework's per-step overhead)
+WORKFLOW_EXECUTOR = os.getenv("WORKFLOW_EXECUTOR", "langgraph")
+
 # Define a TypedDict for our state schema
 class WorkflowState(TypedDict):
     transcript: str
@@ -22,6 +32,27 @@ class WorkflowState(TypedDict):
     original_intent: str
     appointment_context: Dict[str, Any]
 
+# Classified intents that take an in-flow turn to the call center; the flow resumes on the next turn
+INTERRUPT_INTENTS = ("emergency", "general_inquiry")
+
+# States whose question is answered in free text. An answer there may mention an
+# off-topic word without leaving the flow, and a reason for the visit may name a
+# past condition ("I had a stroke last year"). Clear emergencies (can't breathe,
+# 911, ...) and cancel/reschedule interrupt every state
+FREE_TEXT_STATES = frozenset({
+    "collecting_name", "collecting_phone", "collecting_birthdate", "collecting_email", "collecting_reason",
+    "collecting_repeat_name", "collecting_repeat_phone", "collecting_repeat_birthdate",
+    "cancelling_collecting_id", "rescheduling_collecting_id"
+})
+
+def answers_the_flow(interrupt, appointment_state):
+    """Check whether an interrupt's keywords are more likely part of the answer the flow is waiting for"""
+    if appointment_state not in FREE_TEXT_STATES:
+        return False
+    if interrupt == "out_of_scope":
+        return True
+    return interrupt == "possible_emergency" and appointment_state == "collecting_reason"
+
 # Wrap the receptionist agent to preserve intent
 def receptionist_agent_wrapper(state):
     """
@@ -36,13 +67,25 @@ def receptionist_agent_wrapper(state):
         # If we're in a conversation, preserve the original intent
         logger.info(f"Workflow: Continuing conversation with preserved intent: {state.get('original_intent')}")
         
-        # First let the receptionist do its job
-        updated_state = receptionist_agent(state)
+        # Only classify a turn that may be leaving the flow; anything else keeps the flow's intent
+        transcript = state.get("transcript", "")
+        interrupt = detect_interrupt(transcript)
+        if answers_the_flow(interrupt, current_appt_state):
+            interrupt = None
+        if interrupt:
+            logger.info(f"Workflow: Possible {interrupt} interrupt - classifying intent")
+            INTENT_CLASSIFICATIONS.inc(mode="interrupt")
+            updated_state = receptionist_agent(state)
+        else:
+            # Keywords alone would have classified some of these; the rest each save an LLM call
+            INTENT_CLASSIFICATIONS.inc(mode="skipped_keywords" if detect_appointment_intent(transcript) else "skipped")
+            updated_state = state
+            updated_state["intent"] = state.get("original_intent")
         
         # Check for explicit cancellation/rescheduling keywords in the transcript
-        transcript = state.get("transcript", "").lower()
-        has_cancel = "cancel" in transcript
-        has_reschedule = "reschedule" in transcript or "change appointment" in transcript
+        tags = keyword_tags(transcript)
+        has_cancel = "cancel" in tags
+        has_reschedule = "reschedule" in tags
         
         # Determine if we should keep the original intent or allow a new one
         if has_cancel and updated_state.get("intent") != "cancel_appointment":
@@ -53,6 +96,9 @@ def receptionist_agent_wrapper(state):
             # Override with reschedule intent
             updated_state["intent"] = "reschedule_appointment"
             logger.info(f"Workflow: Intent overridden to reschedule based on user input")
+        # An emergency or an unrelated question is answered before carrying on with the flow
+        elif interrupt and updated_state.get("intent") in INTERRUPT_INTENTS:
+            logger.info(f"Workflow: Flow interrupted by '{updated_state.get('intent')}'")
         # If we're already in a cancellation or rescheduling flow, maintain that intent
         elif "cancell" in current_appt_state:
             updated_state["intent"] = "cancel_appointment"
@@ -65,12 +111,13 @@ def receptionist_agent_wrapper(state):
         return updated_state
     else:
         # Not in a conversation yet, let receptionist process normally
+        INTENT_CLASSIFICATIONS.inc(mode="full")
         updated_state = receptionist_agent(state)
         
         # Check for keywords in the transcript
-        transcript = state.get("transcript", "").lower()
-        has_cancel = "cancel" in transcript
-        has_reschedule = "reschedule" in transcript or "change appointment" in transcript
+        tags = keyword_tags(state.get("transcript", ""))
+        has_cancel = "cancel" in tags
+        has_reschedule = "reschedule" in tags
         
         # If keywords are present but intent doesn't match, override it
         if has_cancel and updated_state.get("intent") != "cancel_appointment":
@@ -86,15 +133,18 @@ def receptionist_agent_wrapper(state):
         
         return updated_state
 
-# Define the state flow for our agents with state_schema
-workflow_builder = StateGraph(state_schema=WorkflowState)
+def timed_node(name, fn):
+    """Time a node for /metrics and tag the LLM calls it makes for the cost ledger"""
+    return instrument_node(name, track_node(name, fn))
 
-# Add nodes for each agent - use our wrapper for receptionist
-workflow_builder.add_node("receptionist", receptionist_agent_wrapper)
-workflow_builder.add_node("appointment", appointment_agent)
-workflow_builder.add_node("call_center", call_center_agent)
-workflow_builder.add_node("content_management", content_management_agent)
-workflow_builder.add_node("notification", notification_agent)
+# The agent behind each node - use our wrapper for receptionist
+AGENTS = {
+    "receptionist": receptionist_agent_wrapper,
+    "appointment": appointment_agent,
+    "call_center": call_center_agent,
+    "content_management": content_management_agent,
+    "notification": notification_agent,
+}
 
 # Define the edges between agents
 # The receptionist is the entry point and routes based on intent
@@ -134,16 +184,6 @@ def route_by_intent(state):
         logger.info(f"Routing to Call Center Agent")
         return "call_center"
 
-# Set up the routing from receptionist
-workflow_builder.add_conditional_edges(
-    "receptionist",
-    route_by_intent,
-    {
-        "appointment": "appointment",
-        "call_center": "call_center",
-    }
-)
-
 # After appointment handling, conditionally route to notification agent
 def should_send_notification(state):
     """Determine if we should route to notification agent"""
@@ -201,44 +241,80 @@ def should_send_notification(state):
         logger.info(f"No notification needed - proceeding to content management")
         return "content_management"
 
-# Replace direct edge with conditional routing
-# workflow_builder.add_edge("appointment", "notification")
-workflow_builder.add_conditional_edges(
-    "appointment",
-    should_send_notification,
-    {
-        "notification": "notification",
-        "content_management": "content_management",
-    }
-)
-
-# Add a conditional edge from notification to content management
+# After notification, always go on to content management
 def after_notification(state):
     logger.info(f"Notification completed - routing to content management for final validation")
     return "content_management"
 
-workflow_builder.add_conditional_edges(
-    "notification",
-    after_notification,
-    {
-        "content_management": "content_management",
-    }
-)
+# Where each node goes next: a router and the nodes it may pick, or a fixed next node.
+# Content management has no route; its answer ends the turn.
+ROUTES = {
+    # The receptionist is the entry point and routes based on intent
+    "receptionist": (route_by_intent, ["appointment", "call_center"]),
+    # After appointment handling, conditionally route to notification agent
+    "appointment": (should_send_notification, ["notification", "content_management"]),
+    "notification": (after_notification, ["content_management"]),
+    # All other responses should go through content management for validation
+    "call_center": "content_management",
+}
 
-# All other responses should go through content management for validation
-workflow_builder.add_edge("call_center", "content_management")
+def build_workflow(agents=None, executor=None):
+    """
+    Compile the agent workflow
+
+    Args:
+        agents: {node: agent} to use in place of the defaults in AGENTS
+        executor: "langgraph" for the StateGraph, or "direct" to run the same nodes
+            and routers in a plain loop (defaults to WORKFLOW_EXECUTOR)
+
+    Returns:
+        An object whose invoke(state) runs one turn and returns the final state
+    """
+    executor = executor or WORKFLOW_EXECUTOR
+    nodes = {name: timed_node(name, agent) for name, agent in {**AGENTS, **(agents or {})}.items()}
 
-# Set the entry point to receptionist
-workflow_builder.set_entry_point("receptionist")
+    if executor == "direct":
+        routes = {name: route if isinstance(route, str) else route[0] for name, route in ROUTES.items()}
+        return DirectDispatchGraph(nodes, routes, "receptionist", WorkflowState.__annotations__)
+    if executor != "langgraph":
+        raise ValueError(f"Unknown workflow executor {executor!r}; use 'langgraph' or 'direct'")
+
+    # Define the state flow for our agents with state_schema
+    builder = StateGraph(state_schema=WorkflowState)
+    for name, node in nodes.items():
+        builder.add_node(name, node)
+    for name, route in ROUTES.items():
+        if isinstance(route, str):
+            builder.add_edge(name, route)
+        else:
+            router, targets = route
+            builder.add_conditional_edges(name, router, {target: target for target in targets})
+    builder.set_entry_point("receptionist")
+    return builder.compile()
 
 # Compile the graph
-workflow = workflow_builder.compile()
+workflow = build_workflow()
 
 # Wrapper function for the workflow to initialize state properly
-def process_workflow(input_state):
+def process_workflow(input_state, graph=None, checkpointer=None):
     """
     Process the workflow with proper state initialization
+    
+    Args:
+        input_state: The turn's initial state
+        graph: Compiled workflow to run instead of the configured one
+        checkpointer: Where the conversation's state is kept between turns. When given,
+            the turn resumes from input_state["conversation_id"]'s checkpoint and the
+            conversation state it ends with is saved back.
     """
+    resumed = None
+    if checkpointer is not None:
+        resumed = checkpointer.load(input_state["conversation_id"])
+        if resumed is not None:
+            # resumed.values is decoded for this turn alone, so the agents may update it
+            # in place; the save diffs against resumed.data, the state as it was saved
+            input_state.update(resumed.values)
+    
     # Initialize conversation tracking if not present
     if "conversation_in_progress" not in input_state:
         input_state["conversation_in_progress"] = False
@@ -263,7 +339,17 @@ def process_workflow(input_state):
     
     # Run the workflow
     logger.info(f"LangGraph workflow execution started")
-    final_state = workflow.invoke(input_state)
+    final_state = None
+    with cost_scope(input_state.get("conversation_id"), input_state["appointment_context"]) as costs:
+        try:
+            with TURN_LATENCY.time(intent="error", appointment_state="none") as labels:
+                final_state = (graph or workflow).invoke(input_state)
+                labels["intent"] = intent_label(final_state.get("intent"))
+                labels["appointment_state"] = appointment_state_label(final_state)
+        finally:
+            # Attribute this turn's LLM calls to its intent and record any completed operation;
+            # a turn that failed still records the calls it made
+            finish_costs(costs, final_state or {})
     logger.info(f"LangGraph workflow execution completed")
     
     # Check for cancellation intent and details in the final state
@@ -321,4 +407,11 @@ def process_workflow(input_state):
                 final_state["appointment_context"] = final_state[key]
                 break
     
+    if checkpointer is not None:
+        try:
+            checkpointer.save(input_state["conversation_id"], checkpoint_values(final_state), resumed)
+        except Exception as e:
+            # The turn has happened; answer it even if the next turn starts from the older checkpoint
+            logger.error("Could not checkpoint conversation %s: %s", input_state["conversation_id"], e)
+    
     return final_state 
\ No newline at end of file
@@ -1,22 +1,71 @@
 import os
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
-from langfuse import Langfuse
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from app.outbox import OUTBOX_ENABLED, get_email_outbox
+from app.smtp_pool import get_smtp_pool
+from app.metrics import outbound
+import logging
+from app.logs import debug_logger, phi
 
-# Initialize Langfuse for logging
-langfuse = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-    host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
-)
+logger = logging.getLogger(__name__)
+debug_log = debug_logger(__name__)
+
+# SendGrid client, created on first use and reused for every fallback send
+_sendgrid_client = None
+
+def get_sendgrid_client():
+    """Get the shared SendGrid client, or None when SendGrid isn't configured"""
+    global _sendgrid_client
+    if _sendgrid_client is None and os.getenv("SENDGRID_API_KEY"):
+        _sendgrid_client = SendGridAPIClient(os.getenv("SENDGRID_API_KEY"))
+    return _sendgrid_client
+
+def build_email_message(to_email, subject, html_content):
+    """
+    Build the MIME message for an HTML email
+    
+    Returns:
+        tuple: (from_email, to_email, message string) ready for sendmail
+    """
+    from_email = os.getenv("EMAIL_FROM", os.getenv("EMAIL_USER"))
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = from_email
+    message["To"] = to_email
+    
+    # Attach HTML content
+    message.attach(MIMEText(html_content, "html"))
+    return from_email, to_email, message.as_string()
+
+def send_with_sendgrid(to_email, subject, html_content):
+    """Send one email through SendGrid; returns True if it was accepted"""
+    try:
+        debug_log("Attempting to send email via SendGrid")
+        message = Mail(
+            from_email=os.getenv("FROM_EMAIL", "noreply@medagent.example.com"),
+            to_emails=to_email,
+            subject=subject,
+            html_content=html_content
+        )
+        
+        with outbound("sendgrid"):
+            response = get_sendgrid_client().send(message)
+        
+        logger.info("SendGrid response: %s", response.status_code)
+        return response.status_code == 202
+    except Exception as e:
+        logger.error("Error sending email via SendGrid: %s", e)
+        return False
 
 def send_email(to_email, subject, html_content):
     """
     Send an email using SMTP or SendGrid
     
+    SMTP sessions come from a shared pool, so the connect, STARTTLS and login
+    handshake is only paid when a pooled session has to be (re)opened.
+    
     Args:
         to_email: The recipient's email address
         subject: The email subject
@@ -25,66 +74,105 @@ def send_email(to_email, subject, html_content):
     Returns:
         bool: True if the email was sent successfully, False otherwise
     """
-    # Log the email (for demo purposes)
-    print(f"======= NOTIFICATION AGENT: SENDING EMAIL =======")
-    print(f"TO: {to_email}")
-    print(f"SUBJECT: {subject}")
-    print(f"CONTENT: \n{html_content}\n")
-    print(f"================================================")
+    debug_log("Sending email to %s, subject %r:\n%s", phi(to_email), subject, phi(html_content))
     
     # Try to send using SMTP first
-    if os.getenv("EMAIL_HOST") and os.getenv("EMAIL_USER") and os.getenv("EMAIL_PASSWORD"):
+    pool = get_smtp_pool()
+    if pool is not None:
         try:
-            print(f"Attempting to send email via SMTP...")
-            # Create message
-            message = MIMEMultipart("alternative")
-            message["Subject"] = subject
-            message["From"] = os.getenv("EMAIL_FROM", os.getenv("EMAIL_USER"))
-            message["To"] = to_email
-            
-            # Attach HTML content
-            html_part = MIMEText(html_content, "html")
-            message.attach(html_part)
-            
-            # Connect to SMTP server and send
-            with smtplib.SMTP(os.getenv("EMAIL_HOST"), int(os.getenv("EMAIL_PORT", 587))) as server:
-                server.starttls()  # Use TLS
-                server.login(os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASSWORD"))
-                server.sendmail(
-                    os.getenv("EMAIL_FROM", os.getenv("EMAIL_USER")),
-                    to_email,
-                    message.as_string()
-                )
-            print(f"Email sent successfully via SMTP to {to_email}")
+            debug_log("Attempting to send email via SMTP")
+            with outbound("smtp"):
+                pool.send(*build_email_message(to_email, subject, html_content))
+            logger.info("Email sent successfully via SMTP to %s", phi(to_email))
             return True
         except Exception as e:
-            print(f"Error sending email via SMTP: {e}")
+            logger.error("Error sending email via SMTP: %s", e)
             # Fall back to SendGrid if SMTP fails
     
     # If SMTP failed or is not configured, try SendGrid
-    if os.getenv("SENDGRID_API_KEY"):
-        try:
-            print(f"Attempting to send email via SendGrid...")
-            message = Mail(
-                from_email=os.getenv("FROM_EMAIL", "noreply@medagent.example.com"),
-                to_emails=to_email,
-                subject=subject,
-                html_content=html_content
-            )
-            
-            sg = SendGridAPIClient(os.getenv("SENDGRID_API_KEY"))
-            response = sg.send(message)
-            
-            print(f"SendGrid response: {response.status_code}")
-            return response.status_code == 202
-        except Exception as e:
-            print(f"Error sending email via SendGrid: {e}")
-            return False
+    if get_sendgrid_client() is not None:
+        return send_with_sendgrid(to_email, subject, html_content)
     else:
         # For demo purposes, just pretend it worked
-        print("No email configuration found, pretending email was sent successfully (DEMO MODE)")
+        logger.info("No email configuration found, pretending email was sent successfully (DEMO MODE)")
         return True
 
+def send_emails(emails):
+    """
+    Send a batch of emails over one pooled SMTP session
+    
+    Messages SMTP couldn't deliver fall back to SendGrid one at a time.
+    
+    Args:
+        emails: List of (to_email, subject, html_content) tuples
+    
+    Returns:
+        list: True/False per email, in order
+    """
+    emails = list(emails)
+    results = [False] * len(emails)
+    
+    pool = get_smtp_pool()
+    if pool is not None and emails:
+        try:
+            with outbound("smtp_batch"):
+                results = pool.send_many([build_email_message(*email) for email in emails])
+            logger.info("Sent %d/%d emails via SMTP", sum(results), len(emails))
+        except Exception as e:
+            logger.error("Error sending batch via SMTP: %s", e)
+    
+    if get_sendgrid_client() is not None:
+        for index, email in enumerate(emails):
+            if not results[index]:
+                results[index] = send_with_sendgrid(*email)
+    elif pool is None:
+        # For demo purposes, just pretend it worked
+        logger.info("No email configuration found, pretending %d emails were sent successfully (DEMO MODE)", len(emails))
+        results = [True] * len(emails)
+    
+    return results
+
+def notification_dedupe_key(kind, *parts):
+    """
+    Build the outbox dedupe key for a notification
+    
+    Args:
+        kind: The notification kind ("booking", "cancellation", "reschedule")
+        *parts: Values identifying the operation, e.g. the appointment ID
+    
+    Returns:
+        str or None: None when any part is missing, so unrelated messages never share a key
+    """
+    if not all(parts):
+        return None
+    return ":".join([kind, *map(str, parts)])
+
+def queue_email(to_email, subject, html_content, kind=None, dedupe_key=None):
+    """
+    Hand an email to the background outbox so the turn doesn't wait on delivery
+    
+    Falls back to sending inline when the outbox is disabled or can't be reached.
+    
+    Args:
+        to_email: The recipient's email address
+        subject: The email subject
+        html_content: The HTML content of the email
+        kind: Label for the message ("booking", "cancellation", "reschedule")
+        dedupe_key: Identifies the notification, so it is only ever queued once
+    
+    Returns:
+        bool: True if the email was queued (or sent), False otherwise
+    """
+    if OUTBOX_ENABLED:
+        try:
+            get_email_outbox().enqueue(to_email, subject, html_content, kind=kind, dedupe_key=dedupe_key)
+            logger.info("Queued %s notification for %s", kind or "email", phi(to_email))
+            return True
+        except Exception as e:
+            logger.warning("Error queueing email, sending inline instead: %s", e)
+    
+    return send_email(to_email, subject, html_content)
+
 def create_appointment_confirmation_email(appointment_details):
     """
     Create the HTML content for an appointment confirmation email
@@ -280,6 +368,52 @@ def create_reschedule_confirmation_email(reschedule_details):
     
     return html_content
 
+def create_appointment_reminder_email(reminder_details):
+    """
+    Create the HTML content for an appointment reminder email
+    
+    Args:
+        reminder_details: A dictionary with the upcoming appointment's information
+    
+    Returns:
+        str: The HTML content of the email
+    """
+    patient_name = reminder_details.get("patient_name", "Patient")
+    formatted_date = reminder_details.get("formatted_date", "")
+    time = reminder_details.get("time", "")
+    doctor_name = reminder_details.get("doctor_name", "Doctor")
+    appointment_id = reminder_details.get("appointment_id", "MA-00000")
+    
+    html_content = f"""
+    <html>
+        <body>
+            <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #eee; border-radius: 5px;">
+                <div style="background-color: #4b6cb7; color: white; padding: 10px; text-align: center; border-radius: 5px 5px 0 0;">
+                    <h2>Appointment Reminder</h2>
+                </div>
+                <div style="padding: 20px;">
+                    <p>Dear {patient_name},</p>
+                    <p>This is a reminder of your upcoming appointment:</p>
+                    <div style="background-color: #f8f9fa; padding: 15px; border-left: 4px solid #4b6cb7; margin: 15px 0;">
+                        <p><strong>Appointment ID:</strong> {appointment_id}</p>
+                        <p><strong>Date:</strong> {formatted_date}</p>
+                        <p><strong>Time:</strong> {time}</p>
+                        <p><strong>Provider:</strong> {doctor_name}</p>
+                    </div>
+                    <p>Please arrive 15 minutes before your appointment time.</p>
+                    <p>If you need to reschedule or cancel, please call our office at (555) 123-4567 and provide your appointment ID.</p>
+                    <p>Best regards,<br>The Medical Office Team</p>
+                </div>
+                <div style="background-color: #f8f9fa; padding: 10px; text-align: center; font-size: 12px; color: #666; border-radius: 0 0 5px 5px;">
+                    <p>123 Medical Drive, Suite 100 | City, State 12345 | (555) 123-4567</p>
+                </div>
+            </div>
+        </body>
+    </html>
+    """
+    
+    return html_content
+
 def notification_agent(state):
     """
     The main Notification Agent function for LangGraph
@@ -293,13 +427,12 @@ def notification_agent(state):
     try:
         # Get the intent and log it for debugging
         intent = state.get("intent", "")
-        print(f"======= NOTIFICATION AGENT START =======")
-        print(f"Notification agent received intent: {intent}")
-        print(f"State keys: {list(state.keys())}")
+        logger.info("Notification agent received intent: %s", intent)
+        debug_log("State keys: %s", list(state))
         
         # Check for existing notification before processing
         if state.get("notification_sent", False):
-            print(f"Notification already sent for this operation, skipping")
+            logger.info("Notification already sent for this operation, skipping")
             return state
         
         # Check if we're in a completed state that should generate notification
@@ -309,7 +442,7 @@ def notification_agent(state):
             current_state = context.get("state", "")
             if current_state in ["booking_confirmed", "cancellation_confirmed", "reschedule_confirmed"]:
                 in_completed_state = True
-                print(f"Found completed state: {current_state}")
+                debug_log("Found completed state: %s", current_state)
                 
                 # Update intent based on the completed state if needed
                 if current_state == "booking_confirmed" and intent != "schedule_appointment":
@@ -322,7 +455,7 @@ def notification_agent(state):
                     intent = "reschedule_appointment"
                     state["intent"] = intent
                     
-                print(f"Updated intent to match operation: {intent}")
+                debug_log("Updated intent to match operation: %s", intent)
             
         # Check if we have cancellation details either directly or in the appointment context
         cancellation_details = None
@@ -332,13 +465,13 @@ def notification_agent(state):
         if "cancellation_details" in state:
             cancellation_details = state["cancellation_details"]
             has_cancellation_details = True
-            print(f"Found cancellation details directly in state")
+            debug_log("Found cancellation details directly in state")
         
         # If not in direct state, check appointment_context
         elif "appointment_context" in state and "cancellation_details" in state["appointment_context"]:
             cancellation_details = state["appointment_context"]["cancellation_details"]
             has_cancellation_details = True
-            print(f"Found cancellation details in appointment_context")
+            debug_log("Found cancellation details in appointment_context")
             
             # Also add to root state for consistency
             state["cancellation_details"] = cancellation_details
@@ -351,13 +484,13 @@ def notification_agent(state):
         if "reschedule_details" in state:
             reschedule_details = state["reschedule_details"]
             has_reschedule_details = True
-            print(f"Found rescheduling details directly in state")
+            debug_log("Found rescheduling details directly in state")
         
         # If not in direct state, check appointment_context
         elif "appointment_context" in state and "reschedule_details" in state["appointment_context"]:
             reschedule_details = state["appointment_context"]["reschedule_details"]
             has_reschedule_details = True
-            print(f"Found rescheduling details in appointment_context")
+            debug_log("Found rescheduling details in appointment_context")
             
             # Also add to root state for consistency
             state["reschedule_details"] = reschedule_details
@@ -371,15 +504,17 @@ def notification_agent(state):
             patient_email = appointment_details.get("patient_email")
             
             if patient_email:
-                print(f"Sending appointment confirmation email to {patient_email}")
+                logger.info("Sending appointment confirmation email to %s", phi(patient_email))
                 # Create email content
                 email_content = create_appointment_confirmation_email(appointment_details)
                 
-                # Send email
-                send_email(
+                # Queue the email; delivery happens in the background
+                queue_email(
                     to_email=patient_email,
                     subject="Your Appointment Confirmation",
-                    html_content=email_content
+                    html_content=email_content,
+                    kind="booking",
+                    dedupe_key=notification_dedupe_key("booking", appointment_details.get("appointment_id"))
                 )
                 
                 notification_sent = True
@@ -388,22 +523,24 @@ def notification_agent(state):
                 if "appointment_context" in state:
                     state["appointment_context"]["booking_notification_sent"] = True
             else:
-                print(f"No email address found for appointment confirmation")
+                logger.info("No email address found for appointment confirmation")
                 
         # Handle cancellation email
         elif intent == "cancel_appointment" and has_cancellation_details:
             patient_email = cancellation_details.get("patient_email")
             
             if patient_email:
-                print(f"Sending cancellation confirmation email to {patient_email}")
+                logger.info("Sending cancellation confirmation email to %s", phi(patient_email))
                 # Create email content
                 email_content = create_cancellation_confirmation_email(cancellation_details)
                 
-                # Send email
-                send_email(
+                # Queue the email; delivery happens in the background
+                queue_email(
                     to_email=patient_email,
                     subject="Your Appointment Cancellation Confirmation",
-                    html_content=email_content
+                    html_content=email_content,
+                    kind="cancellation",
+                    dedupe_key=notification_dedupe_key("cancellation", cancellation_details.get("appointment_id"))
                 )
                 
                 notification_sent = True
@@ -412,22 +549,25 @@ def notification_agent(state):
                 if "appointment_context" in state:
                     state["appointment_context"]["cancellation_notification_sent"] = True
             else:
-                print(f"No email address found for cancellation confirmation")
+                logger.info("No email address found for cancellation confirmation")
                 
         # Handle rescheduling email
         elif intent == "reschedule_appointment" and has_reschedule_details:
             patient_email = reschedule_details.get("patient_email")
             
             if patient_email:
-                print(f"Sending rescheduling confirmation email to {patient_email}")
+                logger.info("Sending rescheduling confirmation email to %s", phi(patient_email))
                 # Create email content
                 email_content = create_reschedule_confirmation_email(reschedule_details)
                 
-                # Send email
-                send_email(
+                # Queue the email; delivery happens in the background
+                queue_email(
                     to_email=patient_email,
                     subject="Your Appointment Reschedule Confirmation",
-                    html_content=email_content
+                    html_content=email_content,
+                    kind="reschedule",
+                    dedupe_key=notification_dedupe_key("reschedule", reschedule_details.get("appointment_id"),
+                                                       reschedule_details.get("reschedule_id"))
                 )
                 
                 notification_sent = True
@@ -436,17 +576,16 @@ def notification_agent(state):
                 if "appointment_context" in state:
                     state["appointment_context"]["reschedule_notification_sent"] = True
             else:
-                print(f"No email address found for rescheduling confirmation")
+                logger.info("No email address found for rescheduling confirmation")
         else:
             # No notification needed or not enough info
-            print(f"No notification sent - no matching intent or details")
+            logger.info("No notification sent - no matching intent or details")
         
         # Update the state to reflect if notification was sent
         state["notification_sent"] = notification_sent
         
-        print(f"======= NOTIFICATION AGENT END =======")
     except Exception as e:
-        print(f"Error in notification agent: {e}")
+        logger.error("Error in notification agent: %s", e)
         state["notification_sent"] = False
     
     return state 
\ No newline at end of file
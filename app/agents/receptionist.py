@@ -1,25 +1,15 @@
 import os
 import io
 import tempfile
-import re
 import logging
-from openai import OpenAI
-from langfuse import Langfuse
+from app.llm import client, chat_completion
+from app.keywords import keyword_tags
+from app.metrics import LLM_LATENCY
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize Langfuse for logging
-langfuse = Langfuse(
-    public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-    secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-    host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
-)
-
 def transcribe_audio(audio_file):
     """
     Transcribe audio file using OpenAI's Whisper API
@@ -40,11 +30,13 @@ def transcribe_audio(audio_file):
             temp_audio_path = temp_audio.name
         
         # Transcribe with Whisper using the temporary file
-        with open(temp_audio_path, 'rb') as audio:
+        with open(temp_audio_path, 'rb') as audio, \
+                LLM_LATENCY.time(name="transcription", model="whisper-1", outcome="error") as labels:
             transcript = client.audio.transcriptions.create(
                 model="whisper-1",
                 file=audio
             )
+            labels["outcome"] = "success"
         
         # Remove the temporary file
         os.unlink(temp_audio_path)
@@ -52,7 +44,7 @@ def transcribe_audio(audio_file):
         return transcript.text
     
     except Exception as e:
-        print(f"Error transcribing audio: {e}")
+        logger.error(f"Error transcribing audio: {e}")
         return "Sorry, I couldn't understand the audio."
 
 def detect_appointment_intent(transcript):
@@ -65,34 +57,9 @@ def detect_appointment_intent(transcript):
     Returns:
         bool: True if appointment-related intent is detected, False otherwise
     """
-    # Convert to lowercase and strip punctuation for simple pattern matching
-    text = transcript.lower()
-    
-    # Keywords related to appointment scheduling
-    schedule_keywords = [
-        'appoint', 'book', 'schedule', 'see a doctor', 'see the doctor', 
-        'come in', 'visit', 'consultation', 'check-up', 'checkup'
-    ]
-    
-    # Check for keywords in the text
-    for keyword in schedule_keywords:
-        if keyword in text:
-            return True
-    
-    # Check for time- or date-related patterns
-    date_time_patterns = [
-        r'\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
-        r'\b(tomorrow|today|next week)\b',
-        r'\b\d{1,2}:\d{2}\b',  # time format like 9:30
-        r'\b\d{1,2} (am|pm)\b',  # time format like 10 am
-        r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\b'
-    ]
-    
-    for pattern in date_time_patterns:
-        if re.search(pattern, text):
-            return True
-    
-    return False
+    # Keywords and date/time mentions are both tagged in a single pass
+    tags = keyword_tags(transcript)
+    return "appointment_request" in tags or "date_time" in tags
 
 def detect_reschedule_intent(transcript):
     """
@@ -104,32 +71,45 @@ def detect_reschedule_intent(transcript):
     Returns:
         bool: True if rescheduling intent is detected, False otherwise
     """
-    # Convert to lowercase for easier matching
-    text = transcript.lower()
-    
-    # Keywords specifically related to rescheduling
-    reschedule_keywords = [
-        'reschedule', 'change appointment', 'move appointment', 
-        'change my appointment', 'move my appointment', 'change the time',
-        'different time', 'different date', 'new time', 'new date', 
-        'another time', 'another date', 'postpone'
-    ]
+    tags = keyword_tags(transcript)
     
     # Check for reschedule-specific keywords
-    for keyword in reschedule_keywords:
-        if keyword in text:
-            return True
-            
+    if "reschedule_request" in tags:
+        return True
+    
     # Check for intent that combines scheduling words with change words
-    schedule_words = ['appointment', 'visit', 'meeting', 'consultation']
-    change_words = ['change', 'move', 'switch', 'reschedule']
+    return "appointment_noun" in tags and "change_verb" in tags
+
+# What can take a turn out of an appointment flow, and the keyword tags that suggest it
+INTERRUPT_TAGS = {
+    "cancel": ("cancel", "cancel_request"),
+    "reschedule": ("reschedule", "reschedule_request"),
+    "emergency": ("emergency",),
+    "possible_emergency": ("possible_emergency",),
+    "out_of_scope": ("out_of_scope",),
+}
+
+def detect_interrupt(transcript):
+    """
+    Check whether a turn in the middle of an appointment flow may be leaving it
+    
+    A keyword check in place of intent classification: a turn that answers the
+    flow's question (a name, a phone number, a date) needs no classifying. Fires
+    on every transcript process_query classifies as a reschedule by keywords.
     
-    for s_word in schedule_words:
-        for c_word in change_words:
-            if s_word in text and c_word in text:
-                return True
-                
-    return False
+    Args:
+        transcript: The transcribed text from the user
+    
+    Returns:
+        str: The kind of interrupt (a key of INTERRUPT_TAGS), or None
+    """
+    tags = keyword_tags(transcript)
+    for kind, kind_tags in INTERRUPT_TAGS.items():
+        if any(tag in tags for tag in kind_tags):
+            return kind
+    if detect_reschedule_intent(transcript):
+        return "reschedule"
+    return None
 
 def process_query(transcript):
     """
@@ -181,17 +161,10 @@ def process_query(transcript):
             {"role": "user", "content": transcript}
         ]
         
-        # Create a Langfuse generation for proper cost tracking
-        generation = langfuse.start_generation(
-            name="intent_classification_gpt4",
+        response = chat_completion(
+            "intent_classification_gpt4",
+            messages,
             model="gpt-4o",
-            input=messages,
-            metadata={"temperature": 0.1, "max_tokens": 50}
-        )
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
             temperature=0.1,
             max_tokens=50
         )
@@ -199,34 +172,22 @@ def process_query(transcript):
         intent = response.choices[0].message.content.strip().lower()
         logger.info(f"Intent classified as '{intent}' via GPT-4o (tokens: {response.usage.total_tokens})")
         
-        # Update generation with output and usage data for cost tracking
-        generation.update(
-            output=intent,
-            usage_details={
-                "input": response.usage.prompt_tokens,
-                "output": response.usage.completion_tokens,
-                "total": response.usage.total_tokens
-            }
-        )
-        
-        # End the generation
-        generation.end()
-        
         return intent
     
     except Exception as e:
         logger.warning(f"GPT intent classification failed: {str(e)}, falling back to keyword detection")
         
         # Check for rescheduling keywords as a fallback
-        if "reschedule" in transcript.lower() or "change appointment" in transcript.lower() or "move appointment" in transcript.lower():
+        tags = keyword_tags(transcript)
+        if "reschedule_fallback" in tags:
             logger.info("Intent classified as reschedule_appointment via fallback")
             return "reschedule_appointment"
         # Check for cancellation keywords
-        elif "cancel" in transcript.lower() or "cancelation" in transcript.lower():
+        elif "cancel" in tags:
             logger.info("Intent classified as cancel_appointment via fallback")
             return "cancel_appointment"
         # Return schedule_appointment as a fallback if the query has appointment-like keywords
-        elif "appointment" in transcript.lower() or "book" in transcript.lower() or "schedule" in transcript.lower():
+        elif "schedule_fallback" in tags:
             logger.info("Intent classified as schedule_appointment via fallback")
             return "schedule_appointment"
         
@@ -1,24 +1,29 @@
 import os
 import json
 import pickle
-import time
 import uuid
 import logging
-from flask import Flask, request, jsonify, render_template, redirect, url_for, Response
+from flask import Flask, request, jsonify, render_template, redirect, url_for, Response, g, send_file, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from app.agents.receptionist import transcribe_audio, process_query
 from app.agents.langgraph_workflow import process_workflow
+from app.checkpoints import get_checkpointer
+from app.batch import parse_batch, run_batch
+from app.outbox import OUTBOX_ENABLED, get_email_outbox
+from app.reminders import REMINDERS_ENABLED, start_reminder_scheduler
+from app.metrics import outbound, render as render_metrics
+from app.costs import get_cost_ledger
+from app.logs import configure_logging, bind_request, unbind_request, current_request, request_context, phi
+from app.profiling import PROFILING_SECRET, PROFILE_HEADER, ADMIN_HEADER, PROFILE_KINDS, get_request_profiler, is_admin
+from datetime import datetime, timedelta
 import requests
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging: LOG_LEVEL, LOG_FORMAT (text/json), LOG_TRACE_SAMPLE_RATE, LOG_PHI
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -30,8 +35,63 @@ CORS(app,
      resources={r"/*": {"origins": "*"}},
      methods=["GET", "POST", "OPTIONS"])
 
-# In-memory conversation store that doesn't depend on sessions
-CONVERSATION_STORE = {}
+# ElevenLabs endpoint (overridable to point at a local stand-in for load tests)
+ELEVEN_LABS_API_URL = os.getenv("ELEVEN_LABS_API_URL", "https://api.elevenlabs.io").rstrip("/")
+
+@app.before_request
+def start_request_logging():
+    """Tag this request's log records with a correlation ID (from X-Request-ID if the caller sent one)"""
+    conversation_id = (request.view_args or {}).get("conversation_id")
+    g.log_token = bind_request(request.headers.get("X-Request-ID"), conversation_id)
+
+@app.after_request
+def add_request_id(response):
+    context = current_request()
+    if context:
+        response.headers["X-Request-ID"] = context.request_id
+    return response
+
+@app.teardown_request
+def end_request_logging(exc):
+    token = g.pop("log_token", None)
+    if token is not None:
+        unbind_request(token)
+
+# On-demand profiling (signed X-Profile header or an admin toggle); without a
+# PROFILING_SECRET the hooks are not even registered
+if PROFILING_SECRET:
+    @app.before_request
+    def start_profiling():
+        profiler = get_request_profiler()
+        trigger = profiler.trigger_for(request.path, request.headers.get(PROFILE_HEADER))
+        if trigger:
+            g.profile = profiler.start(trigger)
+
+    @app.after_request
+    def add_profile_id(response):
+        profile = g.get("profile")
+        if profile is not None:
+            g.profile_status = response.status_code
+            response.headers["X-Profile-Id"] = profile.id
+        return response
+
+    @app.teardown_request
+    def finish_profiling(exc):
+        profile = g.pop("profile", None)
+        if profile is not None:
+            context = current_request()
+            get_request_profiler().finish(
+                profile,
+                method=request.method,
+                path=request.path,
+                status=g.get("profile_status", 500),
+                request_id=context.request_id if context else None,
+                conversation_id=(request.view_args or {}).get("conversation_id")
+            )
+
+# Daily appointment reminders (runs can also be triggered from cron: python -m app.reminders)
+if REMINDERS_ENABLED:
+    start_reminder_scheduler()
 
 @app.route('/')
 def index_redirect():
@@ -40,29 +100,12 @@ def index_redirect():
     conversation_id = str(uuid.uuid4())
     logger.info(f"New session started - Conversation ID: {conversation_id[:8]}")
     
-    # Initialize the conversation store
-    CONVERSATION_STORE[conversation_id] = {
-        "conversation_in_progress": False,
-        "original_intent": "",
-        "appointment_context": {},
-        "last_updated": time.time()
-    }
-    
     # Redirect to the conversation page
     return redirect(url_for('index', conversation_id=conversation_id))
 
 @app.route('/conversation/<conversation_id>')
 def index(conversation_id):
     """Render the main application page with a specific conversation ID"""
-    # Initialize conversation if it doesn't exist
-    if conversation_id not in CONVERSATION_STORE:
-        CONVERSATION_STORE[conversation_id] = {
-            "conversation_in_progress": False,
-            "original_intent": "",
-            "appointment_context": {},
-            "last_updated": time.time()
-        }
-    
     logger.info(f"User interface loaded for session: {conversation_id[:8]}")
     return render_template('index.html', conversation_id=conversation_id)
 
@@ -81,24 +124,11 @@ def handle_transcription(conversation_id):
         logger.warning("Audio transcription failed: No audio file provided")
         return jsonify({"error": "No audio file provided"}), 400
     
-    # Ensure the conversation exists
-    if conversation_id not in CONVERSATION_STORE:
-        CONVERSATION_STORE[conversation_id] = {
-            "conversation_in_progress": False,
-            "original_intent": "",
-            "appointment_context": {},
-            "last_updated": time.time()
-        }
-    
-    # Get the current conversation state
-    conversation = CONVERSATION_STORE[conversation_id]
-    appointment_context = conversation.get("appointment_context", {})
-    
     audio_file = request.files['audio']
     
     # Transcribe audio using Whisper
     transcript = transcribe_audio(audio_file)
-    logger.info(f"Audio transcribed successfully: \"{transcript[:50]}...\"" if len(transcript) > 50 else f"Audio transcribed: \"{transcript}\"")
+    logger.info("Audio transcribed (%d chars): %s", len(transcript), phi(transcript))
     
     # Process the query with LangGraph workflow
     try:
@@ -109,32 +139,10 @@ def handle_transcription(conversation_id):
             "conversation_id": conversation_id
         }
         
-        # Add conversation state if conversation is in progress
-        conversation_in_progress = conversation.get("conversation_in_progress", False)
-        original_intent = conversation.get("original_intent", "")
-        
-        if conversation_in_progress:
-            initial_state["conversation_in_progress"] = True
-            initial_state["original_intent"] = original_intent
-            logger.info(f"Continuing conversation with original intent: {original_intent}")
-        
-        # Always add appointment context if it exists
-        if appointment_context:
-            initial_state["appointment_context"] = appointment_context
-        
         logger.info(f"Starting LangGraph workflow processing...")
         
-        # Run the workflow with our wrapper function
-        final_state = process_workflow(initial_state)
-        
-        # Update conversation store with the results
-        CONVERSATION_STORE[conversation_id]["conversation_in_progress"] = final_state.get("conversation_in_progress", False)
-        CONVERSATION_STORE[conversation_id]["original_intent"] = final_state.get("original_intent", "")
-        CONVERSATION_STORE[conversation_id]["last_updated"] = time.time()
-        
-        # Make sure to capture any appointment_context updates from the workflow
-        if "appointment_context" in final_state:
-            CONVERSATION_STORE[conversation_id]["appointment_context"] = final_state["appointment_context"]
+        # Run the workflow, resuming the conversation from its checkpoint
+        final_state = process_workflow(initial_state, checkpointer=get_checkpointer())
         
         logger.info(f"Workflow completed - Intent: {final_state.get('intent', 'unknown')}")
         
@@ -156,32 +164,14 @@ def handle_transcription(conversation_id):
             "conversation_id": conversation_id
         })
 
-@app.route('/api/text/<conversation_id>', methods=['POST'])
-def handle_text(conversation_id):
-    """Handle text input directly without audio transcription"""
-    logger.info(f"Text message received [ID: {conversation_id[:8]}]")
-    
-    # Get the text from the request
-    data = request.json
-    if not data or 'text' not in data:
-        logger.warning("Text processing failed: No text provided")
-        return jsonify({"error": "No text provided"}), 400
-    
-    text = data['text']
-    logger.info(f"Processing text input: \"{text[:50]}...\"" if len(text) > 50 else f"Processing text: \"{text}\"")
-    
-    # Ensure the conversation exists
-    if conversation_id not in CONVERSATION_STORE:
-        CONVERSATION_STORE[conversation_id] = {
-            "conversation_in_progress": False,
-            "original_intent": "",
-            "appointment_context": {},
-            "last_updated": time.time()
-        }
-    
-    # Get the current conversation state
-    conversation = CONVERSATION_STORE[conversation_id]
-    appointment_context = conversation.get("appointment_context", {})
+def _text_turn(conversation_id, text):
+    """
+    Run one text turn of a conversation
+
+    Returns:
+        dict: The reply, as returned by /api/text
+    """
+    logger.info("Processing text input (%d chars): %s", len(text), phi(text))
     
     # Process the query with LangGraph workflow
     try:
@@ -192,52 +182,76 @@ def handle_text(conversation_id):
             "conversation_id": conversation_id
         }
         
-        # Add conversation state if conversation is in progress
-        conversation_in_progress = conversation.get("conversation_in_progress", False)
-        original_intent = conversation.get("original_intent", "")
-        
-        if conversation_in_progress:
-            initial_state["conversation_in_progress"] = True
-            initial_state["original_intent"] = original_intent
-            logger.info(f"Continuing text conversation with original intent: {original_intent}")
-        
-        # Always add appointment context if it exists
-        if appointment_context:
-            initial_state["appointment_context"] = appointment_context
-        
         logger.info(f"Starting LangGraph workflow for text input...")
         
-        # Run the workflow with our wrapper function
-        final_state = process_workflow(initial_state)
-        
-        # Update conversation store with the results
-        CONVERSATION_STORE[conversation_id]["conversation_in_progress"] = final_state.get("conversation_in_progress", False)
-        CONVERSATION_STORE[conversation_id]["original_intent"] = final_state.get("original_intent", "")
-        CONVERSATION_STORE[conversation_id]["last_updated"] = time.time()
-        
-        # Make sure to capture any appointment_context updates from the workflow
-        if "appointment_context" in final_state:
-            CONVERSATION_STORE[conversation_id]["appointment_context"] = final_state["appointment_context"]
+        # Run the workflow, resuming the conversation from its checkpoint
+        final_state = process_workflow(initial_state, checkpointer=get_checkpointer())
         
         logger.info(f"Text workflow completed - Intent: {final_state.get('intent', 'unknown')}")
         
-        # Return the response
-        return jsonify({
+        return {
             "transcript": text,
             "intent": final_state.get("intent", "unknown"),
             "response": final_state.get("response", "I'm not sure how to respond to that."),
             "conversation_id": conversation_id
-        })
+        }
     except Exception as e:
         logger.error(f"Error processing text request: {e}")
         import traceback
         logger.debug(f"Full traceback: {traceback.format_exc()}")
-        return jsonify({
-            "transcript": text,
-            "intent": "error",
-            "response": "I'm sorry, but I encountered an error processing your request.",
-            "conversation_id": conversation_id
-        })
+        return _text_turn_error(conversation_id, text)
+
+def _text_turn_error(conversation_id, text):
+    return {
+        "transcript": text,
+        "intent": "error",
+        "response": "I'm sorry, but I encountered an error processing your request.",
+        "conversation_id": conversation_id
+    }
+
+@app.route('/api/text/<conversation_id>', methods=['POST'])
+def handle_text(conversation_id):
+    """Handle text input directly without audio transcription"""
+    logger.info(f"Text message received [ID: {conversation_id[:8]}]")
+    
+    # Get the text from the request
+    data = request.json
+    if not data or 'text' not in data:
+        logger.warning("Text processing failed: No text provided")
+        return jsonify({"error": "No text provided"}), 400
+    
+    return jsonify(_text_turn(conversation_id, data['text']))
+
+@app.route('/api/batch', methods=['POST'])
+def handle_batch():
+    """
+    Run text turns for many conversations, streaming each reply back as it completes
+
+    The body is a JSON array of {"conversation_id", "text"}. Distinct
+    conversations run concurrently on a pool shared by every batch
+    (BATCH_WORKERS) and each conversation's turns run in the order given. The response is NDJSON: one /api/text reply
+    per line, plus the item's "index", in completion order.
+    """
+    try:
+        turns = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        logger.warning("Batch rejected: %s", e)
+        return jsonify({"error": str(e)}), 400
+    
+    logger.info("Batch of %d turns received for %d conversations", len(turns), len({c for c, _ in turns}))
+    parent = current_request()
+    
+    def run_turn(conversation_id, text):
+        # Same request ID, with each turn's conversation on its log lines
+        with request_context(parent.request_id, conversation_id, parent.trace):
+            return _text_turn(conversation_id, text)
+    
+    def replies():
+        for index, reply in run_batch(turns, run_turn):
+            reply = reply or _text_turn_error(*turns[index])
+            yield json.dumps({"index": index, **reply}) + "\n"
+    
+    return Response(stream_with_context(replies()), mimetype="application/x-ndjson")
 
 @app.route('/api/tts', methods=['POST'])
 def text_to_speech():
@@ -252,7 +266,7 @@ def text_to_speech():
             return jsonify({"error": "No text provided"}), 400
         
         text = data['text']
-        logger.info(f"Converting to speech: \"{text[:30]}...\"" if len(text) > 30 else f"Converting: \"{text}\"")
+        logger.info("Converting to speech (%d chars): %s", len(text), phi(text))
         
         # ElevenLabs API configuration
         ELEVEN_LABS_API_KEY = os.getenv("ELEVEN_LABS_API_KEY")
@@ -265,7 +279,7 @@ def text_to_speech():
             return jsonify({"error": "ElevenLabs API key not configured"}), 500
         
         # Prepare request to ElevenLabs API
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+        url = f"{ELEVEN_LABS_API_URL}/v1/text-to-speech/{voice_id}"
         
         headers = {
             "Accept": "audio/mpeg",
@@ -283,7 +297,8 @@ def text_to_speech():
         }
         
         logger.info(f"Requesting audio generation from ElevenLabs...")
-        response = requests.post(url, json=payload, headers=headers)
+        with outbound("elevenlabs"):
+            response = requests.post(url, json=payload, headers=headers)
         
         if response.status_code == 200:
             logger.info(f"Audio successfully generated ({len(response.content)} bytes)")
@@ -309,46 +324,97 @@ def text_to_speech():
 @app.route('/debug/<conversation_id>', methods=['GET'])
 def debug_info(conversation_id):
     """Return debug information about a conversation"""
-    if conversation_id not in CONVERSATION_STORE:
+    checkpoint = get_checkpointer().load(conversation_id)
+    if checkpoint is None:
         return jsonify({"error": "Conversation not found"}), 404
     
-    conversation = CONVERSATION_STORE[conversation_id]
-    
     return jsonify({
         "conversation_id": conversation_id,
-        "conversation_data": conversation,
-        "active_conversations": list(CONVERSATION_STORE.keys()),
+        "conversation_data": {**checkpoint.values, "last_updated": checkpoint.updated_at},
+        "checkpoint_version": checkpoint.version,
+    })
+
+@app.route('/debug/outbox', methods=['GET'])
+def outbox_info():
+    """Return queue depth and delivery latency for the notification outbox"""
+    if not OUTBOX_ENABLED:
+        return jsonify({"enabled": False})
+    
+    try:
+        return jsonify({"enabled": True, **get_email_outbox().metrics()})
+    except Exception as e:
+        logger.error(f"Outbox metrics error: {e}")
+        return jsonify({"error": "Outbox unavailable", "details": str(e)}), 503
+
+def _profiling_admin_error():
+    """Why a profiling admin request must be refused, as a response, or None if it may go ahead"""
+    if not PROFILING_SECRET:
+        return jsonify({"error": "Profiling is disabled; set PROFILING_SECRET"}), 404
+    if not is_admin(request.headers.get(ADMIN_HEADER)):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+@app.route('/debug/profiles', methods=['GET'])
+def list_profiles():
+    """List captured request profiles, newest first"""
+    error = _profiling_admin_error()
+    if error:
+        return error
+    profiler = get_request_profiler()
+    return jsonify({
+        "armed": profiler.armed,
+        "path_prefix": profiler.path_prefix,
+        "profiles": profiler.store.list()
     })
 
+@app.route('/debug/profiles/arm', methods=['POST'])
+def arm_profiling():
+    """Profile the next N requests, optionally only under a path prefix: {"requests": 1, "path_prefix": "/api/text"}"""
+    error = _profiling_admin_error()
+    if error:
+        return error
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(get_request_profiler().arm(int(data.get("requests", 1)), data.get("path_prefix", "")))
+    except (TypeError, ValueError):
+        return jsonify({"error": "requests must be a number"}), 400
+
+@app.route('/debug/profiles/<profile_id>.<kind>', methods=['GET'])
+def download_profile(profile_id, kind):
+    """Download a captured profile as pstats or collapsed stacks (for flamegraph.pl or speedscope)"""
+    error = _profiling_admin_error()
+    if error:
+        return error
+    path = get_request_profiler().store.path(profile_id, kind)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, mimetype=PROFILE_KINDS[kind], as_attachment=True, download_name=f"{profile_id}.{kind}")
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms per node, LLM call, Mongo command and outbound call, in Prometheus text format"""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/api/costs', methods=['GET'])
+def cost_summary():
+    """Summarize LLM spend per completed operation, intent, appointment state and call site"""
+    try:
+        days = float(request.args.get("days", 30))
+        summary = get_cost_ledger().summary(since=datetime.utcnow() - timedelta(days=days))
+        return jsonify(summary)
+    except ValueError:
+        return jsonify({"error": "days must be a number"}), 400
+    except Exception as e:
+        logger.error(f"Cost summary error: {e}")
+        return jsonify({"error": "Cost ledger unavailable", "details": str(e)}), 503
+
 @app.route('/reset/<conversation_id>', methods=['GET'])
 def reset_conversation(conversation_id):
     """Reset a specific conversation"""
-    if conversation_id in CONVERSATION_STORE:
-        CONVERSATION_STORE[conversation_id] = {
-            "conversation_in_progress": False,
-            "original_intent": "",
-            "appointment_context": {},
-            "last_updated": time.time()
-        }
+    get_checkpointer().delete(conversation_id)
     
     return jsonify({"success": True, "message": "Conversation reset successfully"})
 
-# Cleanup old conversations periodically
-@app.before_request
-def cleanup_old_conversations():
-    """Remove conversations that haven't been updated in a while"""
-    current_time = time.time()
-    to_remove = []
-    
-    for cid, conversation in CONVERSATION_STORE.items():
-        if current_time - conversation.get("last_updated", 0) > 3600:  # 1 hour
-            to_remove.append(cid)
-    
-    if to_remove:
-        for cid in to_remove:
-            CONVERSATION_STORE.pop(cid, None)
-        logger.info(f"Cleaned up {len(to_remove)} expired conversation(s)")
-
 if __name__ == '__main__':
     logger.info("Starting MedAgent AI Healthcare Assistant...")
     logger.info("Multi-Agent Architecture: Receptionist → [Appointment/CallCenter] → Content → Notification")
@@ -0,0 +1,110 @@
+import os
+import queue
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Most turns one /api/batch request may carry
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+# Turns run at the same time across every batch in flight
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_batch_executor():
+    """Get the thread pool shared by every batch, so concurrent requests stay within BATCH_WORKERS"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS), thread_name_prefix="batch")
+    return _executor
+
+def parse_batch(items, max_items=BATCH_MAX_ITEMS):
+    """
+    Check a batch request body
+
+    Args:
+        items: The decoded JSON body, a list of {"conversation_id", "text"}
+        max_items: The most items allowed
+
+    Returns:
+        list: (conversation_id, text) per item, in order
+
+    Raises:
+        ValueError: Describing the first problem with the body
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("Expected a non-empty JSON array of {conversation_id, text} items")
+    if len(items) > max_items:
+        raise ValueError(f"At most {max_items} items per batch")
+    turns = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"Item {index} is not an object")
+        conversation_id, text = item.get("conversation_id"), item.get("text")
+        if not isinstance(conversation_id, str) or not conversation_id:
+            raise ValueError(f"Item {index} has no conversation_id")
+        if not isinstance(text, str):
+            raise ValueError(f"Item {index} has no text")
+        turns.append((conversation_id, text))
+    return turns
+
+def run_batch(turns, run_turn, executor=None):
+    """
+    Run a batch of turns, yielding each result as soon as it is ready
+
+    Turns of one conversation run one after another in the order given;
+    distinct conversations run concurrently on the shared batch pool. Each
+    conversation submits its next turn only when the previous one is done, so
+    batches in flight take turns on the pool rather than one holding it.
+    Results therefore come back in completion order, each tagged with its
+    item's index. Closing the generator early (e.g. the client went away)
+    skips the turns not yet started.
+
+    Args:
+        turns: (conversation_id, text) per item
+        run_turn: fn(conversation_id, text) -> dict, the result of one turn
+        executor: The pool to run turns on (default: get_batch_executor())
+
+    Yields:
+        tuple: (index, result)
+    """
+    executor = executor or get_batch_executor()
+    by_conversation = {}
+    for index, (conversation_id, text) in enumerate(turns):
+        by_conversation.setdefault(conversation_id, []).append((index, text))
+
+    results = queue.Queue()
+    stopped = threading.Event()
+
+    def run_next(conversation_id, items, position):
+        if stopped.is_set():
+            return
+        index, text = items[position]
+        try:
+            result = run_turn(conversation_id, text)
+        except Exception as e:
+            logger.error("Batch turn %d for conversation %s failed: %s", index, conversation_id, e)
+            result = None
+        results.put((index, result))
+        if position + 1 < len(items) and not stopped.is_set():
+            # Queued behind turns other batches submitted in the meantime
+            submit(conversation_id, items, position + 1)
+
+    def submit(conversation_id, items, position):
+        # Each conversation's turns log with this request's ID
+        executor.submit(contextvars.copy_context().run, run_next, conversation_id, items, position)
+
+    try:
+        for conversation_id, items in by_conversation.items():
+            submit(conversation_id, items, 0)
+        for _ in range(len(turns)):
+            yield results.get()
+    finally:
+        stopped.set()
@@ -0,0 +1,289 @@
+import os
+import copy
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+import bson
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from app.metrics import CHECKPOINT_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Where conversation state is kept between turns: "mongo" (shared by every worker and
+# kept across restarts) or "memory" (this process only)
+WORKFLOW_CHECKPOINTER = os.getenv("WORKFLOW_CHECKPOINTER", "mongo")
+
+# Conversations idle for longer than this are dropped
+CHECKPOINT_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", "3600"))
+
+# Largest encoded state kept for one conversation; see encode_checkpoint
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", "16384"))
+
+# Most conversations the memory checkpointer holds; the least recently saved are dropped first
+CHECKPOINT_MEMORY_MAX_CONVERSATIONS = int(os.getenv("CHECKPOINT_MEMORY_MAX_CONVERSATIONS", "10000"))
+
+CHECKPOINT_COLLECTION = "conversation_checkpoints"
+
+# appointment_context fields the agent can do without: slot listings it fetches
+# again when it needs them
+CHECKPOINT_DROPPABLE = ("available_dates",)
+
+# The workflow state carried from one turn of a conversation to the next, with its
+# value at the start of a conversation
+CHECKPOINT_DEFAULTS = {
+    "conversation_in_progress": False,
+    "original_intent": "",
+    "appointment_context": {},
+}
+
+class Checkpoint(NamedTuple):
+    """
+    A conversation's state as of its last saved turn
+
+    `values` is the loading turn's own copy to update; `data` is the state as
+    saved, BSON-encoded, which the next save is diffed against.
+    """
+    values: dict
+    version: int
+    updated_at: Optional[float]
+    data: bytes
+
+def checkpoint_values(state):
+    """The checkpointed keys of a workflow state, defaulting any that are missing"""
+    return {key: state.get(key, copy.deepcopy(default)) for key, default in CHECKPOINT_DEFAULTS.items()}
+
+def encode_checkpoint(state, max_bytes=CHECKPOINT_MAX_BYTES):
+    """
+    Encode a workflow state's checkpointed keys as BSON, within max_bytes
+
+    A state over the limit loses the CHECKPOINT_DROPPABLE fields of its
+    appointment_context; one still over it is refused.
+
+    Args:
+        state: The workflow state
+        max_bytes: The most the encoded state may take
+
+    Returns:
+        tuple: (the values encoded, the encoded bytes)
+    """
+    values = checkpoint_values(state)
+    data = bson.encode(values)
+    context = values["appointment_context"]
+    if len(data) > max_bytes and isinstance(context, dict):
+        dropped = [key for key in CHECKPOINT_DROPPABLE if key in context]
+        if dropped:
+            logger.warning("Conversation state is %d bytes, over %d; dropping %s", len(data), max_bytes,
+                           ", ".join(dropped))
+            values["appointment_context"] = {key: value for key, value in context.items() if key not in dropped}
+            data = bson.encode(values)
+    if len(data) > max_bytes:
+        raise ValueError(f"Conversation state is {len(data)} bytes, over the {max_bytes} byte limit")
+    CHECKPOINT_SIZE.observe(len(data))
+    return values, data
+
+def decode_checkpoint(data):
+    """A new copy of the values encoded by encode_checkpoint"""
+    return bson.decode(data)
+
+def _diffable(value):
+    # Keys Mongo can address with a dotted path
+    return isinstance(value, dict) and bool(value) and all(
+        isinstance(key, str) and key and "." not in key and not key.startswith("$") for key in value
+    )
+
+def checkpoint_delta(previous, current, prefix="values"):
+    """
+    The Mongo update paths that turn `previous` into `current`
+
+    Nested dicts are compared key by key, so a turn that fills in one field of
+    appointment_context writes only that field; other values are replaced whole.
+
+    Returns:
+        tuple: ({path: value} to $set, {path: ""} to $unset)
+    """
+    sets, unsets = {}, {}
+    for key, value in current.items():
+        path = f"{prefix}.{key}"
+        if key not in previous:
+            sets[path] = value
+        elif type(previous[key]) is type(value) and previous[key] == value:
+            continue
+        elif _diffable(previous[key]) and _diffable(value):
+            nested_sets, nested_unsets = checkpoint_delta(previous[key], value, path)
+            sets.update(nested_sets)
+            unsets.update(nested_unsets)
+        else:
+            sets[path] = value
+    for key in previous:
+        if key not in current:
+            unsets[f"{prefix}.{key}"] = ""
+    return sets, unsets
+
+class MongoCheckpointer:
+    """
+    Conversation checkpoints in Mongo, one document per conversation
+
+    A save writes only the paths that changed since the checkpoint the turn
+    resumed from, and bumps the document's version. If another worker saved
+    the same conversation in between, this turn's changes are still applied
+    on top (they touch only what this turn changed) and the overlap is logged.
+    Idle conversations expire through a TTL index on updated_at.
+    """
+
+    # Name of the TTL index on updated_at
+    TTL_INDEX = "updated_at_ttl"
+
+    def __init__(self, collection, ttl_seconds=CHECKPOINT_TTL_SECONDS):
+        self.collection = collection
+        self._ensure_ttl_index(ttl_seconds)
+
+    def _ensure_ttl_index(self, ttl_seconds):
+        try:
+            self.collection.create_index([("updated_at", ASCENDING)], name=self.TTL_INDEX,
+                                         expireAfterSeconds=ttl_seconds)
+        except OperationFailure as e:
+            # The index exists with another TTL (CHECKPOINT_TTL_SECONDS changed) or name; update it in place
+            try:
+                self.collection.database.command("collMod", self.collection.name,
+                                                 index={"keyPattern": {"updated_at": 1},
+                                                        "expireAfterSeconds": ttl_seconds})
+                logger.info("Checkpoint TTL index updated to %ds", ttl_seconds)
+            except OperationFailure as collmod_error:
+                logger.warning("Checkpoint TTL index left as is, couldn't apply %ds: %s (%s)",
+                               ttl_seconds, collmod_error, e)
+
+    def load(self, thread_id):
+        """The conversation's latest Checkpoint, or None for a new conversation"""
+        document = self.collection.find_one({"_id": thread_id})
+        if document is None:
+            return None
+        updated_at = document.get("updated_at")
+        values = checkpoint_values(document.get("values", {}))
+        return Checkpoint(values, document.get("version", 0),
+                          updated_at.replace(tzinfo=timezone.utc).timestamp() if updated_at else None,
+                          bson.encode(values))
+
+    def save(self, thread_id, values, previous=None):
+        """
+        Checkpoint a turn's conversation state
+
+        Args:
+            thread_id: The conversation ID
+            values: The state after the turn (see CHECKPOINT_DEFAULTS)
+            previous: The Checkpoint the turn resumed from, or None for a new conversation
+
+        Returns:
+            int: The new version
+        """
+        values, _ = encode_checkpoint(values)
+        now = datetime.utcnow()
+        if previous is None:
+            try:
+                self.collection.insert_one({"_id": thread_id, "version": 1, "updated_at": now, "values": values})
+                return 1
+            except DuplicateKeyError:
+                logger.info("Conversation %s was started by another turn in the meantime; overwriting it", thread_id)
+                sets, unsets = {"values": values}, {}
+        else:
+            sets, unsets = checkpoint_delta(decode_checkpoint(previous.data), values)
+
+        update = {"$set": {**sets, "updated_at": now}, "$inc": {"version": 1}}
+        if unsets:
+            update["$unset"] = unsets
+        version = previous.version if previous else None
+        document = None
+        if version is not None:
+            document = self.collection.find_one_and_update(
+                {"_id": thread_id, "version": version}, update,
+                projection={"version": True}, return_document=ReturnDocument.AFTER
+            )
+        if document is None:
+            if version is not None:
+                logger.warning("Conversation %s was saved by another turn since version %d; applying this turn's "
+                               "changes on top", thread_id, version)
+            document = self.collection.find_one_and_update(
+                {"_id": thread_id}, update, projection={"version": True},
+                return_document=ReturnDocument.AFTER, upsert=True
+            )
+        return document["version"]
+
+    def delete(self, thread_id):
+        """Forget a conversation"""
+        self.collection.delete_one({"_id": thread_id})
+
+class _Stored(NamedTuple):
+    data: bytes
+    version: int
+    updated_at: float
+
+class MemoryCheckpointer:
+    """
+    Conversation checkpoints in this process, for development and tests
+
+    Each conversation is held as its encoded bytes (a few hundred bytes to a
+    few KB, against several times that as live dicts), and at most
+    max_conversations are held: the least recently saved go first.
+    """
+
+    def __init__(self, ttl_seconds=CHECKPOINT_TTL_SECONDS, max_conversations=CHECKPOINT_MEMORY_MAX_CONVERSATIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        # Oldest save first
+        self._checkpoints = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._checkpoints:
+            thread_id, stored = next(iter(self._checkpoints.items()))
+            if now - stored.updated_at <= self.ttl_seconds and len(self._checkpoints) <= self.max_conversations:
+                break
+            del self._checkpoints[thread_id]
+
+    def load(self, thread_id):
+        with self._lock:
+            self._expire(time.time())
+            stored = self._checkpoints.get(thread_id)
+        if stored is None:
+            return None
+        return Checkpoint(decode_checkpoint(stored.data), stored.version, stored.updated_at, stored.data)
+
+    def save(self, thread_id, values, previous=None):
+        _, data = encode_checkpoint(values)
+        with self._lock:
+            current = self._checkpoints.pop(thread_id, None)
+            version = (current.version if current else 0) + 1
+            now = time.time()
+            self._checkpoints[thread_id] = _Stored(data, version, now)
+            self._expire(now)
+            return version
+
+    def delete(self, thread_id):
+        with self._lock:
+            self._checkpoints.pop(thread_id, None)
+
+    def size_bytes(self):
+        """Encoded bytes held across all conversations"""
+        with self._lock:
+            return sum(len(stored.data) for stored in self._checkpoints.values())
+
+_checkpointer = None
+_checkpointer_lock = threading.Lock()
+
+def get_checkpointer():
+    """Get the shared conversation checkpointer selected by WORKFLOW_CHECKPOINTER"""
+    global _checkpointer
+    if _checkpointer is None:
+        with _checkpointer_lock:
+            if _checkpointer is None:
+                if WORKFLOW_CHECKPOINTER == "memory":
+                    _checkpointer = MemoryCheckpointer()
+                elif WORKFLOW_CHECKPOINTER == "mongo":
+                    from app.models import db
+                    _checkpointer = MongoCheckpointer(db[CHECKPOINT_COLLECTION])
+                else:
+                    raise ValueError(f"Unknown checkpointer {WORKFLOW_CHECKPOINTER!r}; use 'mongo' or 'memory'")
+    return _checkpointer
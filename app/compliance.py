@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Compliance guidelines and the rules that enforce them
+COMPLIANCE_RULES_PATH = os.getenv(
+    "COMPLIANCE_RULES_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "compliance_rules.json")
+)
+
+# How many validated responses are remembered (keyed by content hash)
+COMPLIANCE_CACHE_SIZE = 4096
+
+# Sentences, including their trailing punctuation and whitespace
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+(?:[.!?]+|$)\s*|\n+")
+
+class Violation(NamedTuple):
+    rule_id: str
+    start: int
+    end: int
+    text: str
+
+class ComplianceResult(NamedTuple):
+    """Outcome of checking one response"""
+    text: str                          # The response after local rewrites
+    violations: Tuple[Violation, ...]  # Every rule match in the original response
+    rewritten: bool                    # Whether a local rewrite changed the text
+    needs_llm: Tuple[str, ...]         # Rule ids left for the model to fix
+
+    @property
+    def compliant(self):
+        return not self.violations
+
+def _fingerprint(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class ComplianceEngine:
+    """
+    Check responses against the compliance rules with one compiled regex
+
+    Every rule's patterns become one named group in a single alternation,
+    anchored at a word boundary, so a response is scanned once (lowercased;
+    patterns are written in lowercase) and each match reports its span and rule. Rules with a rewrite template are fixed locally (whole sentence
+    or just the phrase); rules without one are left for the model.
+    """
+
+    def __init__(self, rules, guidelines=()):
+        self.guidelines = list(guidelines)
+        self.rules = {}
+        groups = []
+        for position, rule in enumerate(rules):
+            group = f"rule{position}"
+            self.rules[group] = rule
+            alternatives = "|".join(f"(?:{pattern})" for pattern in rule["patterns"])
+            groups.append(f"(?P<{group}>{alternatives})")
+
+        # One leading \b for the whole alternation is much cheaper than
+        # re.IGNORECASE plus a boundary check in every branch
+        self.regex = re.compile(r"\b(?:" + "|".join(groups) + ")") if groups else None
+        self.rules_by_id = {rule["id"]: rule for rule in rules}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data.get("rules", []), data.get("guidelines", []))
+
+    def scan(self, text):
+        """
+        Find every rule violation in a response
+
+        Returns:
+            list: Violation tuples in order of position
+        """
+        if self.regex is None:
+            return []
+        return [
+            Violation(self.rules[match.lastgroup]["id"], match.start(), match.end(), text[match.start():match.end()])
+            for match in self.regex.finditer(text.lower())
+        ]
+
+    def check(self, text):
+        """
+        Check a response, rewriting what can be fixed locally
+
+        Results are cached by the response's SHA-256, so identical templated
+        responses are only ever checked once.
+
+        Args:
+            text: The response to validate
+
+        Returns:
+            ComplianceResult: The (possibly rewritten) text and what was found
+        """
+        key = _fingerprint(text)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        result = self._check(text)
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > COMPLIANCE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def remember(self, original, corrected):
+        """Cache a model-corrected response so the same response is never sent for correction again"""
+        result = self.check(original)
+        with self._lock:
+            self._cache[_fingerprint(original)] = result._replace(text=corrected, rewritten=True, needs_llm=())
+
+    def _check(self, text):
+        violations = tuple(self.scan(text))
+        if not violations:
+            return ComplianceResult(text, (), False, ())
+
+        sentences = [match.span() for match in SENTENCE_PATTERN.finditer(text)]
+
+        def sentence_of(position):
+            for index, (start, end) in enumerate(sentences):
+                if start <= position < end:
+                    return index
+            return len(sentences) - 1
+
+        # Whole-sentence rewrites win over phrase rewrites in the same sentence
+        sentence_rewrites = {}
+        phrase_rewrites = []
+        unresolved = []
+        for violation in violations:
+            rule = self.rules_by_id[violation.rule_id]
+            index = sentence_of(violation.start)
+            if rule.get("rewrite") is None:
+                unresolved.append((index, violation.rule_id))
+            elif rule.get("scope") == "phrase":
+                phrase_rewrites.append((index, violation, rule["rewrite"]))
+            else:
+                sentence_rewrites.setdefault(index, rule["rewrite"])
+
+        parts = []
+        previous_template = None
+        for index, (start, end) in enumerate(sentences):
+            original = text[start:end]
+            if index in sentence_rewrites:
+                template = sentence_rewrites[index]
+                # Don't repeat the same replacement for consecutive sentences
+                if template != previous_template:
+                    trailing = original[len(original.rstrip()):] or " "
+                    parts.append(template + trailing)
+                previous_template = template
+                continue
+
+            previous_template = None
+            for _, violation, replacement in sorted(
+                (item for item in phrase_rewrites if item[0] == index),
+                key=lambda item: -item[1].start
+            ):
+                offset_start, offset_end = violation.start - start, violation.end - start
+                if not original[:offset_start].strip():
+                    replacement = replacement[:1].upper() + replacement[1:]
+                original = original[:offset_start] + replacement + original[offset_end:]
+            parts.append(original)
+
+        rewritten = "".join(parts).strip()
+        needs_llm = tuple(sorted({rule_id for index, rule_id in unresolved if index not in sentence_rewrites}))
+        return ComplianceResult(rewritten, violations, rewritten != text, needs_llm)
+
+_engine = None
+
+def get_compliance_engine():
+    """Get the shared compliance engine, compiling the rule file on first use"""
+    global _engine
+    if _engine is None:
+        try:
+            _engine = ComplianceEngine.from_file(COMPLIANCE_RULES_PATH)
+        except Exception as e:
+            logger.error(f"Failed to load compliance rules from {COMPLIANCE_RULES_PATH}: {e}")
+            _engine = ComplianceEngine([])
+    return _engine
@@ -0,0 +1,289 @@
+import os
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid
+from app.telemetry import TelemetrySink
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M (input, output) tokens
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50)
+}
+
+# Ledger entries written to Mongo per insert_many, and the longest a partial batch waits
+COST_BATCH_SIZE = int(os.getenv("COST_BATCH_SIZE", "100"))
+COST_FLUSH_SECONDS = float(os.getenv("COST_FLUSH_SECONDS", "5.0"))
+
+# Entries waiting to be written; beyond this they are dropped rather than blocking a turn
+COST_QUEUE_SIZE = int(os.getenv("COST_QUEUE_SIZE", "10000"))
+
+COST_COLLECTION = "llm_costs"
+
+# Appointment states that mark a completed operation, and the intents whose calls count towards it
+COMPLETED_OPERATIONS = {
+    "booking_confirmed": "booking",
+    "cancellation_confirmed": "cancellation",
+    "reschedule_confirmed": "reschedule"
+}
+OPERATION_INTENTS = {
+    "booking": ["schedule_appointment", "book_appointment"],
+    "cancellation": ["cancel_appointment"],
+    "reschedule": ["reschedule_appointment"]
+}
+
+def token_cost(model, input_tokens, output_tokens):
+    """Cost in USD of a call; unknown models are priced by their longest known prefix, else 0"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        matches = [name for name in MODEL_PRICES if model and model.startswith(name)]
+        prices = MODEL_PRICES[max(matches, key=len)] if matches else (0.0, 0.0)
+    return (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+
+class ConversationCosts:
+    """
+    The LLM calls made during one conversation turn
+
+    Calls are held here until the turn ends, so each can be attributed to the
+    intent the turn was classified as, including the receptionist's own
+    classification call that runs before the intent is known.
+    """
+
+    def __init__(self, conversation_id, appointment_state=None):
+        self.conversation_id = conversation_id
+        self.start_state = appointment_state or "none"
+        self.appointment_state = self.start_state
+        self.node = None
+        self.calls = []
+
+    def add(self, name, model, usage):
+        input_tokens = usage.get("input", 0) or 0
+        output_tokens = usage.get("output", 0) or 0
+        self.calls.append({
+            "timestamp": datetime.utcnow(),
+            "operation": name,
+            "model": model,
+            "node": self.node,
+            "appointment_state": self.appointment_state,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost": token_cost(model, input_tokens, output_tokens)
+        })
+
+    def entries(self, final_state):
+        """Ledger documents for the turn: one per call, plus one per completed operation"""
+        intent = final_state.get("intent") or "none"
+        entries = [{
+            "timestamp": call["timestamp"],
+            "meta": {
+                "conversation_id": self.conversation_id,
+                "kind": "llm",
+                "intent": intent,
+                "operation": call["operation"],
+                "model": call["model"],
+                "node": call["node"],
+                "appointment_state": call["appointment_state"]
+            },
+            "input_tokens": call["input_tokens"],
+            "output_tokens": call["output_tokens"],
+            "cost": call["cost"]
+        } for call in self.calls]
+
+        end_state = (final_state.get("appointment_context") or {}).get("state")
+        completed = COMPLETED_OPERATIONS.get(end_state)
+        if completed and end_state != self.start_state:
+            entries.append({
+                "timestamp": datetime.utcnow(),
+                "meta": {"conversation_id": self.conversation_id, "kind": "outcome",
+                         "intent": intent, "operation": completed}
+            })
+        return entries
+
+_current_costs = ContextVar("conversation_costs", default=None)
+
+@contextmanager
+def cost_scope(conversation_id, appointment_context=None):
+    """
+    Attribute LLM calls made inside the block to a conversation
+
+    Yields the ConversationCosts; call `finish(costs, final_state)` once the
+    turn's outcome is known to hand its entries to the ledger.
+    """
+    state = (appointment_context or {}).get("state")
+    costs = ConversationCosts(conversation_id, state)
+    token = _current_costs.set(costs)
+    try:
+        yield costs
+    finally:
+        _current_costs.reset(token)
+
+def track_node(name, fn):
+    """Wrap a LangGraph node so calls made inside it are tagged with the node and appointment state"""
+    def node(state):
+        costs = _current_costs.get()
+        if costs is not None:
+            costs.node = name
+            costs.appointment_state = (state.get("appointment_context") or {}).get("state") or "none"
+        return fn(state)
+    node.__name__ = getattr(fn, "__name__", name)
+    node.__doc__ = fn.__doc__
+    return node
+
+def record_llm_usage(name, model, usage):
+    """
+    Record one LLM call's token usage against the current conversation
+
+    Calls outside a conversation (e.g. background jobs) go straight to the
+    ledger with no conversation_id.
+    """
+    costs = _current_costs.get()
+    if costs is not None:
+        costs.add(name, model, usage)
+        return
+    costs = ConversationCosts(None)
+    costs.add(name, model, usage)
+    finish(costs, {})
+
+def finish(costs, final_state):
+    """Hand a finished turn's entries to the ledger; never raises into the request"""
+    entries = costs.entries(final_state)
+    if not entries:
+        return
+    try:
+        get_cost_ledger().record_many(entries)
+    except Exception as e:
+        logger.warning(f"Cost ledger unavailable, {len(entries)} entries not recorded: {e}")
+
+class CostLedger:
+    """
+    Token and cost entries, buffered in memory and written to Mongo in batches
+
+    Entries go to a time-series collection (timeField "timestamp", metaField
+    "meta") where the server supports it, otherwise to a plain collection
+    indexed on timestamp.
+    """
+
+    def __init__(self, db, collection_name=COST_COLLECTION, batch_size=COST_BATCH_SIZE,
+                 flush_seconds=COST_FLUSH_SECONDS, queue_size=COST_QUEUE_SIZE):
+        self.collection = self._open_collection(db, collection_name)
+        self.sink = TelemetrySink(self._write, queue_size=queue_size, batch_size=batch_size,
+                                  flush_seconds=flush_seconds, sample_rate=1.0)
+
+    @staticmethod
+    def _open_collection(db, name):
+        if name in db.list_collection_names():
+            return db[name]
+        try:
+            return db.create_collection(name, timeseries={
+                "timeField": "timestamp", "metaField": "meta", "granularity": "seconds"
+            })
+        except CollectionInvalid:
+            # Created by another worker in the meantime
+            return db[name]
+        except Exception as e:
+            logger.info(f"Time-series collections unavailable ({e}), using a plain collection for {name}")
+            collection = db[name]
+            collection.create_index([("timestamp", ASCENDING)])
+            return collection
+
+    def _write(self, batch):
+        self.collection.insert_many(batch, ordered=False)
+
+    def record_many(self, entries):
+        for entry in entries:
+            self.sink.record(entry)
+
+    def flush(self):
+        return self.sink.flush()
+
+    def shutdown(self):
+        self.sink.shutdown()
+
+    def summary(self, since=None):
+        """
+        Summarize spend since a point in time (default: the last 30 days)
+
+        Returns:
+            dict: totals, cost per completed booking/cancellation/reschedule,
+                  and token/cost breakdowns by appointment state and operation
+        """
+        self.flush()
+        since = since or datetime.utcnow() - timedelta(days=30)
+        calls = {"timestamp": {"$gte": since}, "meta.kind": "llm"}
+
+        def grouped(key):
+            return list(self.collection.aggregate([
+                {"$match": calls},
+                {"$group": {
+                    "_id": f"$meta.{key}",
+                    "calls": {"$sum": 1},
+                    "input_tokens": {"$sum": "$input_tokens"},
+                    "output_tokens": {"$sum": "$output_tokens"},
+                    "cost": {"$sum": "$cost"}
+                }},
+                {"$sort": {"cost": -1}}
+            ]))
+
+        by_intent = {row["_id"]: row for row in grouped("intent")}
+        completed = {row["_id"]: row["count"] for row in self.collection.aggregate([
+            {"$match": {"timestamp": {"$gte": since}, "meta.kind": "outcome"}},
+            {"$group": {"_id": "$meta.operation", "count": {"$sum": 1}}}
+        ])}
+
+        per_operation = {}
+        for operation, intents in OPERATION_INTENTS.items():
+            cost = sum(by_intent[intent]["cost"] for intent in intents if intent in by_intent)
+            tokens = sum(by_intent[intent]["input_tokens"] + by_intent[intent]["output_tokens"]
+                         for intent in intents if intent in by_intent)
+            count = completed.get(operation, 0)
+            per_operation[operation] = {
+                "completed": count,
+                "cost": round(cost, 6),
+                "tokens": tokens,
+                "cost_per_completed": round(cost / count, 6) if count else None,
+                "tokens_per_completed": round(tokens / count) if count else None
+            }
+
+        def rows(groups):
+            return [{
+                "name": row["_id"],
+                "calls": row["calls"],
+                "input_tokens": row["input_tokens"],
+                "output_tokens": row["output_tokens"],
+                "cost": round(row["cost"], 6)
+            } for row in groups]
+
+        return {
+            "since": since.isoformat(),
+            "total_cost": round(sum(row["cost"] for row in by_intent.values()), 6),
+            "total_calls": sum(row["calls"] for row in by_intent.values()),
+            "conversations": len(self.collection.distinct("meta.conversation_id", calls)),
+            "per_completed_operation": per_operation,
+            "by_intent": rows(by_intent.values()),
+            "by_appointment_state": rows(grouped("appointment_state")),
+            "by_operation": rows(grouped("operation"))
+        }
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_cost_ledger():
+    """Get the shared cost ledger over the application database"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                from app.models import db
+                ledger = CostLedger(db)
+                atexit.register(ledger.shutdown)
+                _ledger = ledger
+    return _ledger
@@ -0,0 +1,84 @@
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from app.models import Patient, Doctor, Appointment
+
+# Threads that run Mongo lookups concurrently, shared by every request in the process;
+# 0 runs gathered lookups one after another in the calling thread
+DB_LOOKUP_WORKERS = int(os.getenv("DB_LOOKUP_WORKERS", "8"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_lookup_executor():
+    """Get the shared lookup thread pool, or None when DB_LOOKUP_WORKERS is 0"""
+    global _executor
+    if _executor is None and DB_LOOKUP_WORKERS > 0:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_LOOKUP_WORKERS, thread_name_prefix="db-lookup")
+    return _executor
+
+def gather(*calls):
+    """
+    Run independent lookups concurrently and return their results in order
+
+    pymongo releases the GIL while it waits on the server, so lookups on the
+    pool overlap their round trips. The first call runs in the calling thread.
+    Each call sees the caller's context variables (request ID, cost tracking).
+
+    Args:
+        *calls: Zero-argument callables, e.g. lambdas over model methods
+
+    Returns:
+        list: Each call's result
+
+    Raises:
+        Exception: The first failing call's exception, once every call has finished
+    """
+    executor = get_lookup_executor()
+    if executor is None or len(calls) < 2:
+        return [call() for call in calls]
+    futures = [executor.submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    try:
+        first = calls[0]()
+    finally:
+        wait(futures)
+    return [first] + [future.result() for future in futures]
+
+async def run_lookup(fn, *args, **kwargs):
+    """Await a blocking model call on the lookup pool"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_lookup_executor(), call)
+
+class AsyncModel:
+    """
+    Awaitable versions of a model's static methods, for async workflow nodes
+
+    Each call runs the synchronous method on the lookup pool, so independent
+    queries can be awaited together:
+
+        patient, doctor = await asyncio.gather(AsyncPatient.find_by_phone(phone),
+                                               AsyncDoctor.find_by_id(doctor_id))
+    """
+
+    def __init__(self, model):
+        self._model = model
+
+    def __getattr__(self, name):
+        method = getattr(self._model, name)
+        if not callable(method):
+            raise AttributeError(f"{self._model.__name__}.{name} is not a method")
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await run_lookup(method, *args, **kwargs)
+        return call
+
+AsyncPatient = AsyncModel(Patient)
+AsyncDoctor = AsyncModel(Doctor)
+AsyncAppointment = AsyncModel(Appointment)
@@ -0,0 +1,276 @@
+import re
+import datetime
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from app.keywords import keyword_tags
+
+# Upper bound on cached (text, reference date) resolutions
+DATE_RESOLVER_CACHE_SIZE = 4096
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3,
+    "april": 4, "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7,
+    "august": 8, "aug": 8, "september": 9, "sept": 9, "sep": 9,
+    "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12
+}
+
+# Full weekday names resolve with more confidence than abbreviations like "sat"
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tues": 1, "tue": 1, "wednesday": 2, "wed": 2,
+    "thursday": 3, "thurs": 3, "thur": 3, "thu": 3, "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5, "sunday": 6, "sun": 6
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10
+}
+
+# Default times for vague mentions, as the appointment agent has always used
+PART_OF_DAY_TIMES = {
+    "morning": "09:00",
+    "afternoon": "14:00",
+    "evening": "16:00",
+    "night": "16:30",
+    "lunch": "12:00",
+    "breakfast": "08:00",
+    "dinner": "18:00"
+}
+
+# A bare hour ("at 3") is read as clinic hours: up to this hour means PM
+BARE_HOUR_PM_UNTIL = 7
+
+def _alternation(words):
+    """Regex alternation that prefers longer words ("tues" before "tue")"""
+    return "|".join(sorted(words, key=len, reverse=True))
+
+_MONTH = _alternation(MONTHS)
+_WEEKDAY = _alternation(WEEKDAYS)
+_NUMBER = r"\d{1,2}|" + _alternation(NUMBER_WORDS)
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+class DateTimeResolution(NamedTuple):
+    """A resolved appointment date and time with per-part confidence"""
+    date: Optional[str]        # YYYY-MM-DD
+    time: Optional[str]        # HH:MM (24-hour)
+    action: str                # "schedule", "reschedule" or "cancel"
+    date_confidence: float
+    time_confidence: float
+
+    @property
+    def confidence(self):
+        """Confidence in what was found; 0.0 when nothing was found"""
+        found = [c for value, c in ((self.date, self.date_confidence), (self.time, self.time_confidence)) if value]
+        return min(found) if found else 0.0
+
+    @property
+    def complete(self):
+        return bool(self.date and self.time)
+
+def _future_date(year, month, day, reference):
+    """Build a date, rolling a year-less date that has already passed into next year"""
+    value = datetime.date(year, month, day)
+    if value < reference:
+        value = datetime.date(year + 1, month, day)
+    return value
+
+def _iso(match, reference):
+    return datetime.date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+def _month_slash_day(match, reference):
+    month, day, year = int(match.group(1)), int(match.group(2)), match.group(3)
+    if year:
+        year = int(year)
+        return datetime.date(year + 2000 if year < 100 else year, month, day)
+    return _future_date(reference.year, month, day, reference)
+
+def _month_name_day(match, reference):
+    month, day, year = MONTHS[match.group(1)], int(match.group(2)), match.group(3)
+    if year:
+        return datetime.date(int(year), month, day)
+    return _future_date(reference.year, month, day, reference)
+
+def _day_month_name(match, reference):
+    day, month, year = int(match.group(1)), MONTHS[match.group(2)], match.group(3)
+    if year:
+        return datetime.date(int(year), month, day)
+    return _future_date(reference.year, month, day, reference)
+
+def _offset(days):
+    return lambda match, reference: reference + datetime.timedelta(days=days)
+
+def _in_n(match, reference):
+    count = match.group(1)
+    count = int(count) if count.isdigit() else NUMBER_WORDS[count]
+    unit = 7 if match.group(2).startswith("week") else 1
+    return reference + datetime.timedelta(days=count * unit)
+
+def _weekday(match, reference):
+    # The next occurrence after today; naming today's weekday means next week
+    days_ahead = WEEKDAYS[match.group(1)] - reference.weekday()
+    if days_ahead <= 0:
+        days_ahead += 7
+    return reference + datetime.timedelta(days=days_ahead)
+
+def _ordinal_day(match, reference):
+    # "the 15th" is the next 15th, skipping months that are too short
+    day = int(match.group(1))
+    year, month = reference.year, reference.month
+    if day < reference.day:
+        month += 1
+    for _ in range(12):
+        if month > 12:
+            year, month = year + 1, 1
+        try:
+            return datetime.date(year, month, day)
+        except ValueError:
+            month += 1
+    return None
+
+# Date grammar: (pattern, resolver, confidence), most specific first
+DATE_RULES = [
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), _iso, 1.0),
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2}|\d{4}))?\b"), _month_slash_day, 0.9),
+    (re.compile(rf"\b({_MONTH})\.?\s+(\d{{1,2}}){_ORDINAL}(?:,?\s+(\d{{4}}))?\b"), _month_name_day, 0.95),
+    (re.compile(rf"\b(\d{{1,2}}){_ORDINAL}\s+(?:of\s+)?({_MONTH})\b\.?(?:,?\s+(\d{{4}}))?"), _day_month_name, 0.95),
+    (re.compile(r"\bday after tomorrow\b"), _offset(2), 0.95),
+    (re.compile(r"\btomorrow\b"), _offset(1), 0.95),
+    (re.compile(r"\btoday\b"), _offset(0), 0.95),
+    (re.compile(rf"\bin\s+({_NUMBER})\s+(days?|weeks?)\b"), _in_n, 0.9),
+    (re.compile(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b"), _weekday, 0.95),
+    (re.compile(rf"\b({_WEEKDAY})\b"), _weekday, 0.7),
+    (re.compile(r"\bthe\s+(\d{1,2})(?:st|nd|rd|th)\b"), _ordinal_day, 0.8),
+    (re.compile(r"\bnext week\b"), _offset(7), 0.5)
+]
+
+def _meridiem(hour, marker):
+    hour %= 12
+    return hour + 12 if marker == "p" else hour
+
+def _hh_mm_meridiem(match, text):
+    return _meridiem(int(match.group(1)), match.group(3)), int(match.group(2))
+
+def _hour_meridiem(match, text):
+    return _meridiem(int(match.group(1)), match.group(2)), 0
+
+def _hh_mm(match, text):
+    return int(match.group(1)), int(match.group(2))
+
+def _bare_hour(hour, text):
+    """Read an hour without am/pm, using a nearby part of day or clinic hours"""
+    if hour > 12:
+        return hour
+    if "morning" in text:
+        return hour % 12
+    if "afternoon" in text or "evening" in text or "night" in text:
+        return hour % 12 + 12
+    if hour == 12:
+        return 12
+    return hour + 12 if hour <= BARE_HOUR_PM_UNTIL else hour
+
+def _half_past(match, text):
+    return _bare_hour(int(match.group(1)), text), 30
+
+def _at_hour(match, text):
+    return _bare_hour(int(match.group(1)), text), 0
+
+def _fixed(hour, minute=0):
+    return lambda match, text: (hour, minute)
+
+def _part_of_day(match, text):
+    hour, minute = PART_OF_DAY_TIMES[match.group(1)].split(":")
+    return int(hour), int(minute)
+
+# Time grammar: (pattern, resolver, confidence), most specific first. Minutes
+# are matched before bare hours so "2:30 pm" never reads as "30 pm".
+TIME_RULES = [
+    (re.compile(r"\b(\d{1,2})[:.](\d{2})\s*([ap])\.?\s?m\b\.?"), _hh_mm_meridiem, 1.0),
+    (re.compile(r"\b(\d{1,2})\s*([ap])\.?\s?m\b\.?"), _hour_meridiem, 1.0),
+    (re.compile(r"\b([01]?\d|2[0-3])[:.]([0-5]\d)\b"), _hh_mm, 0.9),
+    (re.compile(r"\b(?:noon|midday)\b"), _fixed(12), 0.95),
+    (re.compile(r"\bhalf past (\d{1,2})\b"), _half_past, 0.8),
+    (re.compile(r"\b(\d{1,2})\s*o'?clock\b"), _at_hour, 0.7),
+    (re.compile(r"\b(?:at|around|by)\s+(\d{1,2})\b(?![:./\d])"), _at_hour, 0.6),
+    (re.compile(rf"\b({_alternation(PART_OF_DAY_TIMES)})\b"), _part_of_day, 0.5)
+]
+
+@lru_cache(maxsize=DATE_RESOLVER_CACHE_SIZE)
+def _resolve_date(text, reference):
+    for pattern, resolver, confidence in DATE_RULES:
+        for match in pattern.finditer(text):
+            try:
+                value = resolver(match, reference)
+            except (ValueError, KeyError):
+                # e.g. "february 30"; keep looking with the other rules
+                continue
+            if value is not None:
+                return value.isoformat(), confidence
+    return None, 0.0
+
+@lru_cache(maxsize=DATE_RESOLVER_CACHE_SIZE)
+def _resolve_time(text):
+    for pattern, resolver, confidence in TIME_RULES:
+        for match in pattern.finditer(text):
+            hour, minute = resolver(match, text)
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                return f"{hour:02d}:{minute:02d}", confidence
+    return None, 0.0
+
+def _reference_date(reference):
+    if reference is None:
+        return datetime.date.today()
+    if isinstance(reference, datetime.datetime):
+        return reference.date()
+    return reference
+
+def resolve_date(text, reference=None):
+    """
+    Resolve a natural language date ("next friday", "March 15th", "3/15")
+
+    Args:
+        text: The text mentioning a date
+        reference: Date that relative expressions count from (defaults to today)
+
+    Returns:
+        tuple: (YYYY-MM-DD or None, confidence)
+    """
+    return _resolve_date((text or "").lower(), _reference_date(reference))
+
+def resolve_time(text):
+    """
+    Resolve a natural language time ("2:30 pm", "at 3", "afternoon")
+
+    Returns:
+        tuple: (HH:MM or None, confidence)
+    """
+    return _resolve_time((text or "").lower())
+
+def resolve_date_time(text, reference=None):
+    """
+    Resolve the appointment date, time and action mentioned in a transcript
+
+    Results are memoized per (text, reference date), so re-reading the same
+    turn costs a dictionary lookup.
+
+    Args:
+        text: The patient's transcript
+        reference: Date that relative expressions count from (defaults to today)
+
+    Returns:
+        DateTimeResolution: The resolved values with confidence
+    """
+    return _resolve_date_time((text or "").lower(), _reference_date(reference))
+
+@lru_cache(maxsize=DATE_RESOLVER_CACHE_SIZE)
+def _resolve_date_time(text, reference):
+    tags = keyword_tags(text)
+    if "cancel_action" in tags:
+        action = "cancel"
+    elif "change_action" in tags:
+        action = "reschedule"
+    else:
+        action = "schedule"
+
+    date, date_confidence = _resolve_date(text, reference)
+    time, time_confidence = _resolve_time(text)
+    return DateTimeResolution(date, time, action, date_confidence, time_confidence)
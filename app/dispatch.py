@@ -0,0 +1,70 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Most node steps one turn may take, as LangGraph's default recursion limit
+DISPATCH_STEP_LIMIT = 25
+
+class DirectDispatchGraph:
+    """
+    Run a workflow's nodes and routers in a plain loop, without LangGraph
+
+    Built from the same node functions and routing table as the StateGraph and
+    follows the same state semantics for a graph whose channels all keep their
+    last value:
+
+    - only keys in the state schema are carried between nodes; anything else a
+      node returns is dropped (values are shared, not copied)
+    - each node gets a fresh dict of the keys set so far
+    - a router sees the state after its node, plus any extra keys that node
+      returned (e.g. `needs_notification`); its own changes are discarded
+
+    Like the compiled graph, `invoke(state)` returns the final state.
+    """
+
+    def __init__(self, nodes, routes, entry_point, state_keys, step_limit=DISPATCH_STEP_LIMIT):
+        """
+        Args:
+            nodes: {name: fn(state) -> state}
+            routes: {name: router(state) -> next name, or a fixed next name}; nodes
+                without a route end the turn
+            entry_point: Name of the first node
+            state_keys: Keys of the state schema
+            step_limit: Most nodes one invocation may run
+        """
+        for name, route in routes.items():
+            if name not in nodes or (isinstance(route, str) and route not in nodes):
+                raise ValueError(f"Route {name} -> {route} refers to an unknown node")
+        self.nodes = nodes
+        self.routes = routes
+        self.entry_point = entry_point
+        self.state_keys = tuple(state_keys)
+        self.step_limit = step_limit
+
+    def _channels(self, values):
+        return {key: values[key] for key in self.state_keys if key in values}
+
+    def invoke(self, input_state):
+        """
+        Run one turn
+
+        Args:
+            input_state: The initial state; keys outside the schema are ignored
+
+        Returns:
+            dict: The final state (schema keys only)
+        """
+        state = self._channels(input_state)
+        node = self.entry_point
+        for _ in range(self.step_limit):
+            output = self.nodes[node](dict(state)) or {}
+            state.update(self._channels(output))
+
+            route = self.routes.get(node)
+            if route is None:
+                return state
+            node = route if isinstance(route, str) else route({**state, **output})
+            if node not in self.nodes:
+                raise ValueError(f"Router returned unknown node {node!r}")
+
+        raise RuntimeError(f"Workflow did not finish within {self.step_limit} steps")
@@ -0,0 +1,170 @@
+import re
+from functools import lru_cache
+from app.phrase_matcher import PhraseMatcher
+
+# Every keyword list the agents use to route a turn. Phrases match anywhere in
+# the lowercased transcript (the same semantics as `phrase in transcript`).
+LEXICONS = {
+    # Receptionist
+    "appointment_request": [
+        "appoint", "book", "schedule", "see a doctor", "see the doctor",
+        "come in", "visit", "consultation", "check-up", "checkup"
+    ],
+    "reschedule_request": [
+        "reschedule", "change appointment", "move appointment",
+        "change my appointment", "move my appointment", "change the time",
+        "different time", "different date", "new time", "new date",
+        "another time", "another date", "postpone"
+    ],
+    "appointment_noun": ["appointment", "visit", "meeting", "consultation"],
+    "change_verb": ["change", "move", "switch", "reschedule"],
+    "reschedule_fallback": ["reschedule", "change appointment", "move appointment"],
+    "schedule_fallback": ["appointment", "book", "schedule"],
+
+    # Receptionist, during an appointment flow: what may take the turn out of it
+    "emergency": [
+        "ambulance", "can't breathe", "cannot breathe", "heart attack", "overdose",
+        "bleeding heavily", "suicid"
+    ],
+    # Conditions that may be happening now or be a past one ("I had a stroke last year")
+    "possible_emergency": ["emergency", "stroke", "seizure", "unconscious"],
+    "out_of_scope": [
+        "office hours", "opening hours", "your hours", "are you open", "insurance", "how much",
+        "price", "billing", "parking", "your address", "clinic address", "directions", "services",
+        "never mind", "nevermind", "forget it", "something else", "another question",
+        "real person", "speak to someone", "talk to someone"
+    ],
+
+    # Explicit flow switches (workflow and appointment agent)
+    "cancel": ["cancel"],
+    "reschedule": ["reschedule", "change appointment"],
+
+    # Appointment agent, initial state
+    "cancel_request": [
+        "cancel", "delete", "remove", "stop appointment", "no longer need",
+        "don't need the appointment"
+    ],
+    "reschedule_initial": [
+        "reschedule", "change", "different time", "different date", "another day",
+        "move appointment"
+    ],
+    "booking_request": ["book", "schedule", "make", "new appointment", "set up", "arrange"],
+
+    # Appointment agent, confirmations and follow-ups
+    "confirm": ["yes", "confirm"],
+    "confirm_or_correct": ["yes", "confirm", "correct"],
+    "disagree": ["no", "different", "other", "change", "another", "not that"],
+    "acknowledgement": [
+        "thank", "thanks", "great", "good", "excellent", "ok", "okay", "perfect",
+        "bye", "goodbye"
+    ],
+    "reschedule_followup": ["reschedule", "change", "different time", "different date", "another day"],
+    "cancel_followup": ["cancel", "delete", "remove", "stop"],
+    "new_booking": ["new appointment", "another appointment", "book again", "schedule again"],
+    "rebook": ["reschedule", "new", "book", "make", "schedule"],
+
+    # Appointment agent, date/time extraction
+    "cancel_action": ["cancel", "delete", "remove"],
+    "change_action": ["reschedule", "change", "move"],
+
+    # Call center
+    "health": [
+        "pain", "hurt", "sick", "fever", "headache", "cough", "symptom",
+        "heart", "blood", "doctor", "medicine", "prescription", "allergy",
+        "condition", "medical", "health", "treatment", "cancer", "disease",
+        "infection", "diagnosis", "surgery", "emergency", "specialist",
+        "test", "lab", "results"
+    ],
+    "doctor_recommendation": [
+        "which doctor", "recommend a doctor", "suggest a doctor", "which specialist",
+        "need a doctor for", "doctor would you suggest", "doctor should i see",
+        "specialist for", "what kind of doctor"
+    ]
+}
+
+# Lexicons that need a regex rather than a literal phrase
+REGEX_LEXICONS = {
+    "date_time": [
+        r'\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
+        r'\b(tomorrow|today|next week)\b',
+        r'\b\d{1,2}:\d{2}\b',  # time format like 9:30
+        r'\b\d{1,2} (am|pm)\b',  # time format like 10 am
+        r'\b(january|february|march|april|may|june|july|august|september|october|november|december)\b'
+    ],
+    # 911 on its own, not inside a phone number or an ID like 555-911-2345
+    "emergency": [r'(?<![\d-])911(?![\d-])']
+}
+
+# Upper bound on distinct transcripts whose tags are kept around
+KEYWORD_CACHE_SIZE = 2048
+
+class KeywordEngine:
+    """
+    Tag a transcript with every lexicon it mentions in a single pass
+
+    All phrases from all lexicons are compiled into one trie regex. Scanning the
+    transcript once yields the longest phrase starting at each position; every
+    shorter phrase sharing that start is one of its prefixes, so each phrase
+    carries the tags of its prefixes too and no match is lost.
+    """
+
+    def __init__(self, lexicons, regex_lexicons=None):
+        phrase_tags = {}
+        for tag, phrases in lexicons.items():
+            for phrase in phrases:
+                phrase_tags.setdefault(phrase.lower(), set()).add(tag)
+
+        self.matcher = PhraseMatcher(phrase_tags, mode="substring")
+
+        # Fold prefix tags in once, so tagging never has to walk the vocabulary
+        self.phrase_tags = {}
+        for phrase in phrase_tags:
+            tags = set()
+            for prefix in self.matcher.prefixes(phrase):
+                tags |= phrase_tags[prefix]
+            self.phrase_tags[phrase] = frozenset(tags)
+
+        self.regex_lexicons = {
+            tag: re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+            for tag, patterns in (regex_lexicons or {}).items()
+        }
+        self.tags = lru_cache(maxsize=KEYWORD_CACHE_SIZE)(self._tags)
+
+    def _tags(self, text):
+        """
+        Get the set of lexicon names mentioned in a lowercase transcript
+
+        Args:
+            text: The lowercased transcript
+
+        Returns:
+            frozenset: Names of every lexicon with at least one match
+        """
+        tags = set()
+        for _, _, phrase in self.matcher.finditer(text):
+            tags |= self.phrase_tags[phrase]
+        for tag, regex in self.regex_lexicons.items():
+            if regex.search(text):
+                tags.add(tag)
+        return frozenset(tags)
+
+ENGINE = KeywordEngine(LEXICONS, REGEX_LEXICONS)
+
+def keyword_tags(transcript):
+    """
+    Get the lexicon tags for a transcript
+
+    Results are cached, so every agent that asks about the same turn shares a
+    single scan of the transcript.
+
+    Args:
+        transcript: The raw transcript (any case)
+
+    Returns:
+        frozenset: Names of the lexicons the transcript mentions
+    """
+    return ENGINE.tags((transcript or "").lower())
+
+def has_keyword(transcript, lexicon):
+    """Check whether a transcript mentions any phrase from a lexicon"""
+    return lexicon in keyword_tags(transcript)
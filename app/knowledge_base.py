@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import math
+import time
+import logging
+import threading
+from collections import Counter
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# FAQ entries: {category: {"question": [phrases], "answer": text}}
+KNOWLEDGE_BASE_PATH = os.getenv(
+    "KNOWLEDGE_BASE_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "knowledge_base.json")
+)
+
+# A query must cover at least this share of a question's weight to be answered
+KNOWLEDGE_BASE_MIN_SCORE = float(os.getenv("KNOWLEDGE_BASE_MIN_SCORE", "0.6"))
+
+# How often (seconds) the data file is checked for edits
+KNOWLEDGE_BASE_RELOAD_SECONDS = float(os.getenv("KNOWLEDGE_BASE_RELOAD_SECONDS", "5"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Tokens in more than this share of questions (and at least COMMON_TOKEN_MIN_DF
+# of them) are too common to find candidates with; they only add to the score
+COMMON_TOKEN_RATIO = 0.05
+COMMON_TOKEN_MIN_DF = 50
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+def tokenize(text):
+    """Split text into lowercase word tokens, so "hi" never matches inside "this\""""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class KnowledgeBaseIndex:
+    """
+    Inverted index over FAQ question phrases with BM25 scoring
+
+    Every question phrase is a document. Per-posting BM25 weights are computed
+    when the index is built. Candidates are found through the postings of the
+    query's discriminative tokens only; common tokens ("what", "the") are then
+    added from each candidate's own weights. Lookup cost therefore tracks the
+    handful of phrases sharing a rare word with the query, not the FAQ size.
+
+    A phrase's score is normalised by its score against itself, giving the
+    share of the phrase the query covers (0..1); the best phrase above the
+    threshold wins, with the raw score breaking ties in favour of longer matches.
+    """
+
+    def __init__(self, entries, min_score=KNOWLEDGE_BASE_MIN_SCORE):
+        self.entries = entries
+        self.min_score = min_score
+
+        documents = []
+        for category, data in entries.items():
+            for phrase in data.get("question", []):
+                tokens = tokenize(phrase)
+                if tokens:
+                    documents.append((category, Counter(tokens), len(tokens)))
+
+        self.categories = [category for category, _, _ in documents]
+        total = len(documents)
+        average_length = sum(length for _, _, length in documents) / total if total else 0
+
+        document_frequency = Counter()
+        for _, counts, _ in documents:
+            document_frequency.update(counts.keys())
+
+        self.postings = {}
+        self.doc_weights = []
+        self.self_scores = []
+        for doc_id, (_, counts, length) in enumerate(documents):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+            self_score = 0.0
+            weights = {}
+            for token, tf in counts.items():
+                df = document_frequency[token]
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                weight = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                self.postings.setdefault(token, []).append((doc_id, weight))
+                weights[token] = weight
+                self_score += weight
+            self.doc_weights.append(weights)
+            self.self_scores.append(self_score)
+
+        common_df = max(COMMON_TOKEN_MIN_DF, COMMON_TOKEN_RATIO * total)
+        self.common_tokens = frozenset(token for token, df in document_frequency.items() if df > common_df)
+        # Phrases made only of common words can't be reached through a rare token
+        self.common_only = [
+            doc_id for doc_id, weights in enumerate(self.doc_weights)
+            if self.common_tokens.issuperset(weights)
+        ]
+
+        self.lookup = lru_cache(maxsize=2048)(self._lookup)
+
+    @classmethod
+    def from_file(cls, path, min_score=KNOWLEDGE_BASE_MIN_SCORE):
+        with open(path, "r") as f:
+            return cls(json.load(f), min_score)
+
+    def search(self, query, limit=3):
+        """
+        Score the question phrases against a query
+
+        Args:
+            query: The patient's question
+            limit: Number of results to return
+
+        Returns:
+            list: Up to `limit` (category, coverage, raw_score) tuples, best first
+        """
+        tokens = {token for token in tokenize(query) if token in self.postings}
+        rare = tokens - self.common_tokens
+        common = tokens & self.common_tokens
+
+        scores = {}
+        for token in rare:
+            for doc_id, weight in self.postings[token]:
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        for doc_id in self.common_only:
+            scores.setdefault(doc_id, 0.0)
+
+        # Common tokens only add to candidates that were already found
+        if common:
+            for doc_id in scores:
+                weights = self.doc_weights[doc_id]
+                scores[doc_id] += sum(weights.get(token, 0.0) for token in common)
+        scores = {doc_id: score for doc_id, score in scores.items() if score > 0}
+
+        ranked = sorted(
+            ((score / self.self_scores[doc_id], score, doc_id) for doc_id, score in scores.items()),
+            reverse=True
+        )
+
+        results = []
+        seen = set()
+        for coverage, score, doc_id in ranked:
+            category = self.categories[doc_id]
+            if category in seen:
+                continue
+            seen.add(category)
+            results.append((category, coverage, score))
+            if len(results) == limit:
+                break
+        return results
+
+    def _lookup(self, query):
+        """
+        Find the FAQ answer for a query, if one scores above the threshold
+
+        Returns:
+            tuple: (category, answer, coverage) or None when nothing matched well enough
+        """
+        results = self.search(query, limit=1)
+        if not results:
+            return None
+        category, coverage, _ = results[0]
+        if coverage < self.min_score:
+            return None
+        return category, self.entries[category]["answer"], coverage
+
+class KnowledgeBase:
+    """Hot-reloading wrapper: rebuilds the index whenever the data file changes"""
+
+    def __init__(self, path=KNOWLEDGE_BASE_PATH, reload_seconds=KNOWLEDGE_BASE_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.index = KnowledgeBaseIndex({})
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self, force=True):
+        """Rebuild the index from the data file if it changed (or always, when forced)"""
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.path.getmtime(self.path)
+                if not force and mtime == self._mtime:
+                    return False
+                index = KnowledgeBaseIndex.from_file(self.path)
+            except Exception as e:
+                logger.error(f"Failed to load knowledge base from {self.path}: {e}")
+                return False
+
+            # Swap in the new index in one assignment; readers never see a partial build
+            self.index = index
+            self._mtime = mtime
+            logger.info(f"Knowledge base loaded: {len(index.entries)} entries, {len(index.categories)} questions")
+            return True
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._checked >= self.reload_seconds:
+            self.reload(force=False)
+
+    def lookup(self, query):
+        """Find the answer to a query; see KnowledgeBaseIndex._lookup"""
+        self._maybe_reload()
+        return self.index.lookup(query.lower().strip())
+
+    def search(self, query, limit=3):
+        self._maybe_reload()
+        return self.index.search(query, limit)
+
+_knowledge_base = None
+
+def get_knowledge_base():
+    """Get the shared knowledge base, loading it on first use"""
+    global _knowledge_base
+    if _knowledge_base is None:
+        _knowledge_base = KnowledgeBase()
+    return _knowledge_base
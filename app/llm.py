@@ -0,0 +1,67 @@
+import os
+import time
+from openai import OpenAI
+from app.telemetry import record_generation
+from app.metrics import LLM_LATENCY, LLM_TOKENS
+from app.costs import record_llm_usage
+
+# Shared OpenAI client for every agent
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+def usage_details(response):
+    """Token counts from an OpenAI response in the shape Langfuse expects"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    return {
+        "input": usage.prompt_tokens,
+        "output": usage.completion_tokens,
+        "total": usage.total_tokens
+    }
+
+def chat_completion(name, messages, model="gpt-4o", metadata=None, **params):
+    """
+    Call the chat completions API and record the generation for cost tracking
+
+    Latency and token counts also go to the /metrics histograms, labelled by
+    call site and model, and to the cost ledger against the current conversation.
+
+    Every call is recorded by the shared telemetry sink, which exports the
+    generation in the background, so call sites need no tracking code of their
+    own and nothing on this path waits for Langfuse.
+
+    Args:
+        name: Name of the call site, used as the generation name
+        messages: Chat messages
+        model: Model to call
+        metadata: Extra metadata for the generation
+        **params: Passed to the API (temperature, max_tokens, ...)
+
+    Returns:
+        The OpenAI response
+    """
+    started = time.perf_counter()
+    try:
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+    except Exception:
+        LLM_LATENCY.observe(time.perf_counter() - started, name=name, model=model, outcome="error")
+        raise
+    elapsed = time.perf_counter() - started
+    latency_ms = elapsed * 1000
+    LLM_LATENCY.observe(elapsed, name=name, model=model, outcome="success")
+
+    usage = usage_details(response)
+    for kind in ("input", "output"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], model=model, kind=kind)
+    record_llm_usage(name, model, usage)
+
+    record_generation(
+        name,
+        model,
+        messages,
+        response.choices[0].message.content,
+        usage,
+        {**params, **(metadata or {}), "latency_ms": round(latency_ms, 1)}
+    )
+    return response
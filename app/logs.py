@@ -0,0 +1,146 @@
+import os
+import re
+import sys
+import json
+import uuid
+import random
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Root log level and output format ("text" or "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Share of requests (0.0 - 1.0) that log at DEBUG regardless of LOG_LEVEL
+LOG_TRACE_SAMPLE_RATE = float(os.getenv("LOG_TRACE_SAMPLE_RATE", "0.0"))
+
+# Patient details (names, contact details, transcripts, state) are redacted unless enabled
+LOG_PHI = os.getenv("LOG_PHI", "false").lower() in ("1", "true", "yes")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Last line of defence for PHI logged without phi(): email addresses in emitted messages
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+class RequestContext:
+    """Correlation IDs for the request being handled, and whether it's traced"""
+
+    def __init__(self, request_id, conversation_id=None, trace=False):
+        self.request_id = request_id
+        self.conversation_id = conversation_id
+        self.trace = trace
+
+_request = ContextVar("log_request", default=None)
+
+def current_request():
+    return _request.get()
+
+@contextmanager
+def request_context(request_id=None, conversation_id=None, trace=None):
+    """
+    Tag log records made inside the block with a request ID (and conversation ID)
+
+    Args:
+        request_id: Correlation ID; a new one is generated when not given
+        conversation_id: Conversation the request belongs to
+        trace: Log at DEBUG for this request; sampled at LOG_TRACE_SAMPLE_RATE when None
+    """
+    token = bind_request(request_id, conversation_id, trace)
+    try:
+        yield _request.get()
+    finally:
+        unbind_request(token)
+
+def bind_request(request_id=None, conversation_id=None, trace=None):
+    """
+    Start a request context without a with-block (for framework hooks)
+
+    Returns:
+        A token for `unbind_request`
+    """
+    if trace is None:
+        trace = LOG_TRACE_SAMPLE_RATE > 0 and random.random() < LOG_TRACE_SAMPLE_RATE
+    return _request.set(RequestContext(request_id or uuid.uuid4().hex[:12], conversation_id, trace))
+
+def unbind_request(token):
+    _request.reset(token)
+
+class PHI:
+    """A value that is only rendered into log messages when LOG_PHI is enabled"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return str(self.value) if LOG_PHI else "[redacted]"
+
+    def __repr__(self):
+        return repr(self.value) if LOG_PHI else "[redacted]"
+
+def phi(value):
+    """Mark a log argument as protected health information"""
+    return PHI(value)
+
+def debug_logger(name):
+    """
+    Get a debug function for a module that costs nothing when debug output is off
+
+    The returned function takes a %-style message and its arguments. Unless
+    the logger is enabled for DEBUG or the current request is traced, it
+    returns before the message is formatted or anything is written.
+    """
+    logger = logging.getLogger(name)
+
+    def debug(message, *args, exc_info=False):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(message, *args, exc_info=exc_info)
+            return
+        context = _request.get()
+        if context is None or not context.trace:
+            return
+        # Traced request: bypass the logger's level, not its handlers
+        logger.handle(logger.makeRecord(logger.name, logging.DEBUG, "(trace)", 0, message, args,
+                                        sys.exc_info() if exc_info else None))
+
+    debug.logger = logger
+    return debug
+
+class ContextFilter(logging.Filter):
+    """Add request_id/conversation_id to every record and scrub email addresses"""
+
+    def filter(self, record):
+        context = _request.get()
+        record.request_id = context.request_id if context else "-"
+        record.conversation_id = context.conversation_id if context else None
+        if not LOG_PHI:
+            message = record.getMessage()
+            if "@" in message:
+                record.msg, record.args = EMAIL_PATTERN.sub("[email]", message), ()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if getattr(record, "conversation_id", None):
+            entry["conversation_id"] = record.conversation_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Install the root handler with correlation IDs, PHI scrubbing and the chosen format"""
+    handler = logging.StreamHandler()
+    handler.addFilter(ContextFilter())
+    handler.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    logging.basicConfig(level=level, handlers=[handler], force=True)
@@ -0,0 +1,255 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from pymongo import monitoring
+
+# Latency buckets in seconds, from sub-millisecond lookups to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label values outside these sets are reported as "other", keeping series bounded
+KNOWN_INTENTS = frozenset([
+    "schedule_appointment", "book_appointment", "reschedule_appointment", "cancel_appointment",
+    "general_inquiry", "health_question", "emergency", "other"
+])
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels
+
+    observe() is a bisect and three additions under a lock, cheap enough to
+    wrap every node, model call and database command.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (plus +Inf), sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Time a block; labels can be added to the yielded dict before it ends"""
+        labels = dict(labels)
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class CallbackGauge:
+    """Gauge read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {_number(self.callback())}")
+        except Exception:
+            pass
+        return lines
+
+REGISTRY = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Metrics
+
+NODE_LATENCY = register(Histogram(
+    "medagent_node_duration_seconds",
+    "Time spent in each LangGraph node",
+    ["node", "intent", "appointment_state"]
+))
+
+APPOINTMENT_STATE_LATENCY = register(Histogram(
+    "medagent_appointment_state_duration_seconds",
+    "Time spent in each appointment state handler",
+    ["state", "next_state"]
+))
+
+CHECKPOINT_SIZE = register(Histogram(
+    "medagent_checkpoint_size_bytes",
+    "Encoded size of each saved conversation checkpoint",
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 65536)
+))
+
+TURN_LATENCY = register(Histogram(
+    "medagent_turn_duration_seconds",
+    "Time to run the workflow for one conversation turn",
+    ["intent", "appointment_state"]
+))
+
+LLM_LATENCY = register(Histogram(
+    "medagent_llm_duration_seconds",
+    "OpenAI call latency",
+    ["name", "model", "outcome"]
+))
+
+INTENT_CLASSIFICATIONS = register(Counter(
+    "medagent_intent_classifications_total",
+    "Receptionist turns by how their intent was found",
+    ["mode"]
+))
+
+LLM_TOKENS = register(Counter(
+    "medagent_llm_tokens_total",
+    "Tokens used by OpenAI calls",
+    ["model", "kind"]
+))
+
+MONGO_LATENCY = register(Histogram(
+    "medagent_mongo_command_duration_seconds",
+    "MongoDB command latency",
+    ["command", "collection", "outcome"]
+))
+
+HTTP_LATENCY = register(Histogram(
+    "medagent_outbound_duration_seconds",
+    "Latency of outbound calls to external services",
+    ["service", "outcome"]
+))
+
+def intent_label(intent):
+    """Clamp an intent to the known set so a bad classification can't add series"""
+    if not intent:
+        return "none"
+    return intent if intent in KNOWN_INTENTS else "other"
+
+def appointment_state_label(state):
+    context = state.get("appointment_context") if isinstance(state, dict) else None
+    if not isinstance(context, dict):
+        return "none"
+    return context.get("state") or "none"
+
+def instrument_node(name, fn):
+    """
+    Wrap a LangGraph node so each call is timed into NODE_LATENCY
+
+    Labels come from the state the node returns, so the receptionist is
+    recorded under the intent it classified.
+    """
+    def node(state):
+        started = time.perf_counter()
+        result = state
+        try:
+            result = fn(state)
+            return result
+        finally:
+            labelled = result if isinstance(result, dict) else state
+            NODE_LATENCY.observe(time.perf_counter() - started, node=name,
+                                 intent=intent_label(labelled.get("intent")),
+                                 appointment_state=appointment_state_label(labelled))
+    node.__name__ = getattr(fn, "__name__", name)
+    node.__doc__ = fn.__doc__
+    return node
+
+@contextmanager
+def outbound(service):
+    """Time a call to an external service into HTTP_LATENCY; outcome is "error" if it raises"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        HTTP_LATENCY.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo listener feeding MONGO_LATENCY from the driver's own command timings"""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, outcome):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name,
+                              collection=collection, outcome=outcome)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "error")
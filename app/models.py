@@ -1,10 +1,19 @@
 from pymongo import MongoClient
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from dateutil.relativedelta import relativedelta
+from app.scheduling import schedule_for, earliest_slots, filter_slots
+from app.specialty_matcher import get_specialty_matcher
+from app.metrics import MongoCommandTimer
 
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"))
+# Connections per process. At peak every request thread and every lookup thread
+# (DB_LOOKUP_WORKERS, see app.data_access) holds one
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+
+# Connect to MongoDB; every command's latency is recorded for /metrics
+client = MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017/"), event_listeners=[MongoCommandTimer()],
+                     maxPoolSize=MONGODB_MAX_POOL_SIZE, minPoolSize=MONGODB_MIN_POOL_SIZE)
 db = client["medagent_db"]
 
 # Collections
@@ -12,6 +21,41 @@ patients_collection = db["patients"]
 doctors_collection = db["doctors"]
 appointments_collection = db["appointments"]
 
+# Only the fields needed to compute availability
+SCHEDULE_PROJECTION = {"schedule": 1, "available_slots": 1}
+
+def _weekdays(slots, days=("monday", "tuesday", "wednesday", "thursday", "friday")):
+    """Build a weekly template with the same slots on each of the given days"""
+    return {day: list(slots) for day in days}
+
+# Sample doctors with recurring weekly templates (format: weekday: [HH:MM slots])
+SAMPLE_DOCTORS = [
+    {
+        "name": "Dr. Smith",
+        "specialty": "General Practitioner",
+        "weekly": {
+            **_weekdays(["09:00", "10:00", "11:00", "14:00", "15:00", "16:00"]),
+            # The clinic is open Saturday mornings
+            "saturday": ["09:00", "10:00", "11:00"]
+        }
+    },
+    {
+        "name": "Dr. Johnson",
+        "specialty": "Cardiologist",
+        "weekly": _weekdays(["09:30", "10:30", "13:30", "15:30"])
+    },
+    {
+        "name": "Dr. Williams",
+        "specialty": "Dermatologist",
+        "weekly": _weekdays(["10:00", "11:00", "14:00", "15:00"])
+    },
+    {
+        "name": "Dr. Brown",
+        "specialty": "Pediatrician",
+        "weekly": _weekdays(["09:00", "10:00", "11:00", "15:00", "16:00"])
+    }
+]
+
 def calculate_age(birthdate):
     """Calculate age from birthdate"""
     if isinstance(birthdate, str):
@@ -108,72 +152,183 @@ class Doctor:
         """Find doctors by specialty"""
         return list(doctors_collection.find({"specialty": specialty}))
     
+    @staticmethod
+    def find_by_id(doctor_id, projection=None):
+        """Find a doctor by ID"""
+        return doctors_collection.find_one({"_id": doctor_id}, projection)
+    
+    @staticmethod
+    def get_schedule(doctor_id):
+        """Get the DoctorSchedule for a doctor, or None if the doctor doesn't exist"""
+        doctor = doctors_collection.find_one({"_id": doctor_id}, SCHEDULE_PROJECTION)
+        if not doctor:
+            return None
+        return schedule_for(doctor)
+    
+    @staticmethod
+    def get_booked_slots(doctor_id, start_date, end_date=None):
+        """
+        Get booked appointment times for a doctor in a date range
+        
+        Returns:
+            dict: Mapping of YYYY-MM-DD to a set of booked times
+        """
+        end_date = end_date or start_date
+        appointments = appointments_collection.find(
+            {
+                # Appointments store the doctor ID as a string, older ones as an ObjectId
+                "doctor_id": {"$in": [doctor_id, str(doctor_id)]},
+                "date": {"$gte": start_date, "$lte": end_date},
+                "status": {"$nin": ["cancelled"]}
+            },
+            {"date": 1, "time": 1, "_id": 0}
+        )
+        
+        booked = {}
+        for appt in appointments:
+            booked.setdefault(appt["date"], set()).add(appt["time"])
+        return booked
+    
     @staticmethod
     def get_available_slots(doctor_id, date):
         """Get available time slots for a doctor on a specific date"""
-        doctor = doctors_collection.find_one({"_id": doctor_id})
-        if not doctor:
+        schedule = Doctor.get_schedule(doctor_id)
+        if not schedule or not schedule.works_on(date):
             return []
         
-        # Get all available time slots from doctor's schedule
-        all_slots = doctor.get("available_slots", {}).get(date, [])
+        booked = Doctor.get_booked_slots(doctor_id, date).get(date, ())
+        return schedule.free_slots(date, booked)
+    
+    @staticmethod
+    def get_availability(doctor_id, start_date, days, max_dates=None, part_of_day=None, weekdays=None):
+        """
+        Get free slots for a doctor over a window of days
         
-        # Find booked slots on that date for this doctor
-        booked_appointments = appointments_collection.find({
-            "doctor_id": doctor_id,
-            "date": date
-        })
+        Args:
+            doctor_id: The doctor's ID
+            start_date: First date of the window (date or YYYY-MM-DD)
+            days: Number of days in the window
+            max_dates: Stop after this many dates with free slots
+            part_of_day: Optional "morning", "afternoon" or "evening" preference
+            weekdays: Optional weekday names (e.g. ["monday", "friday"]) to keep
+        
+        Returns:
+            list: [(YYYY-MM-DD, [slots])] for dates that still have free slots
+        """
+        schedule = Doctor.get_schedule(doctor_id)
+        if not schedule:
+            return []
         
-        booked_slots = [appt["time"] for appt in booked_appointments]
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end_date = start_date + timedelta(days=days - 1)
+        booked = Doctor.get_booked_slots(doctor_id, start_date.isoformat(), end_date.isoformat())
         
-        # Return only the available slots
-        return [slot for slot in all_slots if slot not in booked_slots]
+        availability = []
+        for date, _ in schedule.iter_days(start_date, days):
+            date_str = date.isoformat()
+            free = schedule.free_slots(date, booked.get(date_str, ()))
+            if part_of_day or weekdays:
+                free = filter_slots(date, free, part_of_day, weekdays)
+            if free:
+                availability.append((date_str, free))
+                if max_dates and len(availability) >= max_dates:
+                    break
+        return availability
     
     @staticmethod
-    def get_specialty_for_reason(reason):
-        """Recommend a doctor specialty based on the reason for visit"""
-        # This is a simplified mapping - in a real system this would be more sophisticated
-        reason_to_specialty = {
-            "headache": "Neurologist",
-            "migraine": "Neurologist",
-            "chest pain": "Cardiologist",
-            "heart": "Cardiologist",
-            "rash": "Dermatologist",
-            "skin": "Dermatologist",
-            "stomach": "Gastroenterologist",
-            "digestion": "Gastroenterologist",
-            "joint pain": "Orthopedic",
-            "bone": "Orthopedic",
-            "fracture": "Orthopedic",
-            "breathing": "Pulmonologist",
-            "cough": "Pulmonologist",
-            "vision": "Ophthalmologist",
-            "eye": "Ophthalmologist",
-            "ear": "ENT Specialist",
-            "throat": "ENT Specialist",
-            "nose": "ENT Specialist",
-            "mental health": "Psychiatrist",
-            "depression": "Psychiatrist",
-            "anxiety": "Psychiatrist",
-            "women's health": "Gynecologist",
-            "pregnancy": "Gynecologist",
-            "child": "Pediatrician",
-            "allergy": "Allergist",
-            "diabetes": "Endocrinologist",
-            "hormone": "Endocrinologist",
-            "kidney": "Nephrologist",
-            "urinary": "Urologist",
-            "cancer": "Oncologist"
-        }
+    def find_earliest_available(specialty, k=5, start_date=None, days=90, part_of_day=None, weekdays=None):
+        """
+        Find the earliest free slots across every doctor of a specialty
+        
+        Args:
+            specialty: The doctor specialty to search
+            k: Number of slots to return
+            start_date: First date to search (defaults to today)
+            days: Search horizon in days
+            part_of_day: Optional "morning", "afternoon" or "evening" preference
+            weekdays: Optional weekday names (e.g. ["monday", "friday"]) to keep
+        
+        Returns:
+            list: Dicts with doctor_id, doctor_name, date and time, earliest first
+        """
+        doctors = list(doctors_collection.find({"specialty": specialty}, {"name": 1, **SCHEDULE_PROJECTION}))
+        if not doctors:
+            return []
         
-        # Default to general practitioner if no specific match
-        reason_lower = reason.lower()
+        schedules = {str(doctor["_id"]): schedule_for(doctor) for doctor in doctors}
+        names = {str(doctor["_id"]): doctor.get("name", "") for doctor in doctors}
+        doctor_ids = [doctor["_id"] for doctor in doctors] + list(schedules)
         
-        for keyword, specialty in reason_to_specialty.items():
-            if keyword in reason_lower:
-                return specialty
+        def load_booked(first_date, last_date):
+            booked = {}
+            for appt in appointments_collection.find(
+                {
+                    "doctor_id": {"$in": doctor_ids},
+                    "date": {"$gte": first_date.isoformat(), "$lte": last_date.isoformat()},
+                    "status": {"$nin": ["cancelled"]}
+                },
+                {"doctor_id": 1, "date": 1, "time": 1, "_id": 0}
+            ):
+                booked.setdefault((str(appt["doctor_id"]), appt["date"]), set()).add(appt["time"])
+            return booked
+        
+        slots = earliest_slots(
+            schedules,
+            start_date or datetime.now().date(),
+            days,
+            k=k,
+            booked_loader=load_booked,
+            part_of_day=part_of_day,
+            weekdays=weekdays
+        )
+        return [
+            {"doctor_id": doctor_id, "doctor_name": names[doctor_id], "date": date.isoformat(), "time": slot}
+            for date, _, doctor_id, slot in slots
+        ]
+    
+    @staticmethod
+    def set_schedule_exception(doctor_id, date, slots):
+        """
+        Override a doctor's weekly template on one date
+        
+        Args:
+            doctor_id: The doctor's ID
+            date: Date in YYYY-MM-DD format
+            slots: Slots for that date ("HH:MM"), or an empty list for a day off
+        """
+        result = doctors_collection.update_one(
+            {"_id": doctor_id},
+            {"$set": {f"schedule.exceptions.{date}": list(slots)},
+             "$inc": {"schedule.version": 1}}
+        )
+        return result.modified_count > 0
+    
+    @staticmethod
+    def clear_schedule_exception(doctor_id, date):
+        """Remove a dated exception so the weekly template applies again"""
+        result = doctors_collection.update_one(
+            {"_id": doctor_id},
+            {"$unset": {f"schedule.exceptions.{date}": ""},
+             "$inc": {"schedule.version": 1}}
+        )
+        return result.modified_count > 0
+    
+    @staticmethod
+    def get_specialty_for_reason(reason):
+        """Recommend a doctor specialty based on the reason for visit"""
+        # Defaults to General Practitioner when no synonym matches
+        return get_specialty_matcher().best(reason or "")
+    
+    @staticmethod
+    def rank_specialties_for_reason(reason):
+        """
+        Rank candidate specialties for a reason for visit
         
-        return "General Practitioner"
+        Returns:
+            tuple: ((specialty, confidence), ...) best first
+        """
+        return get_specialty_matcher().rank(reason or "")
     
     @staticmethod
     def seed_sample_doctors():
@@ -181,45 +336,22 @@ class Doctor:
         if doctors_collection.count_documents({}) == 0:
             doctors = [
                 {
-                    "name": "Dr. Smith",
-                    "specialty": "General Practitioner",
-                    "available_slots": {
-                        # Format: YYYY-MM-DD: [time slots]
-                        datetime.now().strftime("%Y-%m-%d"): ["09:00", "10:00", "11:00", "14:00", "15:00", "16:00"],
-                        (datetime.now() + relativedelta(days=1)).strftime("%Y-%m-%d"): ["09:00", "10:00", "11:00", "14:00", "15:00", "16:00"],
-                        (datetime.now() + relativedelta(days=2)).strftime("%Y-%m-%d"): ["09:00", "10:00", "11:00", "14:00", "15:00", "16:00"]
-                    }
-                },
-                {
-                    "name": "Dr. Johnson",
-                    "specialty": "Cardiologist",
-                    "available_slots": {
-                        datetime.now().strftime("%Y-%m-%d"): ["09:30", "10:30", "13:30", "15:30"],
-                        (datetime.now() + relativedelta(days=1)).strftime("%Y-%m-%d"): ["09:30", "10:30", "13:30", "15:30"],
-                        (datetime.now() + relativedelta(days=2)).strftime("%Y-%m-%d"): ["09:30", "10:30", "13:30", "15:30"]
-                    }
-                },
-                {
-                    "name": "Dr. Williams",
-                    "specialty": "Dermatologist",
-                    "available_slots": {
-                        datetime.now().strftime("%Y-%m-%d"): ["10:00", "11:00", "14:00", "15:00"],
-                        (datetime.now() + relativedelta(days=1)).strftime("%Y-%m-%d"): ["10:00", "11:00", "14:00", "15:00"],
-                        (datetime.now() + relativedelta(days=2)).strftime("%Y-%m-%d"): ["10:00", "11:00", "14:00", "15:00"]
-                    }
-                },
-                {
-                    "name": "Dr. Brown",
-                    "specialty": "Pediatrician",
-                    "available_slots": {
-                        datetime.now().strftime("%Y-%m-%d"): ["09:00", "10:00", "11:00", "15:00", "16:00"],
-                        (datetime.now() + relativedelta(days=1)).strftime("%Y-%m-%d"): ["09:00", "10:00", "11:00", "15:00", "16:00"],
-                        (datetime.now() + relativedelta(days=2)).strftime("%Y-%m-%d"): ["09:00", "10:00", "11:00", "15:00", "16:00"]
-                    }
+                    "name": doctor["name"],
+                    "specialty": doctor["specialty"],
+                    "schedule": {"weekly": doctor["weekly"], "exceptions": {}, "version": 1}
                 }
+                for doctor in SAMPLE_DOCTORS
             ]
             
             doctors_collection.insert_many(doctors)
+        else:
+            # Move sample doctors seeded with literal dated slots onto weekly templates
+            for doctor in SAMPLE_DOCTORS:
+                doctors_collection.update_one(
+                    {"name": doctor["name"], "schedule": {"$exists": False}},
+                    {"$set": {"schedule": {"weekly": doctor["weekly"], "exceptions": {}, "version": 1}},
+                     "$unset": {"available_slots": ""}}
+                )
 
 class Appointment:
     @staticmethod
@@ -292,12 +424,16 @@ class Appointment:
         """Reschedule an appointment by updating date and time"""
         result = appointments_collection.update_one(
             {"appointment_id": appointment_id},
-            {"$set": {
-                "date": new_date,
-                "time": new_time,
-                "status": "rescheduled",
-                "updated_at": datetime.now()
-            }}
+            {
+                "$set": {
+                    "date": new_date,
+                    "time": new_time,
+                    "status": "rescheduled",
+                    "updated_at": datetime.now()
+                },
+                # A reminder sent for the old date doesn't cover the new one
+                "$unset": {"reminder": ""}
+            }
         )
         return result.modified_count > 0
 
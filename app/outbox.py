@@ -0,0 +1,288 @@
+import os
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Deliver notifications from a background outbox instead of inside the turn
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() not in ("0", "false", "no")
+
+# Number of delivery worker threads
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+
+# Attempts before a message is dead-lettered
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Retry delay: OUTBOX_BACKOFF_SECONDS * 2^(attempt - 1), capped
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "2"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+
+# How long an idle worker sleeps before polling for due retries
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+
+# A message claimed by a worker that died is picked up again after this long
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+# Delivery latencies kept for the percentile metrics
+OUTBOX_LATENCY_SAMPLES = 1000
+
+# Message states
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+def backoff_delay(attempt, base=None, cap=None):
+    """
+    Seconds to wait before retrying a message that failed `attempt` times
+
+    Args:
+        attempt: Number of failed attempts so far (1 for the first failure)
+        base: Delay after the first failure (defaults to OUTBOX_BACKOFF_SECONDS)
+        cap: Longest delay (defaults to OUTBOX_BACKOFF_MAX_SECONDS)
+
+    Returns:
+        float: The delay in seconds
+    """
+    base = OUTBOX_BACKOFF_SECONDS if base is None else base
+    cap = OUTBOX_BACKOFF_MAX_SECONDS if cap is None else cap
+    return min(cap, base * (2 ** max(0, attempt - 1)))
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class EmailOutbox:
+    """
+    Durable, Mongo-backed queue of outgoing emails
+
+    The conversation turn only inserts a document; worker threads claim due
+    messages with an atomic find_one_and_update, deliver them through `sender`
+    and either mark them sent, schedule a retry with exponential backoff, or
+    dead-letter them after `max_attempts`. Claims carry a lease, so messages
+    held by a crashed worker (or process) are retried rather than lost.
+    """
+
+    def __init__(self, collection, sender, workers=OUTBOX_WORKERS, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 poll_seconds=OUTBOX_POLL_SECONDS, lease_seconds=OUTBOX_LEASE_SECONDS):
+        self.collection = collection
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=OUTBOX_LATENCY_SAMPLES)
+        self._counters = {"enqueued": 0, "duplicates": 0, "sent": 0, "retried": 0, "dead": 0}
+
+        self.collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+        self.collection.create_index("dedupe_key", unique=True, sparse=True)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def enqueue(self, to_email, subject, html_content, kind=None, dedupe_key=None):
+        """
+        Queue an email for background delivery
+
+        Args:
+            to_email: The recipient's email address
+            subject: The email subject
+            html_content: The HTML content of the email
+            kind: Optional label for metrics and debugging ("booking", "cancellation", ...)
+            dedupe_key: Optional key; a second message with the same key is ignored
+
+        Returns:
+            bool: True if the message was queued, False if it was a duplicate
+        """
+        now = datetime.now()
+        message = {
+            "to_email": to_email,
+            "subject": subject,
+            "html_content": html_content,
+            "kind": kind,
+            "status": PENDING,
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now
+        }
+        if dedupe_key:
+            message["dedupe_key"] = dedupe_key
+
+        try:
+            self.collection.insert_one(message)
+        except DuplicateKeyError:
+            logger.info(f"Outbox: '{dedupe_key}' already queued, skipping duplicate")
+            self._count("duplicates")
+            return False
+
+        self._count("enqueued")
+        self._wakeup.set()
+        return True
+
+    def claim(self):
+        """Atomically take the next due message, or None when nothing is due"""
+        now = datetime.now()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                # Lease expired: the worker holding it is gone
+                {"status": SENDING, "lease_until": {"$lt": now}}
+            ]},
+            {"$set": {"status": SENDING, "lease_until": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def deliver_next(self):
+        """
+        Claim and deliver one due message
+
+        Returns:
+            bool: True if a message was processed (whatever the outcome)
+        """
+        message = self.claim()
+        if message is None:
+            return False
+
+        error = None
+        try:
+            delivered = self.sender(message["to_email"], message["subject"], message["html_content"])
+            if not delivered:
+                error = "sender reported failure"
+        except Exception as e:
+            error = str(e)
+
+        now = datetime.now()
+        if error is None:
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": SENT, "sent_at": now}, "$unset": {"lease_until": "", "html_content": ""}}
+            )
+            latency = (now - message["created_at"]).total_seconds()
+            with self._lock:
+                self._latencies.append(latency)
+                self._counters["sent"] += 1
+            logger.info(f"Outbox: delivered {message.get('kind') or 'email'} to {message['to_email']} "
+                        f"after {message['attempts']} attempt(s), {latency:.2f}s after enqueue")
+        elif message["attempts"] >= self.max_attempts:
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": DEAD, "last_error": error, "dead_at": now}, "$unset": {"lease_until": ""}}
+            )
+            self._count("dead")
+            logger.error(f"Outbox: dead-lettered email to {message['to_email']} after "
+                         f"{message['attempts']} attempts: {error}")
+        else:
+            delay = backoff_delay(message["attempts"])
+            self.collection.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": PENDING, "last_error": error,
+                          "next_attempt_at": now + timedelta(seconds=delay)},
+                 "$unset": {"lease_until": ""}}
+            )
+            self._count("retried")
+            logger.warning(f"Outbox: delivery to {message['to_email']} failed ({error}), "
+                           f"retrying in {delay:.0f}s")
+        return True
+
+    def drain(self, limit=None):
+        """Deliver due messages on the calling thread until none are left (or `limit` is reached)"""
+        processed = 0
+        while (limit is None or processed < limit) and self.deliver_next():
+            processed += 1
+        return processed
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.deliver_next():
+                    continue
+            except Exception as e:
+                # Mongo hiccup; back off and try again rather than killing the worker
+                logger.error(f"Outbox worker error: {e}")
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the delivery worker threads"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Outbox: started {self.workers} delivery worker(s)")
+
+    def stop(self, timeout=5.0):
+        """Stop the workers after their current message; undelivered mail stays queued in Mongo"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def metrics(self):
+        """
+        Queue depth and delivery statistics
+
+        Returns:
+            dict: Messages per status, oldest pending message age, delivery
+            latency percentiles (enqueue to sent, seconds) and counters for
+            this process
+        """
+        depth = {PENDING: 0, SENDING: 0, SENT: 0, DEAD: 0}
+        for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            depth[row["_id"]] = row["count"]
+
+        oldest = self.collection.find_one({"status": PENDING}, {"created_at": 1}, sort=[("created_at", ASCENDING)])
+        oldest_age = (datetime.now() - oldest["created_at"]).total_seconds() if oldest else 0.0
+
+        with self._lock:
+            latencies = list(self._latencies)
+            counters = dict(self._counters)
+
+        return {
+            "depth": depth,
+            "oldest_pending_seconds": oldest_age,
+            "latency_seconds": {
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+                "max": max(latencies) if latencies else 0.0,
+                "samples": len(latencies)
+            },
+            "counters": counters,
+            "workers": len(self._threads)
+        }
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+def get_email_outbox():
+    """Get the shared email outbox, starting its workers on first use"""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                # Imported here: models connects to Mongo and notification imports this module
+                from app.models import db
+                from app.agents.notification import send_email
+                outbox = EmailOutbox(db["email_outbox"], send_email)
+                outbox.start()
+                atexit.register(outbox.stop)
+                _outbox = outbox
+    return _outbox
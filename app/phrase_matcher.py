@@ -0,0 +1,93 @@
+import re
+
+def _trie_pattern(node):
+    """Turn a character trie into a factored regex so matching cost tracks phrase length, not vocabulary size"""
+    terminal = "" in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+
+    if not branches:
+        return ""
+
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    # A phrase ends here, so everything after this point is optional
+    return f"(?:{body})?" if terminal else body
+
+def build_trie_regex(phrases):
+    """
+    Build a single regex source matching any of the phrases
+
+    The phrases are folded into a character trie first, so "heart", "heartburn"
+    and "hearing" share their common prefix and the regex engine never tries
+    alternatives that cannot match at the current position.
+
+    Args:
+        phrases: Iterable of literal phrases
+
+    Returns:
+        str: Regex source (without anchors or boundaries)
+    """
+    trie = {}
+    for phrase in phrases:
+        if not phrase:
+            continue
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+    return _trie_pattern(trie)
+
+class PhraseMatcher:
+    """
+    Match many literal phrases against lowercase text with one compiled regex
+
+    In "word" mode phrases only match on word boundaries (an optional plural
+    "s"/"es" is allowed), so "heart" does not match inside "heartburn". In
+    "substring" mode phrases match anywhere, like `phrase in text`.
+    """
+
+    def __init__(self, phrases, mode="word"):
+        self.phrases = sorted({phrase.lower() for phrase in phrases if phrase})
+        self._phrase_set = frozenset(self.phrases)
+        source = build_trie_regex(self.phrases)
+
+        if not source:
+            self.regex = None
+        elif mode == "word":
+            self.regex = re.compile(rf"\b(?:{source})(?:e?s)?\b")
+        elif mode == "substring":
+            # A zero-width lookahead reports a match at every start position,
+            # including ones that overlap an earlier match
+            self.regex = re.compile(rf"(?=({source}))")
+        else:
+            raise ValueError(f"Unknown phrase matching mode: {mode}")
+        self.mode = mode
+
+    def _phrase(self, matched):
+        """Map matched text back to the phrase that produced it (strips plural suffixes)"""
+        if self.mode == "word" and matched not in self._phrase_set:
+            for suffix in ("es", "s"):
+                if matched.endswith(suffix) and matched[:-len(suffix)] in self._phrase_set:
+                    return matched[:-len(suffix)]
+        return matched
+
+    def finditer(self, text):
+        """
+        Yield (start, end, phrase) for every match in lowercase text
+
+        In substring mode only the longest phrase starting at each position is
+        reported; callers that need shorter phrases sharing that start should
+        treat them as implied (see `prefixes`).
+        """
+        if self.regex is None:
+            return
+        if self.mode == "substring":
+            for match in self.regex.finditer(text):
+                phrase = match.group(1)
+                yield match.start(), match.start() + len(phrase), phrase
+        else:
+            for match in self.regex.finditer(text):
+                yield match.start(), match.end(), self._phrase(match.group(0))
+
+    def prefixes(self, phrase):
+        """All known phrases that are prefixes of `phrase` (including itself)"""
+        return [candidate for candidate in self.phrases if phrase.startswith(candidate)]
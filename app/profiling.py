@@ -0,0 +1,300 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import pstats
+import hashlib
+import logging
+import argparse
+import cProfile
+import tempfile
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Shared secret for signed X-Profile headers and the admin endpoints; profiling is off when unset
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+
+# Where captured profiles are written, and how many are kept (oldest are deleted first)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "medagent-profiles"))
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "20"))
+
+# How often (ms) the stack sampler looks at the profiled thread for the collapsed-stack file
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+# Longest lifetime a signed X-Profile token may claim
+PROFILE_TOKEN_MAX_SECONDS = int(os.getenv("PROFILE_TOKEN_MAX_SECONDS", "3600"))
+
+PROFILE_HEADER = "X-Profile"
+ADMIN_HEADER = "X-Admin-Token"
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{9}-[0-9a-f]{8}$")
+PROFILE_KINDS = {"pstats": "application/octet-stream", "collapsed": "text/plain"}
+
+def _signature(secret, expires):
+    return hmac.new(secret.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+
+def sign_profile_token(secret=None, ttl=300, now=None):
+    """
+    Create an X-Profile header value that profiles any request sent before it expires
+
+    Args:
+        secret: The shared secret (defaults to PROFILING_SECRET)
+        ttl: Seconds until the token expires
+        now: Current Unix time (for tests)
+
+    Returns:
+        str: "<expires>.<signature>"
+    """
+    expires = int((now or time.time()) + ttl)
+    return f"{expires}.{_signature(secret or PROFILING_SECRET, expires)}"
+
+def verify_profile_token(token, secret=None, now=None):
+    """Check an X-Profile header value's signature and expiry"""
+    secret = secret or PROFILING_SECRET
+    if not secret or not token:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit():
+        return False
+    remaining = int(expires) - (now or time.time())
+    if remaining <= 0 or remaining > PROFILE_TOKEN_MAX_SECONDS:
+        return False
+    return hmac.compare_digest(signature, _signature(secret, int(expires)))
+
+def is_admin(token, secret=None):
+    """Check an X-Admin-Token header against the shared secret"""
+    secret = secret or PROFILING_SECRET
+    return bool(secret and token) and hmac.compare_digest(token, secret)
+
+class StackSampler:
+    """
+    Sample one thread's Python stack at a fixed interval from a background thread
+
+    Counts are kept per collapsed stack ("outer;...;inner"), the input format
+    of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    @staticmethod
+    def _label(code):
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":").replace(" ", "_")
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        if labels:
+            self.stacks[";".join(reversed(labels))] += 1
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def collapsed(self):
+        """The samples as collapsed-stack lines, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class RequestProfile:
+    """One request's capture: cProfile for exact call counts, the sampler for a flame graph"""
+
+    def __init__(self, trigger, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        now = time.time()
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}"
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), interval_ms)
+        self.started = None
+        self.seconds = None
+
+    def start(self):
+        self.started = time.time()
+        self.sampler.start()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.seconds = time.time() - self.started
+
+class ProfileStore:
+    """A bounded ring of captured profiles on disk: <id>.pstats, <id>.collapsed and <id>.json"""
+
+    def __init__(self, directory=PROFILE_DIR, size=PROFILE_RING_SIZE):
+        self.directory = directory
+        self.size = size
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, profile_id, kind):
+        return os.path.join(self.directory, f"{profile_id}.{kind}")
+
+    def save(self, profile, meta):
+        """
+        Write a stopped RequestProfile and evict the oldest beyond the ring size
+
+        Returns:
+            dict: The stored metadata
+        """
+        meta = {
+            "id": profile.id,
+            "trigger": profile.trigger,
+            "started": profile.started,
+            "seconds": round(profile.seconds, 6),
+            "samples": sum(profile.sampler.stacks.values()),
+            **meta
+        }
+        pstats.Stats(profile.profiler).dump_stats(self._path(profile.id, "pstats"))
+        with open(self._path(profile.id, "collapsed"), "w") as f:
+            f.write(profile.sampler.collapsed())
+        # The metadata is written last; a profile is listed only once it is complete
+        with open(self._path(profile.id, "json"), "w") as f:
+            json.dump(meta, f)
+        self._evict()
+        return meta
+
+    def _ids(self):
+        # IDs start with a timestamp, so name order is capture order
+        return sorted(name[:-5] for name in os.listdir(self.directory)
+                      if name.endswith(".json") and PROFILE_ID_PATTERN.match(name[:-5]))
+
+    def _evict(self):
+        with self._lock:
+            ids = self._ids()
+            for profile_id in ids[:max(0, len(ids) - self.size)]:
+                for kind in ("json", *PROFILE_KINDS):
+                    try:
+                        os.remove(self._path(profile_id, kind))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self):
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(self._path(profile_id, "json"), "r") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # Evicted while listing
+                continue
+        return profiles
+
+    def path(self, profile_id, kind):
+        """Path of a stored profile file, or None if there is no such profile"""
+        if kind not in PROFILE_KINDS or not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self._path(profile_id, kind)
+        return path if os.path.exists(path) else None
+
+class RequestProfiler:
+    """
+    Decide which requests to profile and store their captures
+
+    A request is profiled when it carries a valid signed X-Profile header, or
+    while an admin has armed the profiler for the next N requests (optionally
+    only those under a path prefix). One request is profiled at a time; others
+    that ask meanwhile run unprofiled.
+    """
+
+    def __init__(self, store, secret=None, interval_ms=PROFILE_SAMPLE_INTERVAL_MS):
+        self.store = store
+        self.secret = secret or PROFILING_SECRET
+        self.interval_ms = interval_ms
+        self.armed = 0
+        self.path_prefix = ""
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def arm(self, requests, path_prefix=""):
+        """Profile the next `requests` requests whose path starts with `path_prefix` (0 disarms)"""
+        with self._lock:
+            self.armed = max(0, int(requests))
+            self.path_prefix = path_prefix or ""
+        logger.info("Profiling armed for %d request(s) under '%s'", self.armed, self.path_prefix or "/")
+        return {"armed": self.armed, "path_prefix": self.path_prefix}
+
+    def trigger_for(self, path, header):
+        """
+        Work out whether to profile a request
+
+        Returns:
+            str: "header" or "admin", or None to run it unprofiled
+        """
+        if header:
+            if verify_profile_token(header, self.secret):
+                return "header"
+            logger.warning("Ignoring an invalid or expired %s header", PROFILE_HEADER)
+        if not self.armed:
+            return None
+        with self._lock:
+            if self.armed and path.startswith(self.path_prefix):
+                self.armed -= 1
+                return "admin"
+        return None
+
+    def start(self, trigger):
+        """Start profiling the calling thread; returns the RequestProfile, or None if one is running"""
+        if not self._active.acquire(blocking=False):
+            logger.info("A profile is already being captured; running this request unprofiled")
+            return None
+        try:
+            profile = RequestProfile(trigger, self.interval_ms)
+            profile.start()
+            return profile
+        except Exception:
+            self._active.release()
+            raise
+
+    def finish(self, profile, **meta):
+        """Stop a capture and store it; never raises"""
+        try:
+            profile.stop()
+            stored = self.store.save(profile, meta)
+            logger.info("Profile %s captured (%.3fs, %d samples)", profile.id, profile.seconds, stored["samples"])
+            return stored
+        except Exception as e:
+            logger.error("Failed to store profile %s: %s", profile.id, e)
+            return None
+        finally:
+            self._active.release()
+
+_request_profiler = None
+_request_profiler_lock = threading.Lock()
+
+def get_request_profiler():
+    """Get the shared request profiler, creating its profile directory on first use"""
+    global _request_profiler
+    if _request_profiler is None:
+        with _request_profiler_lock:
+            if _request_profiler is None:
+                _request_profiler = RequestProfiler(ProfileStore())
+    return _request_profiler
+
+if __name__ == "__main__":
+    # e.g. curl -H "X-Profile: $(python -m app.profiling --ttl 600)" ...
+    parser = argparse.ArgumentParser(description="Print a signed X-Profile header value")
+    parser.add_argument("--ttl", type=int, default=300, help="Seconds the token stays valid")
+    args = parser.parse_args()
+    if not PROFILING_SECRET:
+        sys.exit("PROFILING_SECRET is not set")
+    print(sign_profile_token(ttl=args.ttl))
@@ -0,0 +1,261 @@
+import os
+import sys
+import time
+import uuid
+import logging
+import argparse
+import threading
+from itertools import islice
+from datetime import datetime, date, timedelta
+from bson import ObjectId
+from pymongo import ASCENDING
+from app.scheduling import format_slot
+
+logger = logging.getLogger(__name__)
+
+# Appointments read, claimed and sent per batch
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+
+# A claim left by a run that died is taken over after this long
+REMINDER_CLAIM_TTL_SECONDS = float(os.getenv("REMINDER_CLAIM_TTL_SECONDS", "1800"))
+
+# Daily run time (HH:MM, server local time) for the in-process scheduler
+REMINDER_SEND_TIME = os.getenv("REMINDER_SEND_TIME", "17:00")
+
+# Extra runs the scheduler makes for a day whose sends failed, and the wait before each
+REMINDER_RETRIES = int(os.getenv("REMINDER_RETRIES", "3"))
+REMINDER_RETRY_SECONDS = float(os.getenv("REMINDER_RETRY_SECONDS", "900"))
+
+# Start the in-process scheduler with the web app
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Appointments that still need a reminder
+REMINDER_STATUSES = ["confirmed", "rescheduled"]
+
+REMINDER_SUBJECT = "Appointment Reminder"
+
+APPOINTMENT_PROJECTION = {"appointment_id": 1, "patient_id": 1, "doctor_id": 1, "date": 1, "time": 1}
+
+def _as_object_id(value):
+    return ObjectId(value) if isinstance(value, str) and ObjectId.is_valid(value) else value
+
+class ReminderJob:
+    """
+    Send reminders for one day's appointments in batches
+
+    Appointments are streamed from a cursor with a projection, a batch at a
+    time. Each batch is claimed with a single update_many, so concurrent or
+    repeated runs never pick up the same appointment. The batch's patients are
+    then fetched with one $in query, and the reminders go out together through
+    `send_batch`. Sent appointments are marked; failed ones are released so the
+    next run retries them.
+    """
+
+    def __init__(self, appointments, patients, doctors, send_batch, render,
+                 batch_size=REMINDER_BATCH_SIZE, claim_ttl=REMINDER_CLAIM_TTL_SECONDS):
+        self.appointments = appointments
+        self.patients = patients
+        self.doctors = doctors
+        self.send_batch = send_batch
+        self.render = render
+        self.batch_size = batch_size
+        self.claim_ttl = claim_ttl
+        self.appointments.create_index([("date", ASCENDING), ("status", ASCENDING)])
+
+    def _pending_query(self, day, now):
+        return {
+            "date": day,
+            "status": {"$in": REMINDER_STATUSES},
+            "$or": [
+                {"reminder": {"$exists": False}},
+                {"reminder.status": "claimed",
+                 "reminder.claimed_at": {"$lt": now - timedelta(seconds=self.claim_ttl)}}
+            ]
+        }
+
+    def _claim(self, day, ids, run_id):
+        """Claim what's still unclaimed in a batch; returns the claimed appointments"""
+        now = datetime.now()
+        query = self._pending_query(day, now)
+        query["_id"] = {"$in": ids}
+        self.appointments.update_many(
+            query,
+            {"$set": {"reminder": {"status": "claimed", "run_id": run_id, "claimed_at": now}}}
+        )
+        return list(self.appointments.find(
+            {"_id": {"$in": ids}, "reminder.run_id": run_id, "reminder.status": "claimed"},
+            APPOINTMENT_PROJECTION
+        ))
+
+    def run(self, day=None, dry_run=False):
+        """
+        Send reminders for every confirmed appointment on a day
+
+        Args:
+            day: Date of the appointments (date or YYYY-MM-DD; defaults to tomorrow)
+            dry_run: Count what would be sent without claiming or sending anything
+
+        Returns:
+            dict: Per-run stats (scanned, claimed, sent, failed, skipped, seconds, per_second)
+        """
+        if day is None:
+            day = date.today() + timedelta(days=1)
+        day = day.isoformat() if isinstance(day, date) else day
+        formatted_date = datetime.strptime(day, "%Y-%m-%d").strftime("%A, %B %d, %Y")
+
+        started = time.perf_counter()
+        run_id = uuid.uuid4().hex
+        stats = {"date": day, "scanned": 0, "claimed": 0, "sent": 0, "failed": 0, "skipped": 0}
+
+        # Doctors are few; look their names up once per run
+        doctor_names = {str(doctor["_id"]): doctor["name"] for doctor in self.doctors.find({}, {"name": 1})}
+
+        cursor = self.appointments.find(
+            self._pending_query(day, datetime.now()), {"_id": 1}, batch_size=self.batch_size
+        )
+        while True:
+            ids = [appointment["_id"] for appointment in islice(cursor, self.batch_size)]
+            if not ids:
+                break
+            stats["scanned"] += len(ids)
+            if dry_run:
+                continue
+
+            batch = self._claim(day, ids, run_id)
+            stats["claimed"] += len(batch)
+            if batch:
+                self._send(batch, formatted_date, doctor_names, stats)
+
+        stats["seconds"] = time.perf_counter() - started
+        stats["per_second"] = stats["sent"] / stats["seconds"] if stats["seconds"] else 0.0
+        logger.info(f"Reminder run for {day}: {stats['sent']} sent, {stats['failed']} failed, "
+                    f"{stats['skipped']} skipped of {stats['scanned']} scanned "
+                    f"in {stats['seconds']:.2f}s ({stats['per_second']:.0f}/s)")
+        return stats
+
+    def _send(self, batch, formatted_date, doctor_names, stats):
+        # One query for every patient in the batch
+        patient_ids = list({_as_object_id(appointment["patient_id"]) for appointment in batch})
+        patients = {
+            str(patient["_id"]): patient
+            for patient in self.patients.find({"_id": {"$in": patient_ids}}, {"name": 1, "email": 1})
+        }
+
+        emails, sendable, skipped = [], [], []
+        for appointment in batch:
+            patient = patients.get(str(appointment["patient_id"]))
+            if not patient or not patient.get("email"):
+                skipped.append(appointment["_id"])
+                continue
+            details = {
+                "patient_name": patient.get("name", "Patient"),
+                "formatted_date": formatted_date,
+                "time": format_slot(appointment["time"]) if appointment.get("time") else "",
+                "doctor_name": doctor_names.get(str(appointment.get("doctor_id")), "your doctor"),
+                "appointment_id": appointment.get("appointment_id", "")
+            }
+            emails.append((patient["email"], REMINDER_SUBJECT, self.render(details)))
+            sendable.append(appointment["_id"])
+
+        results = self.send_batch(emails) if emails else []
+        sent = [appointment_id for appointment_id, ok in zip(sendable, results) if ok]
+        failed = [appointment_id for appointment_id, ok in zip(sendable, results) if not ok]
+
+        now = datetime.now()
+        if sent:
+            self.appointments.update_many(
+                {"_id": {"$in": sent}},
+                {"$set": {"reminder.status": "sent", "reminder.sent_at": now}}
+            )
+        if skipped:
+            self.appointments.update_many(
+                {"_id": {"$in": skipped}},
+                {"$set": {"reminder.status": "skipped", "reminder.reason": "no_email"}}
+            )
+        if failed:
+            # Release the claim so the next run tries again
+            self.appointments.update_many({"_id": {"$in": failed}}, {"$unset": {"reminder": ""}})
+
+        stats["sent"] += len(sent)
+        stats["failed"] += len(failed)
+        stats["skipped"] += len(skipped)
+
+def get_reminder_job():
+    """Build the reminder job over the application's collections"""
+    from app.models import appointments_collection, patients_collection, doctors_collection
+    from app.agents.notification import send_emails, create_appointment_reminder_email
+    return ReminderJob(appointments_collection, patients_collection, doctors_collection,
+                       send_emails, create_appointment_reminder_email)
+
+def send_appointment_reminders(day=None, dry_run=False):
+    """Send reminders for a day's appointments (tomorrow by default); see ReminderJob.run"""
+    return get_reminder_job().run(day, dry_run=dry_run)
+
+def send_reminders_with_retries(day=None, retries=REMINDER_RETRIES, retry_seconds=REMINDER_RETRY_SECONDS, job=None):
+    """
+    Run the reminder job for a day, then run it again while sends fail
+
+    Failed sends release their claim, so each retry picks up only the
+    appointments still unreminded.
+
+    Args:
+        day: Date of the appointments (defaults to tomorrow, fixed before the first run)
+        retries: Most extra runs
+        retry_seconds: Wait before each extra run
+        job: The ReminderJob (default: get_reminder_job())
+
+    Returns:
+        dict: Stats of the last run
+    """
+    job = job or get_reminder_job()
+    if day is None:
+        day = date.today() + timedelta(days=1)
+    stats = job.run(day)
+    for attempt in range(1, retries + 1):
+        if not stats["failed"]:
+            break
+        logger.info(f"Retrying {stats['failed']} failed reminders for {stats['date']} "
+                    f"in {retry_seconds:.0f}s ({attempt}/{retries})")
+        time.sleep(retry_seconds)
+        stats = job.run(day)
+    return stats
+
+def _seconds_until(send_time, now=None):
+    now = now or datetime.now()
+    hour, minute = (int(part) for part in send_time.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+def start_reminder_scheduler(send_time=REMINDER_SEND_TIME):
+    """
+    Run the reminder job for the next day once a day at `send_time`
+
+    Failed sends are retried up to REMINDER_RETRIES times, REMINDER_RETRY_SECONDS
+    apart. Safe to start in every worker process: claims make concurrent runs
+    split the work instead of sending twice.
+    """
+    def loop():
+        while True:
+            time.sleep(_seconds_until(send_time))
+            try:
+                send_reminders_with_retries()
+            except Exception as e:
+                logger.error(f"Reminder run failed: {e}")
+
+    thread = threading.Thread(target=loop, name="reminder-scheduler", daemon=True)
+    thread.start()
+    logger.info(f"Reminder scheduler started, sending daily at {send_time}")
+    return thread
+
+if __name__ == "__main__":
+    # e.g. from cron: python -m app.reminders --date 2026-10-20
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Send appointment reminders")
+    parser.add_argument("--date", help="Appointment date (YYYY-MM-DD), defaults to tomorrow")
+    parser.add_argument("--dry-run", action="store_true", help="Count reminders without sending")
+    args = parser.parse_args()
+    stats = send_appointment_reminders(args.date, dry_run=args.dry_run)
+    print(stats)
+    sys.exit(1 if stats["failed"] else 0)
@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import hashlib
+import logging
+import tempfile
+import threading
+import numpy as np
+from app.knowledge_base import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Clinic policy and service documents (markdown, one "## " section per topic)
+CLINIC_DOCS_PATH = os.getenv(
+    "CLINIC_DOCS_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "clinic_docs")
+)
+
+# Where the built index is persisted between restarts
+RETRIEVAL_INDEX_DIR = os.getenv(
+    "RETRIEVAL_INDEX_DIR",
+    os.path.join(os.path.dirname(__file__), "data", "retrieval_index")
+)
+
+# Hashed embedding width; a power of two keeps collisions rare for a clinic-sized corpus
+EMBEDDING_DIM = 4096
+
+# Longest chunk, in words; longer sections are split on sentence boundaries
+CHUNK_WORDS = 80
+
+# A passage at least this similar to the question, and clearly ahead of the
+# runner-up, is returned as the answer directly
+RETRIEVAL_DIRECT_SCORE = float(os.getenv("RETRIEVAL_DIRECT_SCORE", "0.2"))
+RETRIEVAL_DIRECT_MARGIN = float(os.getenv("RETRIEVAL_DIRECT_MARGIN", "0.05"))
+
+# Below this, the documents don't cover the question and the caller falls back
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.1"))
+
+# How many passages (and characters) are sent to the model when one is needed
+RETRIEVAL_CONTEXT_PASSAGES = 3
+RETRIEVAL_CONTEXT_CHARS = 900
+
+# Bumped whenever chunking or embedding changes, so stale indexes are rebuilt
+INDEX_FORMAT_VERSION = 1
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+# Function words carry no topic; leaving them out keeps short questions focused
+STOPWORDS = frozenset("""
+a about all am an and any are as at be been but by can could did do does for from get got had has
+have how i i'm if in into is it it's its me my no not of on or our so than that the their them then
+there these they this to too up us was we were what when where which who why will with would you
+your you're
+""".split())
+
+def _stem(word):
+    """Very light suffix stripping: "cancelling" -> "cancel", "vaccinations" -> "vaccination\""""
+    for suffix in ("ing", "ed"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            word = word[:-len(suffix)]
+            # "cancell" -> "cancel", "stopp" -> "stop"
+            if len(word) > 4 and word[-1] == word[-2] and word[-1] not in "aeious":
+                word = word[:-1]
+            break
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return word
+
+def _features(text):
+    """Stemmed content-word unigrams and bigrams"""
+    words = [_stem(word) for word in tokenize(text) if word not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def _hash(feature):
+    """Stable bucket and sign for a feature (crc32, unlike hash(), is the same in every process)"""
+    value = zlib.crc32(feature.encode("utf-8"))
+    return value % EMBEDDING_DIM, (1.0 if value & 0x80000000 else -1.0)
+
+def _term_vector(text):
+    """Sublinear term-frequency vector in hashed feature space"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    counts = {}
+    for feature in _features(text):
+        counts[feature] = counts.get(feature, 0) + 1
+    for feature, count in counts.items():
+        bucket, sign = _hash(feature)
+        vector[bucket] += sign * (1.0 + np.log(count))
+    return vector
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def chunk_document(title, text):
+    """
+    Split a markdown document into passages
+
+    Each "## " section becomes a passage prefixed with its heading; sections
+    longer than CHUNK_WORDS are split on sentence boundaries.
+
+    Returns:
+        list: Dicts with "title", "section" and "text"
+    """
+    chunks = []
+    sections = re.split(r"^##\s+", text, flags=re.MULTILINE)
+    for section in sections[1:]:
+        heading, _, body = section.partition("\n")
+        body = " ".join(body.split())
+        if not body:
+            continue
+
+        current = []
+        for sentence in SENTENCE_PATTERN.split(body):
+            if current and len(" ".join(current + [sentence]).split()) > CHUNK_WORDS:
+                chunks.append({"title": title, "section": heading.strip(), "text": " ".join(current)})
+                current = []
+            current.append(sentence)
+        if current:
+            chunks.append({"title": title, "section": heading.strip(), "text": " ".join(current)})
+    return chunks
+
+def _read_documents(docs_path):
+    """Read every markdown document as (title, text), in a stable order"""
+    documents = []
+    for name in sorted(os.listdir(docs_path)):
+        if not name.endswith(".md"):
+            continue
+        with open(os.path.join(docs_path, name), "r") as f:
+            text = f.read()
+        match = re.search(r"^#\s+(.+)$", text, flags=re.MULTILINE)
+        documents.append((match.group(1).strip() if match else name[:-3], text))
+    return documents
+
+def _fingerprint(documents):
+    digest = hashlib.sha256(f"{INDEX_FORMAT_VERSION}:{EMBEDDING_DIM}:{CHUNK_WORDS}".encode())
+    for title, text in documents:
+        digest.update(title.encode())
+        digest.update(text.encode())
+    return digest.hexdigest()
+
+class DocumentIndex:
+    """
+    Passages from the clinic documents with their embeddings
+
+    Embeddings are IDF-weighted hashed bag-of-words vectors, L2-normalised and
+    stored as one float32 matrix, so top-k retrieval is a single matrix-vector
+    product. The matrix is saved with np.save and memory-mapped on load.
+    """
+
+    def __init__(self, chunks, embeddings, idf, fingerprint=None):
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.idf = idf
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, docs_path=CLINIC_DOCS_PATH):
+        """Chunk and embed every document under docs_path"""
+        started = time.perf_counter()
+        documents = _read_documents(docs_path)
+        chunks = [chunk for title, text in documents for chunk in chunk_document(title, text)]
+
+        term_vectors = np.stack([_term_vector(f"{chunk['section']} {chunk['text']}") for chunk in chunks]) \
+            if chunks else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+        # Smoothed IDF per hashed bucket
+        document_frequency = np.count_nonzero(term_vectors, axis=0)
+        idf = (np.log((1 + len(chunks)) / (1 + document_frequency)) + 1).astype(np.float32)
+        embeddings = _normalize(term_vectors * idf).astype(np.float32)
+
+        index = cls(chunks, embeddings, idf, _fingerprint(documents))
+        logger.info(f"Retrieval index built: {len(documents)} documents, {len(chunks)} passages "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return index
+
+    def save(self, index_dir=RETRIEVAL_INDEX_DIR):
+        """
+        Write the index to index_dir without disturbing a concurrent reader
+
+        The arrays go to file names unique to this save; chunks.json, which
+        names them, is written last and swapped in with os.replace. A reader,
+        or a crash part way through, sees the old index or the new one, never
+        a mix. Arrays the new chunks.json doesn't name are removed afterwards.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        generation = uuid.uuid4().hex[:12]
+        arrays = {"embeddings": f"embeddings.{generation}.npy", "idf": f"idf.{generation}.npy"}
+        for key, name in arrays.items():
+            with open(os.path.join(index_dir, name), "wb") as f:
+                np.save(f, getattr(self, key))
+                f.flush()
+                os.fsync(f.fileno())
+
+        fd, temp_path = tempfile.mkstemp(dir=index_dir, prefix=".chunks.", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"fingerprint": self.fingerprint, "arrays": arrays, "chunks": self.chunks}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, os.path.join(index_dir, "chunks.json"))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        for name in os.listdir(index_dir):
+            if name.endswith(".npy") and name not in arrays.values():
+                try:
+                    os.remove(os.path.join(index_dir, name))
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, index_dir=RETRIEVAL_INDEX_DIR):
+        """Load a saved index; the embedding matrix is memory-mapped, not read into memory"""
+        with open(os.path.join(index_dir, "chunks.json"), "r") as f:
+            meta = json.load(f)
+        arrays = meta["arrays"]
+        embeddings = np.load(os.path.join(index_dir, arrays["embeddings"]), mmap_mode="r")
+        idf = np.load(os.path.join(index_dir, arrays["idf"]))
+        return cls(meta["chunks"], embeddings, idf, meta["fingerprint"])
+
+    def embed_query(self, query):
+        return _normalize(_term_vector(query) * self.idf)
+
+    def search(self, query, k=3):
+        """
+        Find the passages most similar to a query
+
+        Args:
+            query: The patient's question
+            k: Number of passages to return
+
+        Returns:
+            list: Up to k (score, chunk) tuples, best first
+        """
+        if not self.chunks:
+            return []
+        scores = self.embeddings @ self.embed_query(query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top if scores[i] > 0]
+
+# Running totals for how retrieval is answering questions
+_stats_lock = threading.Lock()
+RETRIEVAL_STATS = {
+    "queries": 0,
+    "direct": 0,
+    "llm": 0,
+    "miss": 0,
+    "search_ms_total": 0.0,
+    "ingest_ms": 0.0
+}
+
+def _record(outcome, search_ms):
+    with _stats_lock:
+        RETRIEVAL_STATS["queries"] += 1
+        RETRIEVAL_STATS[outcome] += 1
+        RETRIEVAL_STATS["search_ms_total"] += search_ms
+
+def retrieval_stats():
+    """
+    Snapshot of retrieval counters
+
+    Returns:
+        dict: Counts per outcome, mean search latency and the share of questions
+        answered without any model call
+    """
+    with _stats_lock:
+        stats = dict(RETRIEVAL_STATS)
+    queries = stats["queries"]
+    stats["search_ms_avg"] = stats["search_ms_total"] / queries if queries else 0.0
+    stats["answered_without_llm"] = stats["direct"] / queries if queries else 0.0
+    return stats
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_document_index():
+    """
+    Get the shared document index
+
+    A saved index is reused when its fingerprint matches the current documents;
+    otherwise the documents are re-ingested and the index saved again.
+    """
+    global _index
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is not None:
+            return _index
+
+        started = time.perf_counter()
+        fingerprint = _fingerprint(_read_documents(CLINIC_DOCS_PATH))
+        index = None
+        try:
+            saved = DocumentIndex.load(RETRIEVAL_INDEX_DIR)
+            if saved.fingerprint == fingerprint:
+                index = saved
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if index is None:
+            index = DocumentIndex.build(CLINIC_DOCS_PATH)
+            try:
+                index.save(RETRIEVAL_INDEX_DIR)
+            except OSError as e:
+                logger.warning(f"Could not persist retrieval index to {RETRIEVAL_INDEX_DIR}: {e}")
+
+        with _stats_lock:
+            RETRIEVAL_STATS["ingest_ms"] = (time.perf_counter() - started) * 1000
+        _index = index
+        return _index
+
+def retrieve_answer(query):
+    """
+    Decide how a general question can be answered from the clinic documents
+
+    Args:
+        query: The patient's question
+
+    Returns:
+        dict: {"mode": "direct" | "llm" | "miss", "score": top similarity,
+               "answer": passage text for "direct",
+               "passages": short passages to ground a model call for "llm"}
+    """
+    started = time.perf_counter()
+    hits = get_document_index().search(query, k=RETRIEVAL_CONTEXT_PASSAGES)
+    search_ms = (time.perf_counter() - started) * 1000
+
+    top_score = hits[0][0] if hits else 0.0
+    runner_up = hits[1][0] if len(hits) > 1 else 0.0
+    if top_score >= RETRIEVAL_DIRECT_SCORE and top_score - runner_up >= RETRIEVAL_DIRECT_MARGIN:
+        _record("direct", search_ms)
+        return {"mode": "direct", "score": top_score, "answer": hits[0][1]["text"], "passages": []}
+
+    if top_score >= RETRIEVAL_MIN_SCORE:
+        passages, used = [], 0
+        for score, chunk in hits:
+            if score < RETRIEVAL_MIN_SCORE or used >= RETRIEVAL_CONTEXT_CHARS:
+                break
+            text = chunk["text"][:RETRIEVAL_CONTEXT_CHARS - used]
+            passages.append(f"{chunk['section']}: {text}")
+            used += len(text)
+        _record("llm", search_ms)
+        return {"mode": "llm", "score": top_score, "answer": None, "passages": passages}
+
+    _record("miss", search_ms)
+    return {"mode": "miss", "score": top_score, "answer": None, "passages": []}
@@ -0,0 +1,297 @@
+import os
+import datetime
+import heapq
+from functools import lru_cache
+from itertools import islice
+
+# Weekday keys used in stored weekly templates (index matches date.weekday())
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Upper bound on how many parsed schedules we keep around between requests
+SCHEDULE_CACHE_SIZE = 512
+
+# Upper bound on how many dates each schedule memoizes slots for
+SCHEDULE_MEMO_DATES = int(os.getenv("SCHEDULE_MEMO_DATES", "366"))
+
+# Minute ranges for part-of-day preferences: [start, end)
+PARTS_OF_DAY = {
+    "morning": (0, 12 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, 24 * 60)
+}
+
+# Size of the first window searched for earliest slots; later windows double in size
+EARLIEST_SEARCH_FIRST_WINDOW = 7
+
+def _to_date(value):
+    """Coerce a date, datetime or YYYY-MM-DD string into a date"""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+def _weekday_index(day):
+    """Accept either a weekday name ("monday") or an index (0 or "0")"""
+    if isinstance(day, int):
+        return day
+    day = str(day).strip().lower()
+    if day.isdigit():
+        return int(day)
+    return WEEKDAYS.index(day)
+
+@lru_cache(maxsize=1024)
+def slot_minutes(slot):
+    """
+    Convert a slot in either storage ("14:00", "9") or display ("2:00 PM") format
+    into minutes after midnight
+
+    Args:
+        slot: The time slot string
+
+    Returns:
+        int: Minutes after midnight
+    """
+    text = slot.strip().upper()
+    period = None
+    if text.endswith("AM") or text.endswith("PM"):
+        period = text[-2:]
+        text = text[:-2].strip()
+
+    if ":" in text:
+        hour, minute = text.split(":", 1)
+        hour, minute = int(hour), int(minute)
+    else:
+        hour, minute = int(text), 0
+
+    if period == "PM" and hour != 12:
+        hour += 12
+    elif period == "AM" and hour == 12:
+        hour = 0
+
+    return hour * 60 + minute
+
+@lru_cache(maxsize=1024)
+def format_slot(slot):
+    """Convert a stored slot ("14:00") into the display format used in replies ("2:00 PM")"""
+    minutes = slot_minutes(slot)
+    hour, minute = divmod(minutes, 60)
+    period = "AM" if hour < 12 else "PM"
+    display_hour = hour % 12 or 12
+    return f"{display_hour}:{minute:02d} {period}"
+
+@lru_cache(maxsize=256)
+def _display_slots(slots):
+    """Format and sort a tuple of stored slots once; templates share the same tuple"""
+    return tuple(format_slot(slot) for slot in sorted(slots, key=slot_minutes))
+
+class DoctorSchedule:
+    """
+    A doctor's availability expressed as a recurring weekly template plus
+    dated exceptions (vacations, extra clinics). Slots for a given date are
+    only computed when that date is asked for.
+    """
+
+    def __init__(self, weekly=None, exceptions=None):
+        self.weekly = {}
+        for day, slots in (weekly or {}).items():
+            self.weekly[_weekday_index(day)] = tuple(slots or ())
+
+        # An exception replaces the template for that date; an empty list means
+        # the doctor is unavailable that day
+        self.exceptions = {str(date): tuple(slots or ()) for date, slots in (exceptions or {}).items()}
+        self._memo = {}
+
+    @classmethod
+    def from_doctor(cls, doctor):
+        """
+        Build a schedule from a doctor document
+
+        Documents written before weekly templates existed only have a literal
+        `available_slots` map keyed by date; those dates are treated as exceptions.
+        """
+        schedule = doctor.get("schedule") or {}
+        exceptions = dict(doctor.get("available_slots") or {})
+        exceptions.update(schedule.get("exceptions") or {})
+        return cls(schedule.get("weekly"), exceptions)
+
+    def slots_for(self, date):
+        """
+        Get the scheduled slots for a date in display format, before removing bookings
+
+        Args:
+            date: A date, datetime or YYYY-MM-DD string
+
+        Returns:
+            tuple: Sorted display-format slots (e.g. ("9:00 AM", "2:00 PM"))
+        """
+        date = _to_date(date)
+        try:
+            return self._memo[date]
+        except KeyError:
+            pass
+
+        raw = self.exceptions.get(date.isoformat())
+        if raw is None:
+            raw = self.weekly.get(date.weekday(), ())
+
+        slots = _display_slots(tuple(raw))
+        if len(self._memo) >= SCHEDULE_MEMO_DATES:
+            self._prune_memo()
+        self._memo[date] = slots
+        return slots
+
+    def _prune_memo(self):
+        # Dates already past are rarely asked about again; drop those first
+        today = datetime.date.today()
+        memo = {date: slots for date, slots in self._memo.items() if date >= today}
+        self._memo = memo if len(memo) < SCHEDULE_MEMO_DATES else {}
+
+    def works_on(self, date):
+        """Check whether the doctor has any scheduled slots on a date"""
+        return bool(self.slots_for(date))
+
+    def free_slots(self, date, booked=()):
+        """
+        Get the slots on a date that are not already booked
+
+        Args:
+            date: A date, datetime or YYYY-MM-DD string
+            booked: Booked times in either storage or display format
+
+        Returns:
+            list: Sorted display-format slots that are still free
+        """
+        slots = self.slots_for(date)
+        if not booked:
+            return list(slots)
+
+        taken = {slot_minutes(time) for time in booked}
+        return [slot for slot in slots if slot_minutes(slot) not in taken]
+
+    def iter_days(self, start, days):
+        """
+        Yield (date, slots) for each day in [start, start + days) with scheduled slots
+
+        Only the dates in the window are looked at, so the cost does not depend on
+        how far ahead the clinic publishes availability.
+        """
+        start = _to_date(start)
+        for offset in range(days):
+            date = start + datetime.timedelta(days=offset)
+            slots = self.slots_for(date)
+            if slots:
+                yield date, slots
+
+_SCHEDULE_CACHE = {}
+
+def schedule_for(doctor):
+    """
+    Get the (memoized) DoctorSchedule for a doctor document
+
+    Schedules are cached per doctor and `schedule.version`, which is bumped
+    whenever a template or exception changes, so the per-date memo survives
+    across requests until the doctor's schedule is edited.
+    """
+    schedule = doctor.get("schedule") or {}
+    version = schedule.get("version")
+    if version is None or "_id" not in doctor:
+        return DoctorSchedule.from_doctor(doctor)
+
+    key = (str(doctor["_id"]), version)
+    cached = _SCHEDULE_CACHE.get(key)
+    if cached is None:
+        if len(_SCHEDULE_CACHE) >= SCHEDULE_CACHE_SIZE:
+            _SCHEDULE_CACHE.clear()
+        cached = DoctorSchedule.from_doctor(doctor)
+        _SCHEDULE_CACHE[key] = cached
+    return cached
+
+def filter_slots(date, slots, part_of_day=None, weekdays=None):
+    """
+    Keep the slots on a date that match a patient's preferences
+
+    Args:
+        date: The slots' date
+        slots: Display-format slots
+        part_of_day: Optional "morning", "afternoon" or "evening"
+        weekdays: Optional weekday names or indices to keep
+
+    Returns:
+        list: The matching slots (all of them when there are no preferences)
+    """
+    if weekdays and _to_date(date).weekday() not in {_weekday_index(day) for day in weekdays}:
+        return []
+    if part_of_day not in PARTS_OF_DAY:
+        return list(slots)
+    low, high = PARTS_OF_DAY[part_of_day]
+    return [slot for slot in slots if low <= slot_minutes(slot) < high]
+
+def iter_free_slots(doctor_id, schedule, start, days, booked=None, part_of_day=None, weekdays=None):
+    """
+    Yield a doctor's free slots in time order as (date, minutes, doctor_id, slot)
+
+    Args:
+        doctor_id: The doctor's ID (used as a tie-breaker, so it must be comparable)
+        schedule: The doctor's DoctorSchedule
+        start: First date to look at
+        days: Number of days to look at
+        booked: Mapping of (doctor_id, YYYY-MM-DD) to booked times
+        part_of_day: Optional "morning", "afternoon" or "evening"
+        weekdays: Optional collection of weekday indices to keep
+    """
+    booked = booked or {}
+    low, high = PARTS_OF_DAY.get(part_of_day, (0, 24 * 60))
+    for date, _ in schedule.iter_days(start, days):
+        if weekdays and date.weekday() not in weekdays:
+            continue
+        for slot in schedule.free_slots(date, booked.get((doctor_id, date.isoformat()), ())):
+            minutes = slot_minutes(slot)
+            if low <= minutes < high:
+                yield date, minutes, doctor_id, slot
+
+def earliest_slots(schedules, start, days, k=5, booked_loader=None, part_of_day=None, weekdays=None):
+    """
+    Find the k earliest free (date, time, doctor) slots across many doctors
+
+    Each doctor's free slots form a time-ordered stream; the streams are merged
+    with a heap so only as many slots as needed are ever generated. Bookings are
+    loaded window by window (7 days, then doubling), so a search that is
+    satisfied in the first week never reads bookings for the rest of the horizon.
+
+    Args:
+        schedules: Mapping of doctor_id to DoctorSchedule
+        start: First date to search
+        days: Search horizon in days
+        k: Number of slots to return
+        booked_loader: Callable (first_date, last_date) returning a mapping of
+            (doctor_id, YYYY-MM-DD) to booked times
+        part_of_day: Optional "morning", "afternoon" or "evening"
+        weekdays: Optional weekday names or indices to keep
+
+    Returns:
+        list: Up to k (date, minutes, doctor_id, slot) tuples in time order
+    """
+    start = _to_date(start)
+    if weekdays:
+        weekdays = {_weekday_index(day) for day in weekdays}
+
+    results = []
+    offset = 0
+    window = EARLIEST_SEARCH_FIRST_WINDOW
+    while offset < days and len(results) < k:
+        window_days = min(window, days - offset)
+        window_start = start + datetime.timedelta(days=offset)
+        window_end = window_start + datetime.timedelta(days=window_days - 1)
+        booked = booked_loader(window_start, window_end) if booked_loader else None
+
+        streams = [
+            iter_free_slots(doctor_id, schedule, window_start, window_days, booked, part_of_day, weekdays)
+            for doctor_id, schedule in schedules.items()
+        ]
+        results.extend(islice(heapq.merge(*streams), k - len(results)))
+
+        offset += window_days
+        window *= 2
+
+    return results
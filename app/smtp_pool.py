@@ -0,0 +1,260 @@
+import os
+import time
+import socket
+import smtplib
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Open SMTP sessions kept per process
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+
+# Idle sessions older than this are probed with NOOP before reuse
+SMTP_HEALTH_CHECK_SECONDS = float(os.getenv("SMTP_HEALTH_CHECK_SECONDS", "30"))
+
+# Idle sessions older than this are closed instead of reused (servers drop them anyway)
+SMTP_MAX_IDLE_SECONDS = float(os.getenv("SMTP_MAX_IDLE_SECONDS", "240"))
+
+# Messages sent over one session before it is recycled
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+
+# Errors after which a session can't be trusted and is replaced. Not OSError:
+# every SMTPException is one, and a refused recipient leaves the session usable
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout)
+
+class _Session:
+    """An authenticated SMTP connection and its bookkeeping"""
+
+    def __init__(self, server):
+        self.server = server
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.messages = 0
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of authenticated SMTP sessions
+
+    The TCP connect, EHLO, STARTTLS and login are paid once per session rather
+    than once per email. Sessions idle for a while are checked with NOOP before
+    reuse, and a session that fails mid-send is discarded and the message
+    retried once on a fresh one.
+    """
+
+    def __init__(self, host, port=587, user=None, password=None, use_tls=True, size=SMTP_POOL_SIZE,
+                 timeout=SMTP_TIMEOUT_SECONDS, smtp_class=smtplib.SMTP):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.timeout = timeout
+        self.smtp_class = smtp_class
+
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"connections": 0, "reused": 0, "reconnects": 0, "sent": 0, "failed": 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _connect(self):
+        server = self.smtp_class(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.use_tls:
+                server.starttls()
+                server.ehlo()
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            self._discard(_Session(server))
+            raise
+        self._count("connections")
+        return _Session(server)
+
+    def _discard(self, session):
+        try:
+            session.server.quit()
+        except Exception:
+            try:
+                session.server.close()
+            except Exception:
+                pass
+
+    def _healthy(self, session):
+        now = time.monotonic()
+        if now - session.last_used > SMTP_MAX_IDLE_SECONDS:
+            return False
+        if session.messages >= SMTP_MAX_MESSAGES_PER_CONNECTION:
+            return False
+        if now - session.last_used > SMTP_HEALTH_CHECK_SECONDS:
+            try:
+                return session.server.noop()[0] == 250
+            except Exception:
+                return False
+        return True
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    session = self._idle.pop() if self._idle else None
+                if session is None:
+                    return self._connect()
+                if self._healthy(session):
+                    self._count("reused")
+                    return session
+                self._discard(session)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, session, broken=False):
+        try:
+            if broken or self._closed:
+                self._discard(session)
+                return
+            session.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(session)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a ready SMTP session; it goes back to the pool unless it failed"""
+        session = self._acquire()
+        broken = False
+        try:
+            yield session
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._release(session, broken)
+
+    def _send_on(self, session, from_email, to_email, message):
+        session.server.sendmail(from_email, to_email, message)
+        session.messages += 1
+
+    def send(self, from_email, to_email, message):
+        """
+        Send one message, retrying once on a fresh session if the pooled one was dropped
+
+        Args:
+            from_email: Envelope sender
+            to_email: Recipient address
+            message: The full message as a string
+
+        Returns:
+            bool: True once the server accepted the message
+        """
+        for attempt in range(2):
+            try:
+                with self.connection() as session:
+                    self._send_on(session, from_email, to_email, message)
+                self._count("sent")
+                return True
+            except CONNECTION_ERRORS as e:
+                if attempt:
+                    self._count("failed")
+                    raise
+                self._count("reconnects")
+                logger.info(f"SMTP session dropped ({e}), reconnecting")
+
+    def send_many(self, messages):
+        """
+        Send a batch of messages back to back over one pooled session
+
+        Args:
+            messages: Iterable of (from_email, to_email, message) tuples
+
+        Returns:
+            list: True/False per message, in order. If the session drops and
+            can't be reopened, the messages not yet sent are reported False
+
+        Raises:
+            SMTPServerDisconnected, ConnectionError, ...: Only when nothing was sent
+        """
+        messages = list(messages)
+        results = []
+        position = 0
+        retried = None
+        while position < len(messages):
+            connected = False
+            try:
+                with self.connection() as session:
+                    connected = True
+                    while position < len(messages) and session.messages < SMTP_MAX_MESSAGES_PER_CONNECTION:
+                        from_email, to_email, message = messages[position]
+                        try:
+                            self._send_on(session, from_email, to_email, message)
+                            results.append(True)
+                            self._count("sent")
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                            # The server rejected this message; the session is still good
+                            logger.warning(f"SMTP rejected message to {to_email}: {e}")
+                            results.append(False)
+                            self._count("failed")
+                        position += 1
+            except CONNECTION_ERRORS as e:
+                if not connected:
+                    if True not in results:
+                        # Can't reach the server at all; let the caller fall back
+                        raise
+                    # Part of the batch went out, so a fallback would send it twice
+                    logger.warning(f"SMTP reconnect failed during batch ({e}), "
+                                   f"{len(messages) - position} messages not sent")
+                    self._count("failed", len(messages) - position)
+                    results.extend([False] * (len(messages) - position))
+                    break
+                # The session died mid-batch: retry the message once on a new session
+                self._count("reconnects")
+                logger.info(f"SMTP session dropped during batch ({e}), reconnecting")
+                if retried == position:
+                    results.append(False)
+                    self._count("failed")
+                    position += 1
+                retried = position
+        return results
+
+    def close(self):
+        """Close every idle session"""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            self._discard(session)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_smtp_pool():
+    """
+    Get the shared SMTP pool built from the EMAIL_* settings
+
+    Returns:
+        SMTPConnectionPool or None: None when SMTP isn't configured
+    """
+    global _pool
+    if _pool is None and os.getenv("EMAIL_HOST") and os.getenv("EMAIL_USER") and os.getenv("EMAIL_PASSWORD"):
+        with _pool_lock:
+            if _pool is None:
+                _pool = SMTPConnectionPool(
+                    os.getenv("EMAIL_HOST"),
+                    int(os.getenv("EMAIL_PORT", 587)),
+                    os.getenv("EMAIL_USER"),
+                    os.getenv("EMAIL_PASSWORD"),
+                    use_tls=os.getenv("EMAIL_USE_TLS", "true").lower() not in ("0", "false", "no")
+                )
+    return _pool
@@ -0,0 +1,91 @@
+import os
+import json
+import logging
+from functools import lru_cache
+from app.phrase_matcher import PhraseMatcher
+
+logger = logging.getLogger(__name__)
+
+# Synonym table mapping each specialty to the terms that suggest it
+SPECIALTY_SYNONYMS_PATH = os.getenv(
+    "SPECIALTY_SYNONYMS_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "specialty_synonyms.json")
+)
+
+DEFAULT_SPECIALTY = "General Practitioner"
+
+class SpecialtyMatcher:
+    """
+    Rank doctor specialties for a free-text reason for visit
+
+    Every synonym is compiled into one word-boundary regex, so "heart" no longer
+    matches inside "heartburn". Each match scores its specialty by the number of
+    words in the matched term (more specific phrases count for more) and the
+    scores are normalised into confidences.
+    """
+
+    def __init__(self, synonyms):
+        self.term_specialties = {}
+        for specialty, terms in synonyms.items():
+            for term in terms:
+                self.term_specialties.setdefault(term.lower(), []).append(specialty)
+
+        self.matcher = PhraseMatcher(self.term_specialties, mode="word")
+        # Memoize per instance so a reloaded table never serves stale results
+        self.rank = lru_cache(maxsize=4096)(self._rank)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a matcher from a JSON synonym table ({specialty: [terms]})"""
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def _rank(self, reason):
+        """
+        Rank specialties for a reason for visit
+
+        Args:
+            reason: The patient's reason for the visit
+
+        Returns:
+            tuple: ((specialty, confidence), ...) best first; empty if nothing matched
+        """
+        if not reason:
+            return ()
+
+        scores = {}
+        for _, _, term in self.matcher.finditer(reason.lower()):
+            weight = len(term.split())
+            for specialty in self.term_specialties.get(term, ()):
+                scores[specialty] = scores.get(specialty, 0) + weight
+
+        total = sum(scores.values())
+        if not total:
+            return ()
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return tuple((specialty, score / total) for specialty, score in ranked)
+
+    def best(self, reason, default=DEFAULT_SPECIALTY):
+        """Return the highest ranked specialty, or the default when nothing matched"""
+        ranked = self.rank(reason)
+        return ranked[0][0] if ranked else default
+
+_matcher = None
+
+def get_specialty_matcher():
+    """Get the shared matcher, building it from the synonym table on first use"""
+    global _matcher
+    if _matcher is None:
+        try:
+            _matcher = SpecialtyMatcher.from_file(SPECIALTY_SYNONYMS_PATH)
+        except Exception as e:
+            logger.error(f"Failed to load specialty synonyms from {SPECIALTY_SYNONYMS_PATH}: {e}")
+            _matcher = SpecialtyMatcher({})
+    return _matcher
+
+def reload_specialty_matcher():
+    """Rebuild the shared matcher after the synonym table has been edited"""
+    global _matcher
+    _matcher = None
+    return get_specialty_matcher()
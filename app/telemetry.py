@@ -0,0 +1,209 @@
+import os
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Share of LLM generations exported to Langfuse (0.0 - 1.0)
+TELEMETRY_SAMPLE_RATE = float(os.getenv("TELEMETRY_SAMPLE_RATE", "1.0"))
+
+# Generations waiting for export; when full, new ones are dropped rather than blocking
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "1000"))
+
+# Generations exported per batch, and the longest a partial batch waits
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "50"))
+TELEMETRY_FLUSH_SECONDS = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "2.0"))
+
+# How long shutdown waits for queued generations to be exported
+TELEMETRY_SHUTDOWN_SECONDS = float(os.getenv("TELEMETRY_SHUTDOWN_SECONDS", "5.0"))
+
+class TelemetrySink:
+    """
+    Buffer telemetry records and export them in batches from a background thread
+
+    `record` only samples and enqueues, so request threads never wait on the
+    exporter. When the bounded queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, exporter, queue_size=TELEMETRY_QUEUE_SIZE, batch_size=TELEMETRY_BATCH_SIZE,
+                 flush_seconds=TELEMETRY_FLUSH_SECONDS, sample_rate=TELEMETRY_SAMPLE_RATE):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.sample_rate = sample_rate
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = {"recorded": 0, "sampled_out": 0, "dropped": 0, "exported": 0, "batches": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="telemetry-sink", daemon=True)
+        self._thread.start()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def record(self, item):
+        """
+        Queue a record for export without blocking
+
+        Returns:
+            bool: True if queued, False if sampled out or dropped
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._count("sampled_out")
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("recorded")
+        return True
+
+    def _next_batch(self):
+        """Wait for the first record, then collect more until the batch is full or the interval passes"""
+        try:
+            # Short waits so shutdown isn't held up by an idle sink
+            batch = [self._queue.get(timeout=min(self.flush_seconds, 0.25))]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size and not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # On shutdown, take whatever is already queued without waiting
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.exporter(batch)
+                self._count("exported", len(batch))
+                self._count("batches")
+            except Exception as e:
+                self._count("errors")
+                logger.warning(f"Telemetry export of {len(batch)} records failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout=TELEMETRY_SHUTDOWN_SECONDS):
+        """Wait until everything queued so far has been exported (or `timeout` passes)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def shutdown(self, timeout=TELEMETRY_SHUTDOWN_SECONDS):
+        """Export what's queued, then stop the background thread"""
+        self._stopping.set()
+        self._thread.join(timeout)
+        close = getattr(self.exporter, "close", None)
+        if close:
+            close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queued"] = self._queue.qsize()
+        stats["sample_rate"] = self.sample_rate
+        return stats
+
+class LangfuseExporter:
+    """Send batches of LLM generation records to Langfuse with one shared client"""
+
+    def __init__(self):
+        from langfuse import Langfuse
+        self.langfuse = Langfuse(
+            public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+            secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
+            host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
+        )
+
+    def _start_generation(self, **kwargs):
+        # Langfuse 3 has start_generation; later versions only start_observation
+        start = getattr(self.langfuse, "start_generation", None)
+        if start is not None:
+            return start(**kwargs)
+        return self.langfuse.start_observation(as_type="generation", **kwargs)
+
+    def __call__(self, batch):
+        for item in batch:
+            generation = self._start_generation(
+                name=item["name"],
+                model=item["model"],
+                input=item["input"],
+                metadata=item["metadata"]
+            )
+            generation.update(output=item["output"], usage_details=item["usage"])
+            generation.end()
+
+    def close(self):
+        self.langfuse.flush()
+
+def _disabled_exporter(batch):
+    pass
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_telemetry():
+    """
+    Get the shared telemetry sink
+
+    Generations are exported to Langfuse when LANGFUSE_PUBLIC_KEY is set;
+    otherwise records are counted and discarded.
+    """
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                exporter = _disabled_exporter
+                if os.getenv("LANGFUSE_PUBLIC_KEY"):
+                    try:
+                        exporter = LangfuseExporter()
+                    except Exception as e:
+                        logger.error(f"Langfuse unavailable, telemetry disabled: {e}")
+                sink = TelemetrySink(exporter)
+                atexit.register(sink.shutdown)
+                _sink = sink
+    return _sink
+
+def record_generation(name, model, input, output, usage=None, metadata=None):
+    """
+    Record one LLM generation for cost tracking, without blocking the caller
+
+    Args:
+        name: Name of the call site (e.g. "intent_classification_gpt4")
+        model: Model name
+        input: The messages sent
+        output: The model's reply
+        usage: {"input", "output", "total"} token counts
+        metadata: Call parameters and anything else worth keeping
+    """
+    return get_telemetry().record({
+        "name": name,
+        "model": model,
+        "input": input,
+        "output": output,
+        "usage": usage or {},
+        "metadata": metadata or {}
+    })
@@ -0,0 +1,63 @@
+"""
+Microbenchmark: per-response compliance check cost
+
+Compares the old approach (lowercasing the response once per problematic
+phrase) with the compiled compliance engine, first scan and cached.
+
+Run from the repository root:
+    python benchmarks/bench_compliance.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.compliance import ComplianceEngine, COMPLIANCE_RULES_PATH
+
+RESPONSES = [
+    "Your appointment with Dr. Smith is confirmed for Friday, March 15 at 2:00 PM. Is there anything else I can help with?",
+    "Our clinic is open Monday through Friday from 9 AM to 5 PM, and Saturday from 9 AM to 1 PM.",
+    "I'm sorry to hear about your headache. You should take some rest and drink plenty of water.",
+    "Based on what you describe, you definitely have a migraine. I can prescribe something for it.",
+    "We accept most major insurance plans, including Medicare. Please bring your insurance card to your visit.",
+]
+
+PROBLEMATIC_PHRASES = [
+    "I diagnose you with",
+    "you should take",
+    "I recommend this medication",
+    "this drug will help",
+    "I can prescribe",
+    "you definitely have"
+]
+
+def legacy_check(response):
+    return [phrase for phrase in PROBLEMATIC_PHRASES if phrase.lower() in response.lower()]
+
+def main(number=5000):
+    engine = ComplianceEngine.from_file(COMPLIANCE_RULES_PATH)
+
+    def legacy():
+        for response in RESPONSES:
+            legacy_check(response)
+
+    def engine_uncached():
+        for response in RESPONSES:
+            engine._check(response)
+
+    def engine_cached():
+        for response in RESPONSES:
+            engine.check(response)
+
+    per_response = lambda fn: timeit.timeit(fn, number=number) / (number * len(RESPONSES)) * 1e6
+    print(f"legacy phrase loop:          {per_response(legacy):8.2f} us/response (detection only)")
+    print(f"compiled engine (1st check): {per_response(engine_uncached):8.2f} us/response (detection + rewrite)")
+    print(f"compiled engine (cached):    {per_response(engine_cached):8.2f} us/response")
+
+    flagged = sum(1 for response in RESPONSES if engine.check(response).violations)
+    needs_llm = sum(1 for response in RESPONSES if engine.check(response).needs_llm)
+    print(f"flagged {flagged}/{len(RESPONSES)} responses; {needs_llm} still need a model rewrite (previously {flagged})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark: memory and copy cost of the state kept per conversation
+
+Replays the appointment_context of a booking and a reschedule turn by turn and
+reports, for each turn:
+
+- the context's size as live Python objects
+- its size as the encoded checkpoint
+- what the turn writes to Mongo as a delta
+
+It then compares resuming from a deepcopy of the live values (the previous
+approach) with decoding the encoded checkpoint.
+
+Run from the repository root:
+    python benchmarks/bench_conversation_state.py
+"""
+import os
+import sys
+import copy
+import timeit
+import tracemalloc
+
+import bson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.checkpoints import CHECKPOINT_MAX_BYTES, checkpoint_delta, decode_checkpoint, encode_checkpoint
+
+NEW_BOOKING = {
+    "state": "collecting_name", "patient_name": None, "patient_phone": None, "patient_birthdate": None,
+    "patient_email": None, "appointment_reason": None, "doctor_specialty": None, "selected_doctor_id": None,
+    "appointment_date": None, "appointment_time": None,
+    "attempts": {"name": 0, "phone": 0, "birthdate": 0, "reason": 0},
+}
+
+def available_dates(days, slots):
+    return [{"date": f"2026-10-{day}", "formatted_date": f"Monday, October {day}, 2026", "slots": list(slots)}
+            for day in days]
+
+# What each turn changes in appointment_context, as recorded from the agent
+BOOKING = [
+    {"state": "collecting_phone", "patient_name": "John Smith"},
+    {"state": "collecting_birthdate", "patient_phone": "555-123-4567"},
+    {"state": "collecting_reason", "patient_birthdate": "1990-05-12"},
+    {"state": "suggesting_specialty", "appointment_reason": "I have chest pain and palpitations",
+     "doctor_specialty": "Cardiologist"},
+    {"state": "collecting_date_time", "selected_doctor_id": "D002",
+     "available_dates": available_dates((19, 20, 21), ("9:30 AM", "10:30 AM", "1:30 PM", "3:30 PM"))},
+    {"state": "collecting_email", "appointment_date": "2026-10-19", "appointment_time": "9:30 AM"},
+    {"state": "confirming", "patient_email": "john@example.com"},
+    {"state": "booking_confirmed"},
+]
+
+RESCHEDULE = [
+    {"state": "rescheduling_collecting_id"},
+    {"state": "rescheduling_date_time", "reschedule_appointment_id": "MA-00001",
+     "reschedule_appointment": {"appointment_id": "MA-00001", "doctor_id": "D002", "doctor_name": "Dr. Johnson",
+                                "patient_name": "John Smith", "patient_email": "john@example.com",
+                                "date": "2026-10-19", "time": "9:30 AM", "formatted_date": "Monday, October 19, 2026"},
+     "available_dates": available_dates((20, 21, 22), ("9:30 AM", "10:30 AM", "1:30 PM", "3:30 PM"))},
+    {"state": "rescheduling_confirming", "new_appointment_date": "2026-10-20", "new_appointment_time": "9:30 AM"},
+    {"state": "reschedule_confirmed",
+     "reschedule_details": {"appointment_id": "MA-00001", "doctor_name": "Dr. Johnson", "patient_name": "John Smith",
+                            "patient_email": "john@example.com", "old_date": "Monday, October 19, 2026",
+                            "old_time": "9:30 AM", "new_date": "Tuesday, October 20, 2026", "new_time": "9:30 AM"}},
+]
+
+def live_bytes(values):
+    """Bytes allocated to hold values as Python objects"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = decode_checkpoint(bson.encode(values))
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return size
+
+def replay(name, turns, number=2000):
+    print(f"\n{name}")
+    print(f"{'state':<28} {'live B':>7} {'encoded B':>10} {'delta B':>8} {'deepcopy us':>12} {'decode us':>10}")
+    values = {"conversation_in_progress": True, "original_intent": "schedule_appointment",
+              "appointment_context": copy.deepcopy(NEW_BOOKING)}
+    peak = 0
+    for changes in turns:
+        previous = copy.deepcopy(values)
+        values["appointment_context"].update(copy.deepcopy(changes))
+        encoded, data = encode_checkpoint(values)
+        sets, unsets = checkpoint_delta(previous, encoded)
+        delta = len(bson.encode({"$set": sets, "$unset": unsets}))
+        deepcopy_us = timeit.timeit(lambda: copy.deepcopy(encoded), number=number) / number * 1e6
+        decode_us = timeit.timeit(lambda: decode_checkpoint(data), number=number) / number * 1e6
+        live = live_bytes(encoded)
+        peak = max(peak, live, len(data))
+        print(f"{changes['state']:<28} {live:>7} {len(data):>10} {delta:>8} {deepcopy_us:>12.1f} {decode_us:>10.1f}")
+    return peak
+
+def main():
+    peak = max(replay("booking", BOOKING), replay("reschedule", RESCHEDULE))
+    print(f"\nlargest conversation: {peak} B; CHECKPOINT_MAX_BYTES is {CHECKPOINT_MAX_BYTES}")
+
+if __name__ == "__main__":
+    main()
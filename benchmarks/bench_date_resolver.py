@@ -0,0 +1,57 @@
+"""
+Microbenchmark: natural language date/time resolution
+
+Times the table-driven resolver on typical booking replies, cold and memoized,
+next to dateutil's fuzzy parser (which extract_date_time_action used to lean
+on after every GPT round trip).
+
+Run from the repository root:
+    python benchmarks/bench_date_resolver.py
+"""
+import os
+import sys
+import timeit
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import parser
+from app.date_resolver import resolve_date_time, _resolve_date_time, _resolve_date, _resolve_time
+
+REFERENCE = datetime.date(2030, 1, 7)
+
+TRANSCRIPTS = [
+    "can we do friday at 2 pm",
+    "tomorrow morning please",
+    "I want march 15 at 2:30 pm",
+    "the 3rd at 9 if possible",
+    "in two weeks around 4",
+    "3/15 at 10:45",
+]
+
+def main(number=5000):
+    def cold():
+        _resolve_date_time.cache_clear()
+        _resolve_date.cache_clear()
+        _resolve_time.cache_clear()
+        for text in TRANSCRIPTS:
+            resolve_date_time(text, REFERENCE)
+
+    def cached():
+        for text in TRANSCRIPTS:
+            resolve_date_time(text, REFERENCE)
+
+    def dateutil_fuzzy():
+        for text in TRANSCRIPTS:
+            try:
+                parser.parse(text, fuzzy=True, default=datetime.datetime(2030, 1, 7))
+            except (ValueError, OverflowError):
+                pass
+
+    per_call = lambda fn: timeit.timeit(fn, number=number) / (number * len(TRANSCRIPTS)) * 1e6
+    print(f"resolver (cold):        {per_call(cold):8.2f} us/call")
+    print(f"resolver (memoized):    {per_call(cached):8.2f} us/call")
+    print(f"dateutil fuzzy parse:   {per_call(dateutil_fuzzy):8.2f} us/call")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: per-turn database wall time in the cancel and reschedule flows
+
+Runs the appointment states that look up an appointment's patient, doctor and
+open dates, with every Mongo call delayed by a fixed round trip (mongomock
+answers instantly, a real server doesn't). Compares the lookups run one after
+another (DB_LOOKUP_WORKERS=0) with the same lookups gathered on the pool.
+
+Run from the repository root:
+    python benchmarks/bench_db_lookups.py
+    python benchmarks/bench_db_lookups.py --rtt-ms 5 --turns 50
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import functools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.suite import load_app
+
+def add_round_trips(rtt_seconds, counter):
+    """Delay every mongomock collection call by one round trip"""
+    import mongomock.collection
+    for name in ("find_one", "find", "update_one", "insert_one", "find_one_and_update"):
+        method = getattr(mongomock.collection.Collection, name)
+
+        def delayed(*args, _method=method, **kwargs):
+            counter[0] += 1
+            time.sleep(rtt_seconds)
+            return _method(*args, **kwargs)
+        setattr(mongomock.collection.Collection, name, functools.wraps(method)(delayed))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rtt-ms", type=float, default=2.0, help="Round trip added to every Mongo call")
+    parser.add_argument("--turns", type=int, default=20, help="Turns timed per state")
+    args = parser.parse_args()
+
+    load_app()
+    os.chdir(tempfile.mkdtemp())
+    from app import data_access
+    from app.models import Doctor, Patient, Appointment, doctors_collection
+    from app.agents.appointment import STATES, STATE_HANDLERS, AppointmentTurn
+
+    Doctor.seed_sample_doctors()
+    doctor = doctors_collection.find_one({"specialty": "Cardiologist"})
+    patient_id = Patient.create("John Smith", "555-123-4567", "john@example.com", "1990-05-12")
+    appointment_id = Appointment.create(patient_id, str(doctor["_id"]), "2030-01-07", "9:30 AM", "Chest pain")["appointment_id"]
+    round_trips = [0]
+    add_round_trips(args.rtt_ms / 1000, round_trips)
+
+    cases = [
+        ("cancel: look up", STATES["CANCELLING_COLLECTING_ID"], f"My appointment ID is {appointment_id}", {}),
+        ("cancel: confirm", STATES["CANCELLING_CONFIRMING"], "yes, please cancel it",
+         {"cancellation_appointment_id": appointment_id, "cancellation_appointment": {}}),
+        ("reschedule: look up", STATES["RESCHEDULING_COLLECTING_ID"], f"It's {appointment_id}", {}),
+        ("reschedule: confirm", STATES["RESCHEDULING_CONFIRMING"], "yes, that works",
+         {"reschedule_appointment_id": appointment_id, "new_appointment_date": "2030-01-08",
+          "new_appointment_time": "10:30 AM",
+          "reschedule_appointment": {"doctor_name": "Dr. Johnson", "patient_name": "John Smith",
+                                     "date": "2030-01-07", "time": "9:30 AM"}}),
+    ]
+
+    def run(state_name, transcript, context):
+        context = {"state": state_name, **context}
+        state = {"transcript": transcript, "intent": "", "conversation_id": "bench", "appointment_context": context}
+        STATE_HANDLERS[state_name].handle(AppointmentTurn(state, context))
+        return context["state"]
+
+    print(f"{args.rtt_ms:g} ms per Mongo round trip")
+    print(f"{'state':<22} {'calls':>6} {'sequential ms':>14} {'gathered ms':>12}")
+    for label, state_name, transcript, context in cases:
+        timings = []
+        for workers in (0, 8):
+            data_access.DB_LOOKUP_WORKERS = workers
+            data_access._executor = None
+            next_state = run(state_name, transcript, context)
+            round_trips[0] = 0
+            started = time.perf_counter()
+            for _ in range(args.turns):
+                run(state_name, transcript, context)
+            timings.append((time.perf_counter() - started) / args.turns * 1000)
+        assert next_state != state_name, f"{label} did not advance"
+        calls = round_trips[0] / args.turns
+        print(f"{label:<22} {calls:>6.0f} {timings[0]:>14.1f} {timings[1]:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Microbenchmark: per-turn keyword routing cost
+
+Compares the old approach (each agent re-declares its keyword lists and scans
+`transcript.lower()` once per keyword) with the shared keyword engine, which
+tags a transcript once and lets every agent test set membership.
+
+Run from the repository root:
+    python benchmarks/bench_keywords.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.keywords import LEXICONS, REGEX_LEXICONS, KeywordEngine
+
+TRANSCRIPTS = [
+    "Hi, I'd like to book an appointment with a doctor next week please",
+    "Can I change my appointment to Friday afternoon?",
+    "I have had a terrible headache and a fever since yesterday",
+    "Yes that's correct, thank you so much",
+    "What are your opening hours on the weekend?",
+    "I need to cancel the appointment I made, I no longer need it",
+]
+
+def legacy_turn(transcript):
+    """Replay the keyword checks a single turn used to run across the agents"""
+    found = set()
+    for name, phrases in LEXICONS.items():
+        # Every call site lowercased the transcript again for each keyword
+        if any(phrase in transcript.lower() for phrase in phrases):
+            found.add(name)
+    for name, patterns in REGEX_LEXICONS.items():
+        for pattern in patterns:
+            if re.search(pattern, transcript.lower()):
+                found.add(name)
+                break
+    return found
+
+def main(number=2000):
+    engine = KeywordEngine(LEXICONS, REGEX_LEXICONS)
+
+    def engine_uncached():
+        for transcript in TRANSCRIPTS:
+            engine._tags(transcript.lower())
+
+    def engine_cached():
+        # Later agents in the same turn hit the cache
+        for transcript in TRANSCRIPTS:
+            engine.tags(transcript.lower())
+
+    def legacy():
+        for transcript in TRANSCRIPTS:
+            legacy_turn(transcript)
+
+    for transcript in TRANSCRIPTS:
+        assert legacy_turn(transcript) == set(engine._tags(transcript.lower())), transcript
+
+    per_turn = lambda fn: timeit.timeit(fn, number=number) / (number * len(TRANSCRIPTS)) * 1e6
+    legacy_us = per_turn(legacy)
+    print(f"legacy per-call scans:     {legacy_us:8.2f} us/turn")
+    print(f"keyword engine (1st scan): {per_turn(engine_uncached):8.2f} us/turn")
+    print(f"keyword engine (cached):   {per_turn(engine_cached):8.2f} us/turn")
+
+if __name__ == "__main__":
+    main()
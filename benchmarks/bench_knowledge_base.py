@@ -0,0 +1,61 @@
+"""
+Microbenchmark: knowledge base lookup cost as the FAQ grows
+
+Builds synthetic FAQs of increasing size around the shipped entries and times
+an uncached lookup with the inverted index against the old nested substring
+scan over every question phrase.
+
+Run from the repository root:
+    python benchmarks/bench_knowledge_base.py
+"""
+import os
+import sys
+import json
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.knowledge_base import KnowledgeBaseIndex, KNOWLEDGE_BASE_PATH
+
+QUERIES = [
+    "what are your hours on saturday",
+    "do you take medicare",
+    "is there parking near the clinic",
+    "what is the weather like",
+]
+
+def synthetic_entries(size, seed=7):
+    """The shipped FAQ plus `size` generated entries with their own vocabulary"""
+    with open(KNOWLEDGE_BASE_PATH) as f:
+        entries = json.load(f)
+    rng = random.Random(seed)
+    syllables = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+    word = lambda: "".join(rng.choice(syllables) for _ in range(3))
+    for i in range(size):
+        entries[f"topic_{i}"] = {
+            "question": [" ".join(["what", "is", "the"] + [word() for _ in range(3)]) for _ in range(4)],
+            "answer": f"Answer {i}"
+        }
+    return entries
+
+def legacy_lookup(entries, query):
+    for category, data in entries.items():
+        for phrase in data["question"]:
+            if phrase.lower() in query.lower():
+                return category
+    return None
+
+def main(number=500):
+    print(f"{'entries':>8} {'index (us)':>12} {'substring scan (us)':>20}")
+    for size in (0, 100, 1000, 5000):
+        entries = synthetic_entries(size)
+        index = KnowledgeBaseIndex(entries)
+
+        indexed = timeit.timeit(lambda: [index._lookup(q) for q in QUERIES], number=number)
+        scanned = timeit.timeit(lambda: [legacy_lookup(entries, q) for q in QUERIES], number=number)
+        per_query = lambda seconds: seconds / (number * len(QUERIES)) * 1e6
+        print(f"{len(entries):>8} {per_query(indexed):>12.2f} {per_query(scanned):>20.2f}")
+
+if __name__ == "__main__":
+    main()
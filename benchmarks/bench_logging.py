@@ -0,0 +1,58 @@
+"""
+Microbenchmark: per-call cost of appointment debug logging
+
+Compares the old debug_log (an f-string of the whole state, then print) with
+the lazy debug_log from app.logs when DEBUG is off, which is the production
+path. stdout is redirected to /dev/null so only formatting and I/O calls are
+measured, not the terminal.
+
+Run from the repository root:
+    python benchmarks/bench_logging.py
+"""
+import os
+import sys
+import timeit
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.logs import debug_logger, phi
+
+# A mid-booking turn's state, as appointment_agent receives it
+STATE = {
+    "transcript": "my email is jane.doe@example.com",
+    "intent": "schedule_appointment",
+    "patient_id": "demo_patient",
+    "conversation_in_progress": True,
+    "original_intent": "schedule_appointment",
+    "appointment_context": {
+        "state": "collecting_email",
+        "patient_name": "Jane Doe",
+        "patient_phone": "555-123-4567",
+        "patient_email": None,
+        "patient_birthdate": "1990-04-12",
+        "appointment_reason": "persistent cough",
+        "doctor_specialty": "Internal Medicine",
+        "selected_doctor_id": "65f0c0ffee0000000000abcd",
+        "appointment_date": "2026-10-22",
+        "appointment_time": "10:30",
+        "attempts": {"name": 0, "phone": 1, "birthdate": 0, "reason": 0}
+    }
+}
+
+def legacy_debug_log(message):
+    print(f"DEBUG: {message}")
+
+debug_log = debug_logger("bench.appointment")
+
+def main():
+    number = 20000
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        legacy = timeit.timeit(lambda: legacy_debug_log(f"Appointment agent received state: {STATE}"), number=number)
+    lazy = timeit.timeit(lambda: debug_log("Appointment agent received state: %s", phi(STATE)), number=number)
+
+    print(f"legacy f-string + print:  {legacy / number * 1e6:7.2f} us/call")
+    print(f"lazy debug_log (off):     {lazy / number * 1e6:7.2f} us/call  ({legacy / lazy:.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: clinic document retrieval
+
+Measures ingest (chunk + embed + save), memory-mapped load, per-question search
+latency, and how many sample general questions are answered straight from a
+passage, need a short grounded model call, or miss the documents entirely.
+
+Run from the repository root:
+    python benchmarks/bench_retrieval.py
+"""
+import os
+import sys
+import time
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import retrieval
+from app.retrieval import DocumentIndex
+
+QUESTIONS = [
+    "how do I cancel my appointment",
+    "what should I bring to my first visit",
+    "do you see kids",
+    "is there a cardiologist",
+    "do I need to fast before blood work",
+    "can I come on saturday to see a dermatologist",
+    "what if I have an emergency",
+    "how do I get my appointment id",
+    "when will I get a confirmation email",
+    "how much does it cost without insurance",
+    "can I reschedule my appointment",
+    "where do I park",
+    "do you do x-rays",
+    "tell me a joke",
+]
+
+def main(number=2000):
+    with tempfile.TemporaryDirectory() as index_dir:
+        started = time.perf_counter()
+        index = DocumentIndex.build()
+        built = time.perf_counter()
+        index.save(index_dir)
+        saved = time.perf_counter()
+        loaded = DocumentIndex.load(index_dir)
+        done = time.perf_counter()
+
+        print(f"passages:          {len(index.chunks)}")
+        print(f"ingest (build):    {(built - started) * 1000:8.2f} ms")
+        print(f"save:              {(saved - built) * 1000:8.2f} ms")
+        print(f"load (mmap):       {(done - saved) * 1000:8.2f} ms")
+
+        seconds = timeit.timeit(lambda: [loaded.search(q) for q in QUESTIONS], number=number)
+        print(f"search:            {seconds / (number * len(QUESTIONS)) * 1e6:8.2f} us/question")
+
+        # Route the sample questions through the same decision the agent uses
+        retrieval._index = loaded
+        outcomes = {}
+        for question in QUESTIONS:
+            mode = retrieval.retrieve_answer(question)["mode"]
+            outcomes[mode] = outcomes.get(mode, 0) + 1
+            print(f"  {mode:<7} {question}")
+
+        total = len(QUESTIONS)
+        print(f"answered without an LLM: {outcomes.get('direct', 0)}/{total}"
+              f" | short grounded call: {outcomes.get('llm', 0)}/{total}"
+              f" | fell back to GPT-4o: {outcomes.get('miss', 0)}/{total}")
+
+if __name__ == "__main__":
+    main()
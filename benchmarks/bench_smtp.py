@@ -0,0 +1,129 @@
+"""
+Throughput benchmark: per-message SMTP sessions vs the pooled sessions
+
+The old send_email opened a new connection, said EHLO, sent one message and
+quit for every notification. The pool keeps sessions open, and send_many
+sends a batch back to back over one session.
+
+Runs against aiosmtpd when it is installed, otherwise against a small
+built-in SMTP stand-in that adds a simulated network round trip to every
+reply (--rtt-ms), which is where the handshake cost comes from in practice.
+
+Run from the repository root:
+    python benchmarks/bench_smtp.py [--messages 200] [--rtt-ms 2]
+"""
+import os
+import sys
+import time
+import smtplib
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.smtp_pool import SMTPConnectionPool
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail: EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def reply(self, line):
+        time.sleep(self.server.rtt)
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost stand-in ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.reply("250-localhost\r\n250 8BITMIME")
+            elif command.startswith(("HELO", "MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.received += 1
+                self.reply("250 OK queued")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class _StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, rtt):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.rtt = rtt
+        self.received = 0
+
+def start_server(rtt_ms):
+    """Start an SMTP sink; returns (port, description, stop)"""
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.handlers import Sink
+        controller = Controller(Sink(), hostname="127.0.0.1", port=0)
+        controller.start()
+        return controller.server.sockets[0].getsockname()[1], "aiosmtpd", controller.stop
+    except ImportError:
+        server = _StandInServer(rtt_ms / 1000)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.server_address[1], f"built-in stand-in ({rtt_ms} ms RTT)", server.shutdown
+
+def message(number):
+    return ("clinic@example.com", f"patient{number}@example.com",
+            f"Subject: Appointment reminder {number}\r\n\r\nSee you tomorrow.\r\n")
+
+def legacy_send(port, from_email, to_email, body):
+    """The old path: one session per message"""
+    with smtplib.SMTP("127.0.0.1", port, timeout=10) as server:
+        server.ehlo()
+        server.sendmail(from_email, to_email, body)
+    return True
+
+def timed(label, count, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:34s} {count / elapsed:8.0f} msg/s  ({elapsed * 1000 / count:6.2f} ms/msg)")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rtt-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    port, description, stop = start_server(args.rtt_ms)
+    print(f"SMTP server: {description}, {args.messages} messages")
+    batch = [message(n) for n in range(args.messages)]
+
+    try:
+        legacy = timed("legacy (session per message)", len(batch),
+                       lambda: [legacy_send(port, *m) for m in batch])
+
+        pool = SMTPConnectionPool("127.0.0.1", port, use_tls=False, size=args.threads)
+        timed("pooled send, 1 thread", len(batch), lambda: [pool.send(*m) for m in batch])
+        timed("pooled send_many (one session)", len(batch), lambda: pool.send_many(batch))
+
+        with ThreadPoolExecutor(args.threads) as executor:
+            timed(f"legacy, {args.threads} threads", len(batch),
+                  lambda: list(executor.map(lambda m: legacy_send(port, *m), batch)))
+            timed(f"pooled send, {args.threads} threads", len(batch),
+                  lambda: list(executor.map(lambda m: pool.send(*m), batch)))
+        pool.close()
+        print(f"pool stats: {pool.stats}")
+        print(f"legacy total: {legacy:.2f}s")
+    finally:
+        stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark: orchestration cost per turn, with every agent stubbed
+
+The stub agents do no I/O and almost no work, so what is left is the cost of
+running a turn: process_workflow's bookkeeping, node timing and cost tagging,
+the routers, and the executor itself. Compares the LangGraph StateGraph with
+the direct-dispatch executor (WORKFLOW_EXECUTOR=direct) on the same scenario
+corpus, after checking that both produce the same final state and visit the
+same nodes for every scenario.
+
+Run from the repository root:
+    python benchmarks/bench_workflow.py
+"""
+import os
+import sys
+import copy
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.suite import load_app
+
+APPOINTMENT_INTENTS = {"schedule_appointment", "cancel_appointment", "reschedule_appointment"}
+
+def stub_receptionist(state):
+    transcript = state.get("transcript", "").lower()
+    if "cancel" in transcript:
+        intent = "cancel_appointment"
+    elif "move" in transcript:
+        intent = "reschedule_appointment"
+    elif "book" in transcript:
+        intent = "schedule_appointment"
+    elif state.get("conversation_in_progress") and state.get("original_intent"):
+        intent = state["original_intent"]
+    elif "?" in transcript:
+        intent = "general_inquiry"
+    else:
+        intent = "health_question"
+    state["intent"] = intent
+    if "[switch]" in transcript:
+        # Outside the schema too: route_by_intent sends the turn to the call center
+        state["switch_context"] = True
+    if intent in APPOINTMENT_INTENTS and not state.get("conversation_in_progress"):
+        state["conversation_in_progress"] = True
+        state["original_intent"] = intent
+    return state
+
+def stub_appointment(state):
+    transcript = state.get("transcript", "").lower()
+    context = state.setdefault("appointment_context", {})
+    if "[confirm]" in transcript:
+        context["state"] = {"cancel_appointment": "cancellation_confirmed",
+                            "reschedule_appointment": "reschedule_confirmed"}.get(state["intent"], "booking_confirmed")
+        state["appointment_details"] = {"appointment_id": "MA-00042"}
+    else:
+        context["state"] = "collecting_name"
+    if "[details]" in transcript:
+        context["cancellation_details"] = {"appointment_id": "MA-00042"}
+    if "[notify]" in transcript:
+        # Not part of the state schema; only the router after this node sees it
+        state["needs_notification"] = True
+    if "[sent]" in transcript:
+        state["notification_sent"] = True
+    state["response"] = f"Appointment step {context['state']}"
+    return state
+
+def stub_call_center(state):
+    state["response"] = "We're open 8 AM to 6 PM, Monday to Friday."
+    return state
+
+def stub_notification(state):
+    context = state.get("appointment_context", {})
+    context[f"{context.get('state', 'booking_confirmed').split('_')[0]}_notification_sent"] = True
+    state["response"] = state.get("response", "") + " A confirmation email is on its way."
+    return state
+
+def stub_content_management(state):
+    state["response"] = state.get("response", "").strip()
+    return state
+
+STUB_AGENTS = {
+    "receptionist": stub_receptionist,
+    "appointment": stub_appointment,
+    "call_center": stub_call_center,
+    "notification": stub_notification,
+    "content_management": stub_content_management,
+}
+
+def _turn(transcript, **state):
+    return {"transcript": transcript, "patient_id": "demo_patient", "conversation_id": "bench", **state}
+
+# One turn each; together they take every edge and every branch of both routers
+SCENARIOS = [
+    _turn("What are your opening hours?"),
+    _turn("I have a sore throat"),
+    _turn("I'd like to book an appointment"),
+    _turn("I'd like to book an appointment [confirm]"),
+    _turn("book it [confirm] [sent]"),
+    _turn("book it [notify]"),
+    _turn("Please cancel my appointment [details]"),
+    _turn("Please cancel my appointment [confirm]"),
+    _turn("Can I move my appointment? [confirm]"),
+    _turn("book [switch]"),
+    _turn("Jane Doe", conversation_in_progress=True, original_intent="schedule_appointment",
+          appointment_context={"state": "collecting_name"}),
+    _turn("Do you take Medicare?", intent="schedule_appointment",
+          appointment_context={"state": "booking_confirmed", "booking_notification_sent": True}),
+    _turn("I'd like to book another one", appointment_context={"state": "booking_confirmed"}),
+    _turn("cancel that one too", appointment_context={"state": "cancellation_confirmed",
+                                                     "cancellation_notification_sent": True}),
+    _turn("ok", intent="cancel_appointment", cancellation_details={"appointment_id": "MA-00007"},
+          conversation_in_progress=True, original_intent="cancel_appointment"),
+]
+
+def traced(agents, path):
+    """Wrap agents so each call appends its node name to `path`"""
+    def wrap(name, agent):
+        def node(state):
+            path.append(name)
+            return agent(state)
+        return node
+    return {name: wrap(name, agent) for name, agent in agents.items()}
+
+def run_scenarios(executor):
+    """
+    Run every scenario through process_workflow with the stub agents
+
+    Returns:
+        list: (final_state, nodes visited) per scenario
+    """
+    from app.agents.langgraph_workflow import build_workflow, process_workflow
+    path = []
+    graph = build_workflow(traced(STUB_AGENTS, path), executor)
+    results = []
+    for scenario in SCENARIOS:
+        path.clear()
+        final_state = process_workflow(copy.deepcopy(scenario), graph)
+        results.append((final_state, list(path)))
+    return results
+
+def main(passes=300):
+    load_app()
+    from app.agents.langgraph_workflow import build_workflow, process_workflow
+    # The routers log every decision; keep the formatting cost but not the output
+    logging.disable(logging.INFO)
+
+    expected = run_scenarios("langgraph")
+    assert run_scenarios("direct") == expected, "direct dispatch diverged from LangGraph"
+    print(f"{len(SCENARIOS)} scenarios: identical final state and node path with both executors")
+
+    timings = {}
+    for executor in ("langgraph", "direct"):
+        graph = build_workflow(STUB_AGENTS, executor)
+        best = None
+        for _ in range(passes):
+            states = copy.deepcopy(SCENARIOS)
+            started = time.perf_counter_ns()
+            for state in states:
+                process_workflow(state, graph)
+            elapsed = (time.perf_counter_ns() - started) / len(states)
+            best = elapsed if best is None else min(best, elapsed)
+        timings[executor] = best / 1000
+
+    nodes = sum(len(path) for _, path in expected) / len(SCENARIOS)
+    print(f"langgraph:        {timings['langgraph']:8.1f} us/turn")
+    print(f"direct dispatch:  {timings['direct']:8.1f} us/turn  ({timings['langgraph'] / timings['direct']:.1f}x faster)")
+    print(f"framework overhead: {(timings['langgraph'] - timings['direct']) / nodes:6.1f} us per node "
+          f"({nodes:.1f} nodes/turn)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Transcript corpus for the benchmark suite
+
+Seeded from the name cases in test_extraction.py and the phrasings the
+agents' prompts give as examples, then expanded with generated variants
+(fillers, casing, spacing). Each pass sees a few hundred distinct transcripts,
+as the agents do in production, rather than one string served from a cache.
+The corpus is deterministic for a given seed, so runs stay comparable with a
+stored baseline.
+"""
+import random
+
+# Cases from test_extraction.py
+NAMES = ["My name is John Smith", "I'm Alex Muske", "This is Sarah Johnson", "Jane Doe is my name"]
+
+FIRST_NAMES = ["John", "Sarah", "Amara", "Kenji", "Lucia", "Omar", "Priya", "Tomas", "Grace", "Wei", "Tharushka"]
+LAST_NAMES = ["Smith", "Johnson", "Okafor", "Tanaka", "Rossi", "Haddad", "Sharma", "Novak", "Kim", "Dinujaya"]
+FILLERS = ["", "um, ", "yeah so ", "okay, ", "sure, ", "hi, "]
+DOMAINS = ["gmail.com", "example.com", "outlook.com", "medcenter.org", "yahoo.co.uk"]
+
+EMAIL_TEMPLATES = [
+    "my email is {user}@{domain}",
+    "{user} @ {host} . {tld}",
+    "it's {user} @{domain}",
+    "you can send it to {user}@ {domain} thanks",
+    "{filler}{user}@{domain}",
+]
+
+DATE_TIME_TEMPLATES = [
+    "can we do {weekday} at {hour} {meridiem}",
+    "{weekday} {part} please",
+    "I want {month} {day} at {hour}:{minute} {meridiem}",
+    "the {ordinal} at {hour} if possible",
+    "in {count} weeks around {hour}",
+    "{month_number}/{day} at {hour}:{minute}",
+    "tomorrow {part}",
+    "next {weekday} at half past {hour}",
+]
+
+# (date_str, time_str) pairs as extract_date_time_gpt returns them to parse_date_time
+DATE_TIME_PAIRS_TEMPLATES = [
+    ("{weekday}", "{hour} {meridiem}"),
+    ("{month} {day}", "{hour}:{minute} {meridiem}"),
+    ("tomorrow", "{part}"),
+    ("{year}-{month_number:02d}-{day:02d}", "{hour24:02d}:{minute}"),
+    ("next {weekday}", "{hour}"),
+]
+
+REASONS = [
+    "I've had a persistent cough for two weeks",
+    "annual physical checkup",
+    "a rash on my arm that won't go away",
+    "follow up on my blood pressure",
+    "recurring headaches in the morning",
+    "my knee hurts when I climb stairs",
+    "blurry vision in my left eye",
+    "stomach ache after eating",
+    "my son has an ear infection",
+    "chest pain when I exercise",
+    "feeling anxious and can't sleep",
+]
+
+INTENT_TRANSCRIPTS = [
+    "Hi, I'd like to book an appointment with a doctor next week please",
+    "Can I change my appointment to Friday afternoon?",
+    "I need to reschedule my appointment",
+    "I have had a terrible headache and a fever since yesterday",
+    "Yes that's correct, thank you so much",
+    "What are your opening hours on the weekend?",
+    "I need to cancel the appointment I made, I no longer need it",
+    "Could I move my visit to another day?",
+    "Is Dr. Smith available on Monday morning?",
+]
+
+FAQ_QUESTIONS = [
+    "What are your opening hours?",
+    "Do you accept Medicare?",
+    "Where is the clinic located and is there parking?",
+    "What services do you offer?",
+    "Do I need to wear a mask for covid?",
+    "Which doctors work at the clinic?",
+    "Thanks, goodbye",
+    "Can I get a flu shot without an appointment?",
+    "How much does a consultation cost without insurance?",
+]
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday"]
+MONTHS = ["january", "february", "march", "april", "may", "june",
+          "july", "august", "september", "october", "november", "december"]
+PARTS_OF_DAY = ["morning", "afternoon", "evening"]
+ORDINALS = ["1st", "2nd", "3rd", "4th", "5th", "12th", "21st", "22nd", "23rd", "28th"]
+
+def _vary(text, rng):
+    """Prefix a filler and randomize casing the way speech-to-text output varies"""
+    text = rng.choice(FILLERS) + text
+    roll = rng.random()
+    if roll < 0.2:
+        return text.lower()
+    if roll < 0.3:
+        return text.upper()
+    return text
+
+def _fields(rng):
+    hour = rng.randint(1, 11)
+    return {
+        "weekday": rng.choice(WEEKDAYS),
+        "month": rng.choice(MONTHS),
+        "month_number": rng.randint(1, 12),
+        "day": rng.randint(1, 28),
+        "year": rng.choice([2030, 2031]),
+        "ordinal": rng.choice(ORDINALS),
+        "hour": hour,
+        "hour24": hour + rng.choice([0, 12]),
+        "minute": rng.choice(["00", "15", "30", "45"]),
+        "meridiem": rng.choice(["am", "pm", "a.m.", "p.m.", "AM", "PM"]),
+        "part": rng.choice(PARTS_OF_DAY),
+        "count": rng.choice(["two", "three", "2", "3"]),
+    }
+
+def _expand(seeds, size, rng):
+    """Seeds first, then filler/casing variants of them, all distinct"""
+    out = list(dict.fromkeys(seeds))
+    seen = set(out)
+    while len(out) < size:
+        text = _vary(rng.choice(seeds), rng) + rng.choice(["", ".", "!", " please", " thanks"])
+        if text not in seen:
+            seen.add(text)
+            out.append(text)
+    return out
+
+def build_corpus(size=200, seed=42):
+    """
+    Build the benchmark corpus
+
+    Args:
+        size: Number of transcripts per category
+        seed: Random seed; the same seed always yields the same corpus
+
+    Returns:
+        dict: {category: [input, ...]}
+    """
+    rng = random.Random(seed)
+
+    emails = []
+    while len(emails) < size:
+        user = f"{rng.choice(FIRST_NAMES).lower()}{rng.choice(['.', '_', ''])}{rng.choice(LAST_NAMES).lower()}{rng.randint(1, 999)}"
+        domain = rng.choice(DOMAINS)
+        host, tld = domain.split(".", 1)
+        emails.append(rng.choice(EMAIL_TEMPLATES).format(user=user, domain=domain, host=host, tld=tld,
+                                                         filler=rng.choice(FILLERS)))
+
+    date_times, date_time_pairs = [], []
+    for _ in range(size):
+        date_times.append(_vary(rng.choice(DATE_TIME_TEMPLATES).format(**_fields(rng)), rng))
+        date_template, time_template = rng.choice(DATE_TIME_PAIRS_TEMPLATES)
+        fields = _fields(rng)
+        date_time_pairs.append((date_template.format(**fields), time_template.format(**fields)))
+
+    names = NAMES + [f"my name is {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(size // 4)]
+
+    return {
+        "names": _expand(names, size, rng),
+        "emails": emails,
+        "date_times": date_times,
+        "date_time_pairs": date_time_pairs,
+        "reasons": _expand(REASONS, size, rng),
+        "intents": _expand(INTENT_TRANSCRIPTS, size, rng),
+        "faq": _expand(FAQ_QUESTIONS, size, rng),
+    }
@@ -0,0 +1,300 @@
+"""
+Benchmark suite: the pure-CPU helpers every turn runs
+
+Times each helper over the transcript corpus in corpus.py and reports ns/op
+(best of repeated passes, with the median alongside) and the allocation
+high-water mark per op (tracemalloc peak bytes). Memoized helpers have their
+caches cleared before every pass so each transcript is a miss, as it is for a
+new turn in production.
+
+Results are compared with a stored baseline; a case that got slower (or
+allocates more) than the threshold allows is flagged and the run exits with
+status 1. Timings only compare on the same machine, so record a baseline with
+--save before making changes and compare after.
+
+The agent modules connect to MongoDB at import, so the suite imports them on
+mongomock unless MONGODB_URI is set; no case touches the database or network.
+
+Run from the repository root:
+    python benchmarks/suite.py --save        # record benchmarks/baseline.json
+    python benchmarks/suite.py               # compare with it
+    python benchmarks/suite.py -k email -k slots --threshold 0.1
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import statistics
+import tracemalloc
+from typing import Callable, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import build_corpus
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A case slower (or allocating more) than its baseline by more than this share is a regression
+REGRESSION_THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.25"))
+
+# Allocation differences smaller than this many bytes per op are noise
+ALLOCATION_SLACK_BYTES = 256
+
+# Each case runs at least MIN_PASSES passes over its inputs, and for at least MIN_SECONDS
+MIN_PASSES = 5
+MIN_SECONDS = float(os.getenv("BENCH_MIN_SECONDS", "0.5"))
+
+# Days of availability formatted per doctor, as when offering dates to book
+SLOT_WINDOW_DAYS = 14
+
+class Case(NamedTuple):
+    name: str
+    fn: Callable
+    inputs: list
+    # Clears memoized state before each pass
+    reset: Callable = lambda: None
+    # Checks a result was produced locally (a miss would fall through to the LLM)
+    local: Optional[Callable] = None
+
+def load_app():
+    """Import the agent modules without a live MongoDB or OpenAI"""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    # Anything that does fall through to the LLM fails locally instead of leaving the machine
+    os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+    if not os.getenv("MONGODB_URI"):
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("The agent modules need MongoDB at import: set MONGODB_URI or "
+                     "pip install -r loadtest/requirements.txt for mongomock")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+def build_cases(corpus):
+    """
+    The benchmarked helpers, each paired with its share of the corpus
+
+    Args:
+        corpus: Output of build_corpus()
+
+    Returns:
+        list: Case tuples in report order
+    """
+    load_app()
+    from app.date_resolver import _resolve_date_time, _resolve_date, _resolve_time
+    from app.keywords import ENGINE
+    from app.scheduling import DoctorSchedule
+    from app.specialty_matcher import get_specialty_matcher
+    from app.knowledge_base import get_knowledge_base
+    from app.models import Doctor, SAMPLE_DOCTORS
+    from app.agents.receptionist import detect_appointment_intent, detect_reschedule_intent
+    from app.agents.appointment import (parse_date_time, extract_date_time_from_transcript, extract_email, extract_name,
+                                        format_slot_lines)
+
+    def clear_date_caches():
+        _resolve_date_time.cache_clear()
+        _resolve_date.cache_clear()
+        _resolve_time.cache_clear()
+
+    # Every doctor's next two weeks, with a couple of slots already booked on some days
+    start = datetime.date.today() + datetime.timedelta(days=1)
+    slot_inputs = []
+    for index, doctor in enumerate(SAMPLE_DOCTORS):
+        for offset in range(SLOT_WINDOW_DAYS):
+            booked = ("09:00", "14:00") if offset % 3 == 0 else ()
+            slot_inputs.append((index, (start + datetime.timedelta(days=offset)).isoformat(), booked))
+    schedules = []
+
+    def fresh_schedules():
+        # A schedule memoizes slots per date; rebuild so every pass formats them again
+        schedules[:] = [DoctorSchedule(doctor["weekly"]) for doctor in SAMPLE_DOCTORS]
+
+    def slots(item):
+        index, date, booked = item
+        return format_slot_lines(schedules[index].free_slots(date, booked))
+
+    knowledge_base = get_knowledge_base()
+    matcher = get_specialty_matcher()
+
+    return [
+        Case("parse_date_time", lambda pair: parse_date_time(*pair), corpus["date_time_pairs"],
+             clear_date_caches, lambda result: result[0] is not None),
+        Case("extract_date_time_from_transcript", extract_date_time_from_transcript, corpus["date_times"],
+             clear_date_caches),
+        Case("extract_email", extract_email, corpus["emails"], local=lambda result: result is not None),
+        Case("extract_name", extract_name, corpus["names"], local=lambda result: result is not None),
+        Case("get_specialty_for_reason", Doctor.get_specialty_for_reason, corpus["reasons"],
+             matcher.rank.cache_clear),
+        Case("detect_appointment_intent", detect_appointment_intent, corpus["intents"], ENGINE.tags.cache_clear),
+        Case("detect_reschedule_intent", detect_reschedule_intent, corpus["intents"], ENGINE.tags.cache_clear),
+        Case("knowledge_base_lookup", knowledge_base.lookup, corpus["faq"],
+             lambda: knowledge_base.index.lookup.cache_clear()),
+        Case("format_free_slots", slots, slot_inputs, fresh_schedules),
+    ]
+
+def check_local(case):
+    """Run a case once; return how many inputs did not resolve without the LLM"""
+    case.reset()
+    results = [case.fn(item) for item in case.inputs]
+    if case.local is None:
+        return 0
+    return sum(1 for result in results if not case.local(result))
+
+def measure(case, repeat=MIN_PASSES, min_seconds=MIN_SECONDS):
+    """
+    Time a case over its inputs
+
+    Args:
+        case: The Case to run
+        repeat: Minimum number of timed passes
+        min_seconds: Keep adding passes until they add up to this long
+
+    Returns:
+        dict: ns_per_op (best pass), median_ns_per_op and peak_bytes_per_op
+    """
+    timings = []
+    # As timeit does, keep the collector from landing in one pass and not another
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(timings) < repeat or sum(timings) * len(case.inputs) < min_seconds * 1e9:
+            case.reset()
+            started = time.perf_counter_ns()
+            for item in case.inputs:
+                case.fn(item)
+            timings.append((time.perf_counter_ns() - started) / len(case.inputs))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Allocations are traced in a separate pass; tracemalloc slows everything down
+    case.reset()
+    peak = 0
+    tracemalloc.start()
+    try:
+        for item in case.inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            case.fn(item)
+            peak += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ns_per_op": round(min(timings), 1),
+        "median_ns_per_op": round(statistics.median(timings), 1),
+        "peak_bytes_per_op": round(peak / len(case.inputs), 1),
+    }
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Find cases that regressed against a baseline
+
+    Args:
+        results: {case: measurement} from this run
+        baseline: {case: measurement} from the stored baseline
+        threshold: Allowed growth as a share of the baseline (0.25 = 25%)
+
+    Returns:
+        list: (case, metric, baseline value, current value) for each regression
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current["ns_per_op"] > previous["ns_per_op"] * (1 + threshold):
+            regressions.append((name, "ns_per_op", previous["ns_per_op"], current["ns_per_op"]))
+        allowed = max(previous["peak_bytes_per_op"] * (1 + threshold),
+                      previous["peak_bytes_per_op"] + ALLOCATION_SLACK_BYTES)
+        if current["peak_bytes_per_op"] > allowed:
+            regressions.append((name, "peak_bytes_per_op", previous["peak_bytes_per_op"], current["peak_bytes_per_op"]))
+    return regressions
+
+def load_baseline(path):
+    """Read a baseline file; returns an empty baseline when there is none yet"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"cases": {}}
+
+def save_baseline(path, results, corpus_size, seed):
+    with open(path, "w") as f:
+        json.dump({
+            "recorded": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "corpus": {"size": corpus_size, "seed": seed},
+            "cases": results
+        }, f, indent=2)
+        f.write("\n")
+
+def _change(previous, current):
+    if not previous:
+        return "new"
+    return f"{(current / previous - 1) * 100:+.0f}%"
+
+def print_report(results, baseline, regressions):
+    flagged = {(name, metric) for name, metric, _, _ in regressions}
+    print(f"{'case':36s} {'ns/op':>10s} {'median':>10s} {'vs base':>8s} {'peak B/op':>10s} {'vs base':>8s}")
+    for name, row in results.items():
+        previous = baseline.get(name, {})
+        time_change = _change(previous.get("ns_per_op"), row["ns_per_op"])
+        bytes_change = _change(previous.get("peak_bytes_per_op"), row["peak_bytes_per_op"])
+        if (name, "ns_per_op") in flagged:
+            time_change += " !"
+        if (name, "peak_bytes_per_op") in flagged:
+            bytes_change += " !"
+        print(f"{name:36s} {row['ns_per_op']:10.0f} {row['median_ns_per_op']:10.0f} {time_change:>8s} "
+              f"{row['peak_bytes_per_op']:10.0f} {bytes_change:>8s}")
+    for name, metric, previous, current in regressions:
+        print(f"REGRESSION {name} {metric}: {previous:.0f} -> {current:.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-turn extraction and matching helpers")
+    parser.add_argument("-k", dest="filters", action="append", help="Only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=MIN_PASSES, help="Minimum timed passes per case")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS, help="Minimum timed seconds per case")
+    parser.add_argument("--size", type=int, default=200, help="Transcripts per corpus category")
+    parser.add_argument("--seed", type=int, default=42, help="Corpus seed")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Allowed slowdown as a share of the baseline")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.seed)
+    cases = [case for case in build_cases(corpus)
+             if not args.filters or any(text in case.name for text in args.filters)]
+
+    results = {}
+    for case in cases:
+        misses = check_local(case)
+        if misses:
+            print(f"warning: {misses} of {len(case.inputs)} {case.name} inputs fell through to the LLM; "
+                  f"their timings include a failed request")
+        results[case.name] = measure(case, args.repeat, args.min_seconds)
+
+    baseline = load_baseline(args.baseline)
+    if args.save:
+        # Cases left out with -k keep their previous baseline
+        save_baseline(args.baseline, {**baseline["cases"], **results}, args.size, args.seed)
+        print_report(results, {}, [])
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if baseline["cases"] and baseline.get("corpus") != {"size": args.size, "seed": args.seed}:
+        print(f"warning: the baseline was recorded on a different corpus ({baseline.get('corpus')})")
+    regressions = compare(results, baseline["cases"], args.threshold)
+    print_report(results, baseline["cases"], regressions)
+    if not baseline["cases"]:
+        print(f"\nNo baseline at {args.baseline}; record one with --save")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
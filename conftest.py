@@ -0,0 +1,22 @@
+import os
+import pytest
+
+@pytest.fixture(scope="session")
+def app_modules():
+    """
+    Let tests import the agent modules without a live MongoDB or OpenAI
+
+    pymongo.MongoClient is swapped for mongomock (unless MONGODB_URI is set)
+    and OpenAI calls are pointed at a closed local port, as in
+    benchmarks.suite.load_app. Both are undone at the end of the session.
+    Tests using this fixture import app modules inside the test, so nothing
+    connects at collection time.
+    """
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("OPENAI_API_KEY", os.getenv("OPENAI_API_KEY", "test"))
+        patch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+        if not os.getenv("MONGODB_URI"):
+            mongomock = pytest.importorskip("mongomock")
+            import pymongo
+            patch.setattr(pymongo, "MongoClient", mongomock.MongoClient)
+        yield
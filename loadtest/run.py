@@ -0,0 +1,241 @@
+"""
+Load test MedAgent without OpenAI, ElevenLabs or a real MongoDB
+
+Virtual users play multi-turn conversations (booking, cancellation,
+reschedule, FAQ) against /api/text and /api/transcribe, asking /api/tts to
+speak a share of the replies. The report gives throughput and p50/p95/p99
+per endpoint, and how many conversations reached their goal.
+
+By default the app runs in-process with mongomock as its database, and
+OpenAI/ElevenLabs replaced by the local stand-ins in stand_ins.py with the
+latencies given on the command line. With --target the driver only sends
+load to an already running app (start it against stand_ins.py as described
+there to keep it offline).
+
+Run from the repository root:
+    python loadtest/run.py --users 8 --duration 60
+    python loadtest/run.py --users 16 --conversations 200 --llm-ms 900 --sigma 0.8
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from loadtest import scenarios
+from loadtest.stand_ins import AUDIO_MARKER, LatencyModel, start_fake_openai, start_fake_tts
+
+ENDPOINTS = ("/api/text", "/api/transcribe", "/api/tts")
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers (0 < p <= 100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+class Recorder:
+    """Latencies and errors per endpoint, and outcomes per scenario, from all users"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.scenarios = defaultdict(lambda: {"started": 0, "completed": 0})
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def scenario(self, name, completed):
+        with self._lock:
+            self.scenarios[name]["started"] += 1
+            self.scenarios[name]["completed"] += bool(completed)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            values = self.latencies.get(endpoint, [])
+            if not values:
+                continue
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors[endpoint],
+                "per_second": len(values) / elapsed,
+                **{f"p{p}_ms": percentile(values, p) * 1000 for p in (50, 95, 99)},
+                "max_ms": max(values) * 1000
+            }
+        return {"seconds": elapsed, "endpoints": endpoints, "scenarios": dict(self.scenarios)}
+
+class VirtualUser:
+    """One simulated caller: plays scenarios back to back over its own HTTP session"""
+
+    def __init__(self, base_url, recorder, rng, audio_share, tts_share):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.audio_share = audio_share
+        self.tts_share = tts_share
+        self.session = requests.Session()
+
+    def _post(self, endpoint, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.base_url + path, timeout=120, **kwargs)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.request(endpoint, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    def turn(self, conversation_id, utterance):
+        """Send one utterance (as text or audio) and return the assistant's reply, or None on error"""
+        if self.rng.random() < self.audio_share:
+            audio = AUDIO_MARKER + utterance.encode() + b"\r\n" + os.urandom(2048)
+            response = self._post("/api/transcribe", f"/api/transcribe/{conversation_id}",
+                                  files={"audio": ("turn.mp3", audio, "audio/mpeg")})
+        else:
+            response = self._post("/api/text", f"/api/text/{conversation_id}", json={"text": utterance})
+        if response is None:
+            return None
+        reply = response.json().get("response", "")
+        if reply and self.rng.random() < self.tts_share:
+            self._post("/api/tts", "/api/tts", json={"text": reply})
+        return reply
+
+    def play(self, name, conversation):
+        """Drive a scenario generator to the end; returns its result (None/False if it failed)"""
+        conversation_id = str(uuid.uuid4())
+        result = None
+        try:
+            utterance = next(conversation)
+            while True:
+                reply = self.turn(conversation_id, utterance)
+                if reply is None:
+                    break
+                utterance = conversation.send(reply)
+        except StopIteration as done:
+            result = done.value
+        self.recorder.scenario(name, result)
+        return result
+
+    def run_one(self):
+        name = self.rng.choices(list(scenarios.SCENARIO_WEIGHTS), list(scenarios.SCENARIO_WEIGHTS.values()))[0]
+        if name == "faq":
+            self.play("faq", scenarios.faq(self.rng))
+        elif name == "booking":
+            self.play("booking", scenarios.booking(self.rng))
+        else:
+            # Cancelling or rescheduling needs an appointment of our own first
+            appointment_id = self.play("booking", scenarios.booking(self.rng))
+            if appointment_id:
+                follow_up = scenarios.cancellation if name == "cancellation" else scenarios.reschedule
+                self.play(name, follow_up(appointment_id, self.rng))
+
+def start_local_app(args):
+    """Start the stand-ins and the app (on mongomock) in this process; returns the app's base URL"""
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("The in-process app needs mongomock (pip install -r loadtest/requirements.txt), or use --target")
+
+    openai = start_fake_openai(LatencyModel(args.llm_ms, args.sigma), LatencyModel(args.whisper_ms, args.sigma))
+    tts = start_fake_tts(LatencyModel(args.tts_ms, args.sigma))
+    os.environ.update({
+        "OPENAI_BASE_URL": openai.url + "/v1",
+        "OPENAI_API_KEY": "stand-in",
+        "ELEVEN_LABS_API_URL": tts.url,
+        "ELEVEN_LABS_API_KEY": "stand-in",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    for name in ("LANGFUSE_PUBLIC_KEY", "SENDGRID_API_KEY", "EMAIL_HOST"):
+        os.environ.pop(name, None)
+
+    # The app keeps its appointment ID counter in the working directory
+    os.chdir(tempfile.mkdtemp(prefix="medagent-loadtest-"))
+
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+    from werkzeug.serving import make_server
+    from app.app import app
+
+    # Per-request access lines would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="medagent-app", daemon=True).start()
+    print(f"App on http://127.0.0.1:{server.server_port} (mongomock); "
+          f"LLM {openai.latency}, whisper {openai.transcription_latency}, TTS {tts.latency}")
+    return f"http://127.0.0.1:{server.server_port}", {"openai": openai, "tts": tts}
+
+def print_report(report, stand_ins):
+    print(f"\n{'endpoint':16s} {'requests':>8s} {'errors':>6s} {'req/s':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+    for endpoint, row in report["endpoints"].items():
+        print(f"{endpoint:16s} {row['requests']:8d} {row['errors']:6d} {row['per_second']:7.1f} "
+              f"{row['p50_ms']:8.0f} {row['p95_ms']:8.0f} {row['p99_ms']:8.0f} {row['max_ms']:8.0f}")
+    print(f"\n{'scenario':16s} {'started':>8s} {'completed':>9s}")
+    for name, row in sorted(report["scenarios"].items()):
+        print(f"{name:16s} {row['started']:8d} {row['completed']:9d}")
+    if stand_ins:
+        print(f"\nstand-in requests: OpenAI {stand_ins['openai'].requests}, TTS {stand_ins['tts'].requests}")
+    print(f"wall time: {report['seconds']:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for MedAgent")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to keep starting scenarios")
+    parser.add_argument("--conversations", type=int, help="Stop after this many scenarios per user instead")
+    parser.add_argument("--audio-share", type=float, default=0.2, help="Share of turns sent as audio")
+    parser.add_argument("--tts-share", type=float, default=0.3, help="Share of replies sent to /api/tts")
+    parser.add_argument("--llm-ms", type=float, default=600, help="Median stand-in chat completion latency")
+    parser.add_argument("--whisper-ms", type=float, default=800, help="Median stand-in transcription latency")
+    parser.add_argument("--tts-ms", type=float, default=400, help="Median stand-in TTS latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Lognormal spread of stand-in latencies")
+    parser.add_argument("--target", help="Base URL of a running app (skips the in-process app and stand-ins)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+    if args.json:
+        # The in-process app changes the working directory
+        args.json = os.path.abspath(args.json)
+
+    if args.target:
+        base_url, stand_ins = args.target.rstrip("/"), None
+    else:
+        base_url, stand_ins = start_local_app(args)
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+
+    def user(number):
+        virtual_user = VirtualUser(base_url, recorder, random.Random(args.seed * 1000 + number),
+                                   args.audio_share, args.tts_share)
+        played = 0
+        while (played < args.conversations) if args.conversations else (time.monotonic() < deadline):
+            virtual_user.run_one()
+            played += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.users) as executor:
+        list(executor.map(user, range(args.users)))
+    report = recorder.report(time.perf_counter() - started)
+
+    print_report(report, stand_ins)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Multi-turn conversations the load driver plays against MedAgent
+
+Each scenario is a generator: it yields the next utterance and is sent the
+assistant's reply, so later turns can pick a date from the slots offered or
+quote the appointment ID from a confirmation. A scenario returns True when
+the conversation reached its goal (a booking, cancellation or reschedule
+confirmed, or an FAQ answered).
+"""
+import re
+import random
+
+FIRST_NAMES = ["Jane", "John", "Amara", "Kenji", "Lucia", "Omar", "Priya", "Tomas", "Grace", "Wei"]
+LAST_NAMES = ["Doe", "Smith", "Okafor", "Tanaka", "Rossi", "Haddad", "Sharma", "Novak", "Kim", "Chen"]
+
+REASONS = [
+    "I've had a persistent cough for two weeks",
+    "annual physical checkup",
+    "a rash on my arm that won't go away",
+    "follow up on my blood pressure",
+    "recurring headaches in the morning",
+]
+
+FAQ_QUESTIONS = [
+    "What are your opening hours?",
+    "Do you accept Medicare?",
+    "Where is the clinic located and is there parking?",
+    "How do I get my lab results?",
+    "What should I bring to my first visit?",
+    "Do you offer telehealth appointments?",
+]
+
+HEALTH_QUESTIONS = [
+    "I have a mild fever and a sore throat, what should I do?",
+    "Is it normal to feel dizzy after standing up quickly?",
+    "I've had a headache for three days, should I be worried?",
+]
+
+DATE_HEADER = re.compile(r"📅 (?:\w+, )?(\w+ \d{1,2}(?:, \d{4})?):")
+SLOT = re.compile(r"\d{1,2}:\d{2} [AP]M")
+APPOINTMENT_ID = re.compile(r"MA-\d{5}")
+TAKEN_SLOT = re.compile(r"on (\d{4}-\d{2}-\d{2})\. Available times include: ([^\n]*)")
+
+def pick_slot(reply, rng=random):
+    """
+    Pick a date and time from the slots listed in a reply
+
+    Returns:
+        str: e.g. "October 24, 2026 at 9:30 AM", or None if no slots were offered
+    """
+    headers = list(DATE_HEADER.finditer(reply))
+    if not headers:
+        # "... is not available with Dr. X on 2026-10-21. Available times include: 9:00 AM, ..."
+        taken = TAKEN_SLOT.search(reply)
+        if taken and SLOT.findall(taken.group(2)):
+            return f"{taken.group(1)} at {rng.choice(SLOT.findall(taken.group(2)))}"
+        return None
+    header = rng.choice(headers)
+    following = reply[header.end():]
+    next_header = DATE_HEADER.search(following)
+    slots = SLOT.findall(following[:next_header.start()] if next_header else following)
+    if not slots:
+        return None
+    return f"{header.group(1)} at {rng.choice(slots)}"
+
+def patient(rng=random):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        "name": f"{first} {last}",
+        "phone": f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        "birthdate": f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "email": f"{first.lower()}.{last.lower()}{rng.randint(1, 99999)}@example.com",
+        "reason": rng.choice(REASONS),
+    }
+
+def booking(rng=random):
+    """Book a new appointment; returns the appointment ID on success"""
+    person = patient(rng)
+    yield rng.choice(["I'd like to book an appointment", "Can I schedule an appointment with a doctor?"])
+    yield f"My name is {person['name']}"
+    yield f"My phone number is {person['phone']}"
+    yield f"I was born on {person['birthdate']}"
+    reply = yield person["reason"]
+    if "?" in reply and "recommend" in reply.lower():
+        reply = yield "Yes, that works"
+    # Another caller may take the slot first, or the specialist may be unavailable; retry a few times
+    for _ in range(3):
+        slot = pick_slot(reply, rng)
+        if slot is not None:
+            reply = yield slot
+        elif "general practitioner instead" in reply.lower():
+            reply = yield "Yes, a General Practitioner is fine"
+        else:
+            return None
+        if "email" in reply.lower():
+            break
+    else:
+        return None
+    reply = yield f"My email is {person['email']}"
+    reply = yield "Yes, that's correct"
+    match = APPOINTMENT_ID.search(reply)
+    return match.group(0) if match else None
+
+def cancellation(appointment_id, rng=random):
+    """Cancel a booked appointment in a new conversation"""
+    yield "I need to cancel my appointment"
+    reply = yield f"My appointment ID is {appointment_id}"
+    if "cancel" not in reply.lower():
+        return False
+    reply = yield "Yes, please cancel it"
+    return "cancel" in reply.lower() and "sorry" not in reply.lower()
+
+def reschedule(appointment_id, rng=random):
+    """Move a booked appointment to another offered slot in a new conversation"""
+    yield "I want to reschedule my appointment"
+    reply = yield f"It's {appointment_id}"
+    for _ in range(3):
+        slot = pick_slot(reply, rng)
+        if slot is None:
+            return False
+        reply = yield slot
+        if "correct" in reply.lower():
+            break
+    else:
+        return False
+    reply = yield "Yes"
+    return "reschedul" in reply.lower() and "sorry" not in reply.lower()
+
+def faq(rng=random):
+    """One or two questions to the call center"""
+    reply = yield rng.choice(FAQ_QUESTIONS + HEALTH_QUESTIONS)
+    if rng.random() < 0.5:
+        reply = yield rng.choice(FAQ_QUESTIONS)
+    return bool(reply)
+
+# Relative frequency of each scenario in the mix
+SCENARIO_WEIGHTS = {"faq": 4, "booking": 3, "cancellation": 1, "reschedule": 1}
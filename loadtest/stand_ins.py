@@ -0,0 +1,233 @@
+"""
+Local stand-ins for the paid services MedAgent calls
+
+- An OpenAI-compatible server: /v1/chat/completions answers each agent's
+  prompt with a plausible reply, and /v1/audio/transcriptions returns the
+  text embedded in the "audio" the load driver uploads.
+- An ElevenLabs-compatible TTS server: /v1/text-to-speech/<voice> returns
+  audio bytes sized to the text.
+
+Both add a configurable, long-tailed latency (lognormal around a median) so
+the load test sees realistic waits without paying for them.
+
+Run standalone to point a normally started app at them:
+    python loadtest/stand_ins.py --openai-port 8081 --tts-port 8082
+then start the app with
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=fake \\
+    ELEVEN_LABS_API_URL=http://127.0.0.1:8082 ELEVEN_LABS_API_KEY=fake python run.py
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil import parser as date_parser
+from app.date_resolver import resolve_date_time
+
+# Marks the start of the utterance inside a fake audio upload
+AUDIO_MARKER = b"FAKEAUDIO:"
+
+class LatencyModel:
+    """
+    Lognormal latency around a median
+
+    sigma controls the tail: 0 is constant, 0.5 puts p99 at ~3.2x the median.
+    """
+
+    def __init__(self, median_ms, sigma=0.5, rng=None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.rng.gauss(0, self.sigma)) / 1000
+
+    def wait(self):
+        seconds = self.sample()
+        if seconds:
+            time.sleep(seconds)
+        return seconds
+
+    def __repr__(self):
+        return f"median {self.median_ms:g} ms, sigma {self.sigma:g}"
+
+def _classify_intent(text):
+    text = text.lower()
+    if "cancel" in text:
+        return "cancel_appointment"
+    if any(word in text for word in ("reschedule", "move my", "change my")):
+        return "reschedule_appointment"
+    if any(word in text for word in ("book", "schedule", "appointment", "see a doctor")):
+        return "schedule_appointment"
+    if any(word in text for word in ("chest pain", "can't breathe", "bleeding heavily")):
+        return "emergency"
+    if any(word in text for word in ("pain", "fever", "cough", "headache", "symptom", "rash")):
+        return "health_question"
+    return "general_inquiry"
+
+def _first(pattern, text, default="Unknown", group=0):
+    match = re.search(pattern, text)
+    return match.group(group) if match else default
+
+def _name(text):
+    match = re.search(r"(?:name is|i'm|i am|this is)\s+([a-z]+(?:\s+[a-z]+)?)", text, re.IGNORECASE)
+    return match.group(1).title() if match else "Unknown"
+
+def _birthdate(text):
+    try:
+        return date_parser.parse(text, fuzzy=True).strftime("%Y-%m-%d")
+    except (ValueError, OverflowError):
+        return "Unknown"
+
+def _date_time(text):
+    resolution = resolve_date_time(text)
+    return json.dumps({"date": resolution.date, "time": resolution.time, "action": resolution.action or "schedule"})
+
+# (marker in the system prompt, reply built from the user's message), checked in order
+CHAT_RESPONDERS = [
+    ("intent category", _classify_intent),
+    ("extracting a patient's name", _name),
+    ("extracting a phone number", lambda text: _first(r"\+?\d[\d\s().-]{6,}\d", text)),
+    ("extracting a birth date", _birthdate),
+    ("extracting an email", lambda text: _first(r"[\w.+-]+@[\w-]+\.[\w.-]+", text)),
+    ("reason for visiting", lambda text: text[:80]),
+    ("extracting a date and time", _date_time),
+    ("appointment ID", lambda text: _first(r"MA-\d+", text.upper())),
+    ("medical specialty", lambda text: "General Practitioner"),
+    ("content reviewer", lambda text: "Please consult your doctor for advice specific to your situation."),
+    ("health concerns", lambda text: "I'm sorry you're not feeling well. It would be best to book an appointment "
+                                     "so a doctor can look into this; if symptoms are severe, please seek urgent care."),
+]
+
+DEFAULT_REPLY = "Thanks for your question. Our clinic team is happy to help - please call us during opening hours for details."
+
+def chat_reply(messages):
+    """The stand-in's answer to a chat completion request"""
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    for marker, respond in CHAT_RESPONDERS:
+        if marker in system:
+            return respond(user)
+    return DEFAULT_REPLY
+
+def _tokens(text):
+    # Roughly 4 characters per token, enough for cost tracking to see realistic counts
+    return max(1, len(text) // 4)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _OpenAIHandler(_Handler):
+    def do_POST(self):
+        body = self._body()
+        self.server.requests += 1
+        if self.path.endswith("/chat/completions"):
+            request = json.loads(body)
+            self.server.latency.wait()
+            content = chat_reply(request["messages"])
+            prompt_tokens = sum(_tokens(str(m.get("content", ""))) for m in request["messages"])
+            completion_tokens = _tokens(content)
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens}
+            })
+        elif self.path.endswith("/audio/transcriptions"):
+            self.server.transcription_latency.wait()
+            start = body.find(AUDIO_MARKER)
+            end = body.find(b"\r\n", start)
+            text = body[start + len(AUDIO_MARKER):end].decode(errors="replace") if start >= 0 else ""
+            self._send(200, {"text": text})
+        else:
+            self._send(404, {"error": {"message": f"{self.path} is not implemented by the stand-in"}})
+
+class _TTSHandler(_Handler):
+    def do_POST(self):
+        request = json.loads(self._body() or b"{}")
+        self.server.requests += 1
+        if not self.path.startswith("/v1/text-to-speech/"):
+            self._send(404, {"detail": "not found"})
+            return
+        self.server.latency.wait()
+        # ~1 KB of "audio" per 15 characters, in the ballpark of 128 kbps speech
+        self._send(200, b"\xff\xf3" * (len(request.get("text", "")) * 34 + 64), "audio/mpeg")
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler, port=0, latency=None, transcription_latency=None):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency = latency or LatencyModel(0)
+        self.transcription_latency = transcription_latency or self.latency
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name=f"stand-in-{self.server_address[1]}", daemon=True).start()
+        return self
+
+def start_fake_openai(latency, transcription_latency=None, port=0):
+    """Start the OpenAI stand-in; its API base URL is `server.url + "/v1"`"""
+    return StandInServer(_OpenAIHandler, port, latency, transcription_latency).start()
+
+def start_fake_tts(latency, port=0):
+    """Start the ElevenLabs stand-in; its base URL is `server.url`"""
+    return StandInServer(_TTSHandler, port, latency).start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the OpenAI and ElevenLabs stand-ins")
+    parser.add_argument("--openai-port", type=int, default=8081)
+    parser.add_argument("--tts-port", type=int, default=8082)
+    parser.add_argument("--llm-ms", type=float, default=600, help="Median chat completion latency")
+    parser.add_argument("--whisper-ms", type=float, default=800, help="Median transcription latency")
+    parser.add_argument("--tts-ms", type=float, default=400, help="Median TTS latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Lognormal spread of all latencies")
+    args = parser.parse_args()
+
+    openai = start_fake_openai(LatencyModel(args.llm_ms, args.sigma), LatencyModel(args.whisper_ms, args.sigma), args.openai_port)
+    tts = start_fake_tts(LatencyModel(args.tts_ms, args.sigma), args.tts_port)
+    print(f"OpenAI stand-in:     {openai.url}/v1")
+    print(f"ElevenLabs stand-in: {tts.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
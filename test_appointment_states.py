@@ -0,0 +1,77 @@
+import pytest
+
+pytestmark = pytest.mark.usefixtures("app_modules")
+
+# Defined in STATES but never entered by the agent
+UNUSED_STATES = {"completed", "cancelled", "scheduling_date_time"}
+
+def turn(transcript, context, intent=""):
+    return {"transcript": transcript, "intent": intent, "conversation_id": "c1", "appointment_context": context}
+
+def test_every_state_has_a_handler_and_declared_transitions_are_registered():
+    from app.agents.appointment import STATES, STATE_HANDLERS
+    assert UNUSED_STATES <= set(STATES.values())
+    assert set(STATE_HANDLERS) == set(STATES.values()) - UNUSED_STATES
+    for handler in STATE_HANDLERS.values():
+        assert set(handler.next_states) <= set(STATE_HANDLERS)
+
+def test_handlers_move_only_to_declared_states_and_write_declared_keys():
+    from app.agents.appointment import STATES, STATE_HANDLERS, AppointmentTurn
+    context = {"state": STATES["COLLECTING_NAME"], "attempts": {"name": 0}}
+    state = turn("Jane Doe", context)
+    handler = STATE_HANDLERS[STATES["COLLECTING_NAME"]]
+    handler.handle(AppointmentTurn(state, context))
+    assert context["state"] in handler.next_states
+    assert set(context) - {"state"} <= set(handler.writes)
+    assert context["patient_name"] == "Jane Doe"
+
+def test_explicit_cancel_switches_flow_before_dispatch():
+    from app.agents.appointment import STATES, appointment_agent
+    state = appointment_agent(turn("actually, cancel it", {"state": STATES["COLLECTING_PHONE"], "attempts": {}}))
+    assert state["appointment_context"]["state"] == STATES["CANCELLING_COLLECTING_ID"]
+    assert state["intent"] == "cancel_appointment"
+
+def test_completed_booking_resets_context_on_acknowledgement():
+    from app.agents.appointment import STATES, appointment_agent
+    state = appointment_agent(turn("thanks, that's great", {"state": STATES["BOOKING_CONFIRMED"]}))
+    assert state["appointment_context"] == {"state": STATES["INITIAL"], "booking_complete": True,
+                                            "last_completed_action": "booking", "booking_notification_sent": False}
+    assert state["switch_context"] and state["needs_notification"]
+    assert state["intent"] == "general_inquiry"
+
+def test_dispatch_is_timed_per_state_and_unknown_states_start_over():
+    from app.agents.appointment import STATES, AppointmentTurn, appointment_agent, dispatch_state
+    from app.metrics import APPOINTMENT_STATE_LATENCY
+    context = {"state": "no_such_state"}
+    dispatch_state(AppointmentTurn(turn("hello", context), context))
+    assert context["state"] == STATES["INITIAL"]
+    appointment_agent(turn("Jane Doe", {"state": STATES["COLLECTING_NAME"], "attempts": {}}))
+    lines = APPOINTMENT_STATE_LATENCY.render()
+    assert any(line.startswith('medagent_appointment_state_duration_seconds_count{state="other",next_state="initial"}')
+               for line in lines)
+    assert any(line.startswith('medagent_appointment_state_duration_seconds_count{state="collecting_name",'
+                               'next_state="collecting_phone"}') for line in lines)
+
+def test_suggested_dates_keep_to_the_patients_preferences():
+    from app.agents.appointment import STATES, appointment_agent
+    from app.models import Doctor
+    Doctor.seed_sample_doctors()
+    state = appointment_agent(turn("Yes, Tuesday mornings please",
+                                   {"state": STATES["SUGGESTING_SPECIALTY"], "doctor_specialty": "Cardiologist"}))
+    context = state["appointment_context"]
+    assert context["state"] == STATES["COLLECTING_DATE_TIME"] and context["available_dates"]
+    for date_info in context["available_dates"]:
+        assert date_info["formatted_date"].startswith("Tuesday"), date_info
+        assert all(slot.endswith("AM") for slot in date_info["slots"]), date_info
+    assert "Afternoon" not in state["response"]
+
+if __name__ == "__main__":
+    from benchmarks.suite import load_app
+    load_app()
+    test_every_state_has_a_handler_and_declared_transitions_are_registered()
+    test_handlers_move_only_to_declared_states_and_write_declared_keys()
+    test_explicit_cancel_switches_flow_before_dispatch()
+    test_suggested_dates_keep_to_the_patients_preferences()
+    test_completed_booking_resets_context_on_acknowledgement()
+    test_dispatch_is_timed_per_state_and_unknown_states_start_over()
+    print("All appointment state tests passed")
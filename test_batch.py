@@ -0,0 +1,108 @@
+import json
+import time
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from app.batch import parse_batch, run_batch
+
+def test_parse_batch_rejects_malformed_bodies():
+    assert parse_batch([{"conversation_id": "c1", "text": "hi"}]) == [("c1", "hi")]
+    for body in (None, {}, [], ["hi"], [{"text": "hi"}], [{"conversation_id": "c1"}],
+                 [{"conversation_id": "", "text": "hi"}], [{"conversation_id": "c1", "text": 3}]):
+        with pytest.raises(ValueError):
+            parse_batch(body)
+    with pytest.raises(ValueError):
+        parse_batch([{"conversation_id": "c1", "text": "hi"}] * 3, max_items=2)
+
+def test_conversations_run_concurrently_and_turns_stay_in_order():
+    started = []
+    lock = threading.Lock()
+
+    def run_turn(conversation_id, text):
+        with lock:
+            started.append(text)
+        time.sleep(0.3 if conversation_id == "slow" else 0.02)
+        return {"conversation_id": conversation_id, "response": text.upper()}
+
+    turns = [("slow", "s1"), ("fast", "f1"), ("fast", "f2"), ("slow", "s2"), ("fast", "f3")]
+    began = time.perf_counter()
+    results = list(run_batch(turns, run_turn))
+    assert time.perf_counter() - began < 0.8
+    # Every item answered once; the fast conversation's replies stream out before the slow one's
+    assert sorted(index for index, _ in results) == [0, 1, 2, 3, 4]
+    assert [index for index, _ in results][:3] == [1, 2, 4]
+    assert all(result["response"] == turns[index][1].upper() for index, result in results)
+    for conversation in ("slow", "fast"):
+        expected = [text for conversation_id, text in turns if conversation_id == conversation]
+        assert [text for text in started if text in expected] == expected
+
+def test_failed_turns_yield_none_and_closing_skips_the_rest():
+    ran = []
+
+    def run_turn(conversation_id, text):
+        ran.append(text)
+        if text == "boom":
+            raise RuntimeError("workflow failed")
+        time.sleep(0.05)
+        return {"response": text}
+
+    assert list(run_batch([("c1", "boom")], run_turn)) == [(0, None)]
+    ran.clear()
+    batch = run_batch([(f"c{i % 2}", f"t{i}") for i in range(10)], run_turn)
+    next(batch)
+    batch.close()
+    time.sleep(0.1)
+    assert len(ran) < 10
+
+def test_batches_share_one_bounded_pool():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def run_turn(conversation_id, text):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {"response": text}
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    batches = [[(f"b{batch}c{i}", "hi") for i in range(4)] for batch in range(3)]
+    threads = [threading.Thread(target=lambda turns=turns: list(run_batch(turns, run_turn, executor)))
+               for turns in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    executor.shutdown()
+
+def test_batch_endpoint_streams_ndjson(app_modules, monkeypatch):
+    import app.app as web
+
+    def process_workflow(state, checkpointer=None):
+        return {"intent": "general_inquiry", "response": f"echo {state['transcript']}"}
+    monkeypatch.setattr(web, "process_workflow", process_workflow)
+
+    client = web.app.test_client()
+    response = client.post("/api/batch", json=[{"conversation_id": "c1", "text": "one"},
+                                               {"conversation_id": "c2", "text": "two"},
+                                               {"conversation_id": "c1", "text": "three"}])
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert {line["index"]: line["response"] for line in lines} == {0: "echo one", 1: "echo two", 2: "echo three"}
+    assert all(line["intent"] == "general_inquiry" for line in lines)
+    assert client.post("/api/batch", json={"text": "hi"}).status_code == 400
+
+if __name__ == "__main__":
+    test_parse_batch_rejects_malformed_bodies()
+    test_conversations_run_concurrently_and_turns_stay_in_order()
+    test_failed_turns_yield_none_and_closing_skips_the_rest()
+    test_batches_share_one_bounded_pool()
+    from benchmarks.suite import load_app
+    load_app()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_batch_endpoint_streams_ndjson(None, monkeypatch)
+    print("All batch tests passed")
@@ -0,0 +1,46 @@
+from benchmarks.corpus import build_corpus
+from benchmarks.suite import Case, compare, measure
+
+def test_corpus_is_deterministic_and_distinct():
+    corpus = build_corpus(size=50, seed=7)
+    assert corpus == build_corpus(size=50, seed=7)
+    assert corpus != build_corpus(size=50, seed=8)
+    for category, inputs in corpus.items():
+        assert len(inputs) >= 50, category
+    # Distinct transcripts, so memoized helpers miss on every one
+    assert len(set(corpus["intents"])) == len(corpus["intents"])
+    assert corpus["names"][0] == "My name is John Smith"
+
+def test_measure_resets_before_every_pass():
+    resets = []
+    case = Case("upper", str.upper, ["a", "b", "c"], lambda: resets.append(1))
+    result = measure(case, repeat=3, min_seconds=0)
+    # Three timed passes plus the allocation pass
+    assert len(resets) == 4
+    assert result["ns_per_op"] <= result["median_ns_per_op"]
+    assert result["peak_bytes_per_op"] >= 0
+
+def test_compare_flags_slowdowns_and_allocation_growth():
+    baseline = {
+        "fast": {"ns_per_op": 1000, "peak_bytes_per_op": 1000},
+        "lean": {"ns_per_op": 1000, "peak_bytes_per_op": 1000},
+        "noisy": {"ns_per_op": 1000, "peak_bytes_per_op": 100},
+    }
+    results = {
+        "fast": {"ns_per_op": 1300, "peak_bytes_per_op": 1000},
+        "lean": {"ns_per_op": 900, "peak_bytes_per_op": 2000},
+        # Small absolute allocation changes are within the slack
+        "noisy": {"ns_per_op": 1100, "peak_bytes_per_op": 300},
+        "new_case": {"ns_per_op": 5000, "peak_bytes_per_op": 5000},
+    }
+    assert compare(results, baseline, threshold=0.25) == [
+        ("fast", "ns_per_op", 1000, 1300),
+        ("lean", "peak_bytes_per_op", 1000, 2000),
+    ]
+    assert compare(results, baseline, threshold=0.5) == [("lean", "peak_bytes_per_op", 1000, 2000)]
+
+if __name__ == "__main__":
+    test_corpus_is_deterministic_and_distinct()
+    test_measure_resets_before_every_pass()
+    test_compare_flags_slowdowns_and_allocation_growth()
+    print("All benchmark suite tests passed")
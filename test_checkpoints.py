@@ -0,0 +1,146 @@
+import time
+import pytest
+from app.checkpoints import (MemoryCheckpointer, MongoCheckpointer, checkpoint_delta, checkpoint_values,
+                             encode_checkpoint, decode_checkpoint)
+
+def test_delta_writes_only_changed_paths():
+    previous = {"conversation_in_progress": True, "original_intent": "schedule_appointment",
+                "appointment_context": {"state": "collecting_name", "patient_name": None,
+                                        "attempts": {"name": 0, "phone": 0}, "stale": 1}}
+    current = {"conversation_in_progress": True, "original_intent": "schedule_appointment",
+               "appointment_context": {"state": "collecting_phone", "patient_name": "Jane Doe",
+                                       "attempts": {"name": 0, "phone": 1}, "available_dates": [{"date": "2025-03-14"}]}}
+    sets, unsets = checkpoint_delta(previous, current)
+    assert sets == {
+        "values.appointment_context.state": "collecting_phone",
+        "values.appointment_context.patient_name": "Jane Doe",
+        "values.appointment_context.attempts.phone": 1,
+        "values.appointment_context.available_dates": [{"date": "2025-03-14"}],
+    }
+    assert unsets == {"values.appointment_context.stale": ""}
+    # A reset to an empty context, keys Mongo can't address and type changes replace the value whole
+    assert checkpoint_delta({"c": {"a": 1}}, {"c": {}}) == ({"values.c": {}}, {})
+    assert checkpoint_delta({"c": {"a.b": 1}}, {"c": {"a.b": 2}}) == ({"values.c": {"a.b": 2}}, {})
+    assert checkpoint_delta({"c": 1}, {"c": True}) == ({"values.c": True}, {})
+
+def test_memory_checkpointer_versions_and_expires():
+    checkpointer = MemoryCheckpointer(ttl_seconds=60)
+    assert checkpointer.load("c1") is None
+    assert checkpointer.save("c1", {"conversation_in_progress": True}) == 1
+    checkpoint = checkpointer.load("c1")
+    assert checkpoint.values == checkpoint_values({"conversation_in_progress": True})
+    assert checkpointer.save("c1", checkpoint.values, checkpoint) == 2
+    checkpointer._checkpoints["c1"] = checkpointer._checkpoints["c1"]._replace(updated_at=time.time() - 61)
+    assert checkpointer.load("c1") is None
+
+def test_memory_checkpointer_holds_bounded_encoded_state():
+    checkpointer = MemoryCheckpointer(ttl_seconds=60, max_conversations=2)
+    for thread_id in ("c1", "c2", "c3"):
+        checkpointer.save(thread_id, {"appointment_context": {"state": "collecting_name"}})
+    # Only the two most recently saved are kept
+    assert checkpointer.load("c1") is None
+    assert checkpointer.size_bytes() == 2 * len(checkpointer.load("c2").data)
+    # Every load decodes its own copy
+    first = checkpointer.load("c2")
+    first.values["appointment_context"]["state"] = "collecting_phone"
+    assert checkpointer.load("c2").values["appointment_context"]["state"] == "collecting_name"
+
+def test_oversized_state_drops_slot_listings_then_is_refused():
+    slots = [{"date": "2025-03-14", "formatted_date": "Friday, March 14", "slots": ["9:00 AM"] * 40}] * 3
+    state = {"appointment_context": {"state": "collecting_date_time", "available_dates": slots}}
+    values, data = encode_checkpoint(state, max_bytes=4096)
+    assert decode_checkpoint(data) == values == checkpoint_values(state)
+    values, data = encode_checkpoint(state, max_bytes=1024)
+    assert values["appointment_context"] == {"state": "collecting_date_time"} and len(data) <= 1024
+    assert "available_dates" in state["appointment_context"]
+    with pytest.raises(ValueError):
+        encode_checkpoint({"appointment_context": {"notes": "x" * 2048}}, max_bytes=1024)
+
+def mongo_checkpointer():
+    mongomock = pytest.importorskip("mongomock")
+    return MongoCheckpointer(mongomock.MongoClient().db.conversation_checkpoints)
+
+def test_mongo_checkpointer_resumes_and_saves_deltas():
+    checkpointer = mongo_checkpointer()
+    assert checkpointer.load("c1") is None
+    assert checkpointer.save("c1", {"conversation_in_progress": True, "original_intent": "schedule_appointment",
+                                    "appointment_context": {"state": "collecting_name"}}) == 1
+
+    resumed = checkpointer.load("c1")
+    values = checkpoint_values(resumed.values)
+    values["appointment_context"] = {"state": "collecting_phone", "patient_name": "Jane Doe"}
+    assert checkpointer.save("c1", values, resumed) == 2
+    assert checkpointer.load("c1").values["appointment_context"] == {"state": "collecting_phone",
+                                                                     "patient_name": "Jane Doe"}
+    checkpointer.delete("c1")
+    assert checkpointer.load("c1") is None
+
+def test_concurrent_turns_both_apply_their_changes():
+    checkpointer = mongo_checkpointer()
+    checkpointer.save("c1", {"appointment_context": {"state": "collecting_name"}})
+    first = checkpointer.load("c1")
+    second = checkpointer.load("c1")
+    checkpointer.save("c1", {"appointment_context": {"state": "collecting_name", "patient_name": "Jane"}}, first)
+    # Saved against a stale version: applied on top rather than overwriting the first turn
+    assert checkpointer.save("c1", {"original_intent": "schedule_appointment",
+                                    "appointment_context": {"state": "collecting_name"}}, second) == 3
+    values = checkpointer.load("c1").values
+    assert values["original_intent"] == "schedule_appointment"
+    assert values["appointment_context"]["patient_name"] == "Jane"
+
+def test_a_changed_ttl_is_applied_to_the_existing_index():
+    from pymongo.errors import OperationFailure
+
+    class Collection:
+        """A collection whose TTL index already exists with another expiry"""
+        name = "conversation_checkpoints"
+        commands = []
+
+        def create_index(self, keys, **options):
+            raise OperationFailure("An equivalent index already exists with different options", code=85)
+
+        @property
+        def database(self):
+            return self
+
+        def command(self, name, collection, **options):
+            if self.commands is None:
+                raise OperationFailure("not authorized", code=13)
+            self.commands.append((name, collection, options))
+
+    MongoCheckpointer(Collection(), ttl_seconds=120)
+    assert Collection.commands == [("collMod", "conversation_checkpoints",
+                                    {"index": {"keyPattern": {"updated_at": 1}, "expireAfterSeconds": 120}})]
+    # Without the rights to change it, the old TTL is kept and startup carries on
+    Collection.commands = None
+    MongoCheckpointer(Collection(), ttl_seconds=120)
+
+def test_workflow_turns_resume_from_the_checkpoint(app_modules):
+    from benchmarks.bench_workflow import STUB_AGENTS
+    from app.agents.langgraph_workflow import build_workflow, process_workflow
+    for executor in ("langgraph", "direct"):
+        graph = build_workflow(STUB_AGENTS, executor)
+        checkpointer = mongo_checkpointer()
+
+        def turn(transcript):
+            return process_workflow({"transcript": transcript, "conversation_id": "c1"}, graph, checkpointer)
+
+        assert turn("I'd like to book an appointment")["intent"] == "schedule_appointment"
+        # Nothing in the second turn says "book"; the intent comes back from the checkpoint
+        final_state = turn("Jane Doe")
+        assert final_state["intent"] == "schedule_appointment"
+        assert final_state["appointment_context"]["state"] == "collecting_name"
+        assert checkpointer.load("c1").version == 2
+
+if __name__ == "__main__":
+    test_delta_writes_only_changed_paths()
+    test_memory_checkpointer_versions_and_expires()
+    test_memory_checkpointer_holds_bounded_encoded_state()
+    test_oversized_state_drops_slot_listings_then_is_refused()
+    test_mongo_checkpointer_resumes_and_saves_deltas()
+    test_concurrent_turns_both_apply_their_changes()
+    test_a_changed_ttl_is_applied_to_the_existing_index()
+    from benchmarks.suite import load_app
+    load_app()
+    test_workflow_turns_resume_from_the_checkpoint(None)
+    print("All checkpoint tests passed")
@@ -0,0 +1,38 @@
+from app.compliance import ComplianceEngine, get_compliance_engine
+
+def test_compliant_response_is_untouched():
+    result = get_compliance_engine().check("Your appointment with Dr. Smith is confirmed for Friday at 2 PM.")
+    assert result.compliant
+    assert not result.rewritten
+    assert result.text == "Your appointment with Dr. Smith is confirmed for Friday at 2 PM."
+
+def test_local_rewrites():
+    engine = get_compliance_engine()
+    result = engine.check("Based on your symptoms, you definitely have the flu. You should take ibuprofen and rest.")
+    assert [v.rule_id for v in result.violations] == ["diagnosis", "directive"]
+    assert result.needs_llm == ()
+    assert "flu" not in result.text
+    # A phrase rewrite at the start of a sentence keeps the capital letter
+    assert "You could ask your doctor about taking ibuprofen and rest." in result.text
+
+def test_rules_without_rewrite_need_the_model():
+    engine = get_compliance_engine()
+    result = engine.check("Take 200 mg of ibuprofen. Our clinic opens at 9.")
+    assert result.needs_llm == ("dosage",)
+
+    engine.remember("Take 200 mg of ibuprofen. Our clinic opens at 9.", "Our clinic opens at 9.")
+    cached = engine.check("Take 200 mg of ibuprofen. Our clinic opens at 9.")
+    assert cached.needs_llm == ()
+    assert cached.text == "Our clinic opens at 9."
+
+def test_matches_whole_phrases_only():
+    engine = ComplianceEngine([{"id": "prescribing", "patterns": ["i can prescribe"], "rewrite": "Ask a doctor."}])
+    assert engine.check("Hi can prescribe...").compliant
+    assert engine.check("I CAN PRESCRIBE that. Bye!").text == "Ask a doctor. Bye!"
+
+if __name__ == "__main__":
+    test_compliant_response_is_untouched()
+    test_local_rewrites()
+    test_rules_without_rewrite_need_the_model()
+    test_matches_whole_phrases_only()
+    print("All compliance tests passed")
@@ -0,0 +1,77 @@
+import pytest
+from app.costs import (CostLedger, ConversationCosts, cost_scope, track_node, token_cost, record_llm_usage,
+                       _current_costs)
+
+mongomock = pytest.importorskip("mongomock")
+
+def test_token_cost_uses_model_prices():
+    assert token_cost("gpt-4o", 1_000_000, 0) == pytest.approx(2.50)
+    assert token_cost("gpt-4o-2024-08-06", 0, 1_000_000) == pytest.approx(10.00)
+    assert token_cost("gpt-4o-mini-2024-07-18", 1_000_000, 0) == pytest.approx(0.15)
+    assert token_cost("unknown-model", 1000, 1000) == 0
+
+def test_calls_take_the_turns_intent_and_node():
+    with cost_scope("conv1", {"state": "collecting_time"}) as costs:
+        track_node("appointment", lambda state: _current_costs.get().add(
+            "date_time_extraction_gpt4", "gpt-4o", {"input": 100, "output": 10}
+        ))({"appointment_context": {"state": "collecting_time"}})
+    entries = costs.entries({"intent": "schedule_appointment", "appointment_context": {"state": "booking_confirmed"}})
+    call, outcome = entries
+    assert call["meta"]["intent"] == "schedule_appointment"
+    assert call["meta"]["node"] == "appointment"
+    assert call["meta"]["appointment_state"] == "collecting_time"
+    assert outcome["meta"] == {"conversation_id": "conv1", "kind": "outcome",
+                               "intent": "schedule_appointment", "operation": "booking"}
+
+def test_outcome_only_recorded_on_transition():
+    costs = ConversationCosts("conv1", "booking_confirmed")
+    assert costs.entries({"intent": "general_inquiry", "appointment_context": {"state": "booking_confirmed"}}) == []
+
+def test_summary_cost_per_completed_operation():
+    ledger = CostLedger(mongomock.MongoClient().db, flush_seconds=0.01)
+    for conversation in ("a", "b"):
+        costs = ConversationCosts(conversation, "initial")
+        costs.add("intent_classification_gpt4", "gpt-4o", {"input": 1000, "output": 100})
+        costs.add("name_extraction_gpt4", "gpt-4o", {"input": 500, "output": 50})
+        ledger.record_many(costs.entries({"intent": "schedule_appointment",
+                                          "appointment_context": {"state": "booking_confirmed"}}))
+    costs = ConversationCosts("c")
+    costs.add("health_inquiry_gpt4", "gpt-4o", {"input": 2000, "output": 300})
+    ledger.record_many(costs.entries({"intent": "health_question"}))
+
+    summary = ledger.summary()
+    ledger.shutdown()
+    booking = summary["per_completed_operation"]["booking"]
+    assert summary["total_calls"] == 5
+    assert summary["conversations"] == 3
+    assert booking["completed"] == 2
+    assert booking["tokens_per_completed"] == 1650
+    assert booking["cost_per_completed"] == pytest.approx(token_cost("gpt-4o", 1500, 150), abs=1e-6)
+    assert summary["per_completed_operation"]["cancellation"]["cost_per_completed"] is None
+
+def test_failed_turns_still_record_their_calls(app_modules, monkeypatch):
+    from app.agents import langgraph_workflow
+    recorded = []
+    monkeypatch.setattr(langgraph_workflow, "finish_costs",
+                        lambda costs, final_state: recorded.extend(costs.entries(final_state)))
+
+    class FailingGraph:
+        def invoke(self, state):
+            record_llm_usage("intent_classification_gpt4", "gpt-4o", {"input": 1000, "output": 100})
+            raise RuntimeError("appointment agent failed")
+
+    with pytest.raises(RuntimeError):
+        langgraph_workflow.process_workflow({"transcript": "hi", "conversation_id": "conv1"}, graph=FailingGraph())
+    assert [entry["meta"]["operation"] for entry in recorded] == ["intent_classification_gpt4"]
+    assert recorded[0]["meta"]["conversation_id"] == "conv1"
+
+if __name__ == "__main__":
+    test_token_cost_uses_model_prices()
+    test_calls_take_the_turns_intent_and_node()
+    test_outcome_only_recorded_on_transition()
+    test_summary_cost_per_completed_operation()
+    from benchmarks.suite import load_app
+    load_app()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_failed_turns_still_record_their_calls(None, monkeypatch)
+    print("All cost ledger tests passed")
@@ -0,0 +1,74 @@
+import time
+import asyncio
+import threading
+import contextvars
+import pytest
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+@pytest.fixture
+def data_access(app_modules):
+    from app import data_access
+    return data_access
+
+def test_gather_overlaps_lookups_and_keeps_order_and_context(data_access):
+    request_id.set("r1")
+
+    def lookup(value):
+        time.sleep(0.05)
+        return value, request_id.get(), threading.current_thread().name
+
+    started = time.perf_counter()
+    results = data_access.gather(lambda: lookup(1), lambda: lookup(2), lambda: lookup(3))
+    assert time.perf_counter() - started < 0.12
+    assert [value for value, _, _ in results] == [1, 2, 3]
+    assert all(seen == "r1" for _, seen, _ in results)
+    # The first lookup runs in the calling thread
+    assert results[0][2] == threading.current_thread().name
+    assert results[1][2].startswith("db-lookup")
+
+def test_gather_raises_after_every_lookup_finishes(data_access):
+    finished = []
+
+    def slow():
+        time.sleep(0.05)
+        finished.append("slow")
+
+    def failing():
+        raise LookupError("no such appointment")
+
+    with pytest.raises(LookupError):
+        data_access.gather(failing, slow)
+    assert finished == ["slow"]
+
+def test_gather_runs_in_line_without_workers(data_access, monkeypatch):
+    monkeypatch.setattr(data_access, "DB_LOOKUP_WORKERS", 0)
+    monkeypatch.setattr(data_access, "_executor", None)
+    threads = data_access.gather(lambda: threading.current_thread().name, lambda: threading.current_thread().name)
+    assert threads == [threading.current_thread().name] * 2
+
+def test_async_models_mirror_the_sync_models(data_access):
+    from app.models import Doctor, Patient
+    AsyncPatient, AsyncDoctor = data_access.AsyncPatient, data_access.AsyncDoctor
+    Doctor.seed_sample_doctors()
+    Patient.create("Jane Doe", "555-987-6543", "jane@example.com", "1985-02-01")
+
+    async def lookups():
+        return await asyncio.gather(AsyncPatient.find_by_phone("555-987-6543"),
+                                    AsyncDoctor.find_by_specialty("Cardiologist"))
+
+    patient, doctors = asyncio.run(lookups())
+    assert patient["name"] == "Jane Doe"
+    assert [doctor["name"] for doctor in doctors] == [doctor["name"] for doctor in Doctor.find_by_specialty("Cardiologist")]
+    assert AsyncPatient.find_by_phone.__doc__ == Patient.find_by_phone.__doc__
+
+if __name__ == "__main__":
+    from benchmarks.suite import load_app
+    load_app()
+    from app import data_access as module
+    test_gather_overlaps_lookups_and_keeps_order_and_context(module)
+    test_gather_raises_after_every_lookup_finishes(module)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_gather_runs_in_line_without_workers(module, monkeypatch)
+    test_async_models_mirror_the_sync_models(module)
+    print("All data access tests passed")
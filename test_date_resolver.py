@@ -0,0 +1,47 @@
+import datetime
+from app.date_resolver import resolve_date_time, resolve_date, resolve_time
+
+# 2030-01-07 is a Monday
+MONDAY = datetime.date(2030, 1, 7)
+
+def test_relative_and_calendar_dates():
+    assert resolve_date("tomorrow", MONDAY) == ("2030-01-08", 0.95)
+    assert resolve_date("the day after tomorrow", MONDAY)[0] == "2030-01-09"
+    assert resolve_date("friday", MONDAY)[0] == "2030-01-11"
+    # Naming today's weekday means next week
+    assert resolve_date("monday", MONDAY)[0] == "2030-01-14"
+    assert resolve_date("in two weeks", MONDAY)[0] == "2030-01-21"
+    assert resolve_date("March 15th", MONDAY)[0] == "2030-03-15"
+    assert resolve_date("15th of march, 2031", MONDAY)[0] == "2031-03-15"
+    # Year-less dates that already passed roll into next year
+    assert resolve_date("1/2", MONDAY)[0] == "2031-01-02"
+    assert resolve_date("the 3rd", MONDAY)[0] == "2030-02-03"
+    assert resolve_date("february 30", MONDAY) == (None, 0.0)
+
+def test_times():
+    assert resolve_time("2:30 pm") == ("14:30", 1.0)
+    assert resolve_time("2 p.m.")[0] == "14:00"
+    assert resolve_time("12 am")[0] == "00:00"
+    assert resolve_time("14:00")[0] == "14:00"
+    assert resolve_time("noon")[0] == "12:00"
+    assert resolve_time("at 3")[0] == "15:00"
+    assert resolve_time("at 9")[0] == "09:00"
+    assert resolve_time("at 9 in the evening")[0] == "21:00"
+    assert resolve_time("afternoon") == ("14:00", 0.5)
+
+def test_transcript_resolution():
+    resolution = resolve_date_time("Can we move it to Friday at 2:30 pm?", MONDAY)
+    assert (resolution.date, resolution.time, resolution.action) == ("2030-01-11", "14:30", "reschedule")
+    assert resolution.complete and resolution.confidence == 0.95
+
+    vague = resolve_date_time("sometime next week in the morning", MONDAY)
+    assert vague.confidence == 0.5
+
+    assert resolve_date_time("hello there", MONDAY).confidence == 0.0
+    assert resolve_date_time("cancel my appointment", MONDAY).action == "cancel"
+
+if __name__ == "__main__":
+    test_relative_and_calendar_dates()
+    test_times()
+    test_transcript_resolution()
+    print("All date resolver tests passed")
@@ -0,0 +1,106 @@
+import pytest
+from app.metrics import INTENT_CLASSIFICATIONS
+
+@pytest.fixture
+def workflow(app_modules):
+    from app.agents import langgraph_workflow
+    return langgraph_workflow
+
+def test_answers_to_the_flow_are_not_interrupts(app_modules):
+    from app.agents.receptionist import detect_interrupt
+    for transcript in ("John Smith", "555-123-4567", "1990-05-12", "jane@example.com",
+                       "Friday at 10:30 AM", "I have had a headache for three days", "yes, that's correct"):
+        assert detect_interrupt(transcript) is None, transcript
+    assert detect_interrupt("Actually, cancel it") == "cancel"
+    assert detect_interrupt("Could we do a different date?") == "reschedule"
+    assert detect_interrupt("Can I move my visit") == "reschedule"
+    assert detect_interrupt("This is an emergency, he can't breathe") == "emergency"
+    assert detect_interrupt("Call 911, she collapsed") == "emergency"
+    assert detect_interrupt("He's having a stroke") == "possible_emergency"
+    # 911 inside a phone number isn't a call for help
+    for transcript in ("555-911-2345", "My number is 5559112345", "911-555-0100"):
+        assert detect_interrupt(transcript) is None, transcript
+    assert detect_interrupt("Wait, what are your office hours?") == "out_of_scope"
+
+def classify_as(monkeypatch, workflow, intent):
+    calls = []
+
+    def receptionist(state):
+        calls.append(state["transcript"])
+        state["intent"] = intent
+        return state
+    monkeypatch.setattr(workflow, "receptionist_agent", receptionist)
+    return calls
+
+def in_flow(transcript, appointment_state="collecting_phone"):
+    return {"transcript": transcript, "conversation_in_progress": True, "original_intent": "schedule_appointment",
+            "appointment_context": {"state": appointment_state}}
+
+def count(mode):
+    return INTENT_CLASSIFICATIONS._values.get((mode,), 0)
+
+def test_in_flow_turns_skip_classification_unless_interrupted(workflow, monkeypatch):
+    calls = classify_as(monkeypatch, workflow, "general_inquiry")
+    skipped = count("skipped")
+    state = workflow.receptionist_agent_wrapper(in_flow("555-123-4567"))
+    assert calls == [] and state["intent"] == "schedule_appointment"
+    assert count("skipped") == skipped + 1
+
+    state = workflow.receptionist_agent_wrapper(in_flow("Wait, what are your office hours?", "collecting_date_time"))
+    assert calls == ["Wait, what are your office hours?"]
+    # Answered by the call center; the flow's state and intent are kept for the next turn
+    assert workflow.route_by_intent(state) == "call_center"
+    assert state["original_intent"] == "schedule_appointment"
+    assert state["appointment_context"] == {"state": "collecting_date_time"}
+
+def test_free_text_answers_are_not_emergencies(workflow, monkeypatch):
+    calls = classify_as(monkeypatch, workflow, "emergency")
+    for transcript, appointment_state in (("555-911-2345", "collecting_phone"),
+                                          ("I had a stroke last year, need a follow up", "collecting_reason"),
+                                          ("What are your office hours? Anyway, it's 1990-05-12", "collecting_birthdate")):
+        state = workflow.receptionist_agent_wrapper(in_flow(transcript, appointment_state))
+        assert state["intent"] == "schedule_appointment", transcript
+    assert calls == []
+    # The same words outside the reason for the visit still interrupt the flow
+    for transcript, appointment_state in (("He's having a stroke", "confirming"),
+                                          ("My husband is having a seizure", "collecting_phone")):
+        state = workflow.receptionist_agent_wrapper(in_flow(transcript, appointment_state))
+        assert calls[-1] == transcript and workflow.route_by_intent(state) == "call_center"
+
+def test_clear_emergencies_interrupt_every_state(workflow, monkeypatch):
+    calls = classify_as(monkeypatch, workflow, "emergency")
+    for appointment_state in sorted(workflow.FREE_TEXT_STATES) + ["collecting_date_time", "confirming"]:
+        for transcript in ("I can't breathe", "Call 911", "I think he took an overdose", "I'm having a heart attack"):
+            state = workflow.receptionist_agent_wrapper(in_flow(transcript, appointment_state))
+            assert calls[-1] == transcript, (transcript, appointment_state)
+            assert workflow.route_by_intent(state) == "call_center", (transcript, appointment_state)
+    # Leaving the flow is still possible while answering
+    assert workflow.receptionist_agent_wrapper(in_flow("cancel it", "collecting_reason"))["intent"] == "cancel_appointment"
+
+def test_interrupts_keep_the_existing_flow_rules(workflow, monkeypatch):
+    classify_as(monkeypatch, workflow, "health_question")
+    # A classification that isn't an interrupt folds back into the flow
+    assert workflow.receptionist_agent_wrapper(in_flow("I'm not sure, is it an emergency?"))["intent"] == "schedule_appointment"
+    assert workflow.receptionist_agent_wrapper(in_flow("no, cancel it"))["intent"] == "cancel_appointment"
+    # Skipped turns in a cancellation flow keep the cancellation intent
+    state = in_flow("MA-00001", "cancelling_collecting_id")
+    assert workflow.receptionist_agent_wrapper(state)["intent"] == "cancel_appointment"
+
+def test_turns_outside_a_flow_are_always_classified(workflow, monkeypatch):
+    calls = classify_as(monkeypatch, workflow, "general_inquiry")
+    full = count("full")
+    state = workflow.receptionist_agent_wrapper({"transcript": "555-123-4567", "appointment_context": {}})
+    assert calls == ["555-123-4567"] and state["intent"] == "general_inquiry"
+    assert count("full") == full + 1
+
+if __name__ == "__main__":
+    from benchmarks.suite import load_app
+    load_app()
+    from app.agents import langgraph_workflow
+    test_answers_to_the_flow_are_not_interrupts(None)
+    for test in (test_in_flow_turns_skip_classification_unless_interrupted, test_free_text_answers_are_not_emergencies,
+                 test_clear_emergencies_interrupt_every_state,
+                 test_interrupts_keep_the_existing_flow_rules, test_turns_outside_a_flow_are_always_classified):
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            test(langgraph_workflow, monkeypatch)
+    print("All intent interrupt tests passed")
@@ -0,0 +1,24 @@
+from app.keywords import KeywordEngine, keyword_tags, has_keyword
+
+def test_tags_match_substring_semantics():
+    """Overlapping and nested phrases are all reported, as `phrase in text` would"""
+    engine = KeywordEngine({
+        "cancel": ["cancel"],
+        "reschedule": ["reschedule", "change appointment"],
+        "change": ["change"]
+    })
+    assert engine.tags("i want to change appointment times") == {"reschedule", "change"}
+    assert engine.tags("cancellation please") == {"cancel"}
+    assert engine.tags("nothing relevant") == frozenset()
+
+def test_shared_lexicons():
+    tags = keyword_tags("Can I MOVE my appointment to Friday?")
+    assert "reschedule_request" in tags
+    assert "date_time" in tags
+    assert has_keyword("Yes, that's correct", "confirm_or_correct")
+    assert not has_keyword("Yes, that's correct", "cancel")
+
+if __name__ == "__main__":
+    test_tags_match_substring_semantics()
+    test_shared_lexicons()
+    print("All keyword tests passed")
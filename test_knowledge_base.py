@@ -0,0 +1,48 @@
+import os
+import json
+import tempfile
+from app.knowledge_base import KnowledgeBase, KnowledgeBaseIndex, get_knowledge_base
+
+def test_token_matching_and_threshold():
+    kb = get_knowledge_base()
+    assert kb.lookup("hi")[0] == "greeting"
+    # "hi" used to match inside "this", "which" and "hiring"
+    assert kb.lookup("this is about hiring") is None
+    assert kb.lookup("what is the weather like") is None
+    assert kb.lookup("Do you take Medicare?")[0] == "insurance"
+
+def test_best_match_wins_over_first_match():
+    kb = get_knowledge_base()
+    # A greeting in front of a real question no longer short-circuits it
+    assert kb.lookup("Hi, what services do you offer?")[0] == "services"
+    assert kb.lookup("what is my name")[0] == "patient_name"
+    assert kb.lookup("can I know your name")[0] == "name"
+
+def test_common_words_do_not_find_candidates():
+    entries = {f"topic_{i}": {"question": [f"what is the topic{i}"], "answer": str(i)} for i in range(200)}
+    entries["plain"] = {"question": ["what is the"], "answer": "plain"}
+    index = KnowledgeBaseIndex(entries)
+    assert "what" in index.common_tokens
+    assert index.lookup("what is the topic42")[:2] == ("topic_42", "42")
+    assert index.lookup("what is the")[0] == "plain"
+
+def test_hot_reload():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "kb.json")
+        with open(path, "w") as f:
+            json.dump({"hours": {"question": ["opening hours"], "answer": "9 to 5"}}, f)
+
+        kb = KnowledgeBase(path, reload_seconds=0)
+        assert kb.lookup("opening hours")[1] == "9 to 5"
+
+        with open(path, "w") as f:
+            json.dump({"hours": {"question": ["opening hours"], "answer": "8 to 6"}}, f)
+        os.utime(path, (0, os.path.getmtime(path) + 10))
+        assert kb.lookup("opening hours")[1] == "8 to 6"
+
+if __name__ == "__main__":
+    test_token_matching_and_threshold()
+    test_best_match_wins_over_first_match()
+    test_common_words_do_not_find_candidates()
+    test_hot_reload()
+    print("All knowledge base tests passed")
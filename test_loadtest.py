@@ -0,0 +1,59 @@
+import random
+from openai import OpenAI
+from loadtest.run import percentile
+from loadtest.scenarios import pick_slot
+from loadtest.stand_ins import LatencyModel, chat_reply, start_fake_openai
+
+BOOKING_REPLY = """I've assigned you to Dr. Smith, General Practitioner. Here are the available time slots:
+
+📅 Monday, October 19, 2026:
+Morning: • 9:00 AM • 10:00 AM
+
+📅 Tuesday, October 20, 2026:
+Afternoon: • 2:00 PM
+"""
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) is None
+
+def test_pick_slot_from_offered_dates():
+    picks = {pick_slot(BOOKING_REPLY, random.Random(seed)) for seed in range(50)}
+    assert picks == {"October 19, 2026 at 9:00 AM", "October 19, 2026 at 10:00 AM", "October 20, 2026 at 2:00 PM"}
+    taken = "I'm sorry, but 09:00 is not available with Dr. Smith on 2026-10-21. Available times include: 11:00 AM, 2:00 PM"
+    assert pick_slot(taken, random.Random(0)) in {"2026-10-21 at 11:00 AM", "2026-10-21 at 2:00 PM"}
+    assert pick_slot("When would you like to come in?") is None
+
+def test_chat_reply_routes_by_prompt():
+    assert chat_reply([{"role": "system", "content": "Respond with ONLY the intent category as a single word."},
+                       {"role": "user", "content": "I need to cancel my appointment"}]) == "cancel_appointment"
+    assert chat_reply([{"role": "system", "content": "You are a helpful assistant extracting an email address from a message."},
+                       {"role": "user", "content": "it's jane.doe@example.com thanks"}]) == "jane.doe@example.com"
+
+def test_latency_model():
+    assert LatencyModel(0).sample() == 0
+    assert LatencyModel(100, sigma=0).sample() == 0.1
+
+def test_openai_client_accepts_stand_in_responses():
+    server = start_fake_openai(LatencyModel(0))
+    try:
+        client = OpenAI(api_key="stand-in", base_url=server.url + "/v1")
+        response = client.chat.completions.create(model="gpt-4o", messages=[
+            {"role": "system", "content": "Respond with ONLY the intent category as a single word."},
+            {"role": "user", "content": "Can I book an appointment for next week?"}
+        ])
+        assert response.choices[0].message.content == "schedule_appointment"
+        assert response.usage.total_tokens > 0
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    test_percentile_nearest_rank()
+    test_pick_slot_from_offered_dates()
+    test_chat_reply_routes_by_prompt()
+    test_latency_model()
+    test_openai_client_accepts_stand_in_responses()
+    print("All load test harness tests passed")
@@ -0,0 +1,65 @@
+import io
+import json
+import logging
+import app.logs as logs
+from app.logs import debug_logger, phi, request_context, ContextFilter, JsonFormatter
+
+class ExplodingRepr:
+    """Fails the test if anything tries to format it"""
+    def __str__(self):
+        raise AssertionError("formatted while debug output was off")
+    __repr__ = __str__
+
+def capture(name):
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.addFilter(ContextFilter())
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger, stream
+
+def records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_debug_is_not_formatted_when_off():
+    logger, stream = capture("test_logs.off")
+    debug_log = debug_logger("test_logs.off")
+    debug_log("state: %s", ExplodingRepr())
+    with request_context(trace=False):
+        debug_log("state: %s", ExplodingRepr())
+    assert stream.getvalue() == ""
+
+def test_traced_request_logs_debug_with_correlation_ids():
+    logger, stream = capture("test_logs.trace")
+    debug_log = debug_logger("test_logs.trace")
+    with request_context("req-1", "conv-1", trace=True):
+        debug_log("Current appointment state: %s", "collecting_name")
+    (record,) = records(stream)
+    assert record["level"] == "DEBUG"
+    assert record["message"] == "Current appointment state: collecting_name"
+    assert record["request_id"] == "req-1"
+    assert record["conversation_id"] == "conv-1"
+
+def test_phi_redacted_by_default():
+    logger, stream = capture("test_logs.phi")
+    logger.info("Extracted name: %s; contact %s", phi("Jane Doe"), "reach me at jane@example.com")
+    assert records(stream)[0]["message"] == "Extracted name: [redacted]; contact reach me at [email]"
+
+def test_phi_logged_when_enabled():
+    logs.LOG_PHI = True
+    try:
+        logger, stream = capture("test_logs.phi_on")
+        logger.info("Extracted name: %s", phi("Jane Doe"))
+    finally:
+        logs.LOG_PHI = False
+    assert records(stream)[0]["message"] == "Extracted name: Jane Doe"
+
+if __name__ == "__main__":
+    test_debug_is_not_formatted_when_off()
+    test_traced_request_logs_debug_with_correlation_ids()
+    test_phi_redacted_by_default()
+    test_phi_logged_when_enabled()
+    print("All logging tests passed")
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+from app.metrics import Histogram, Counter, MongoCommandTimer, MONGO_LATENCY, NODE_LATENCY, instrument_node, render
+
+def test_histogram_exposition():
+    histogram = Histogram("test_seconds", "Test latency", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5.0, stage="a")
+    lines = histogram.render()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+
+def test_counter_and_label_escaping():
+    counter = Counter("test_total", "Test counter", ["name"])
+    counter.inc(2, name='say "hi"')
+    counter.inc(name='say "hi"')
+    assert 'test_total{name="say \\"hi\\""} 3' in counter.render()
+
+def test_instrument_node_labels_from_returned_state():
+    node = instrument_node("unit_test_node", lambda state: {
+        **state, "intent": "cancel_appointment", "appointment_context": {"state": "cancelling_confirming"}
+    })
+    node({"transcript": "cancel please"})
+    exposition = render()
+    assert ('medagent_node_duration_seconds_count{node="unit_test_node",intent="cancel_appointment",'
+            'appointment_state="cancelling_confirming"} 1') in exposition
+
+def test_instrument_node_clamps_unknown_intent_and_times_failures():
+    def failing(state):
+        raise ValueError("boom")
+    node = instrument_node("unit_test_failing", failing)
+    try:
+        node({"intent": "made_up_intent"})
+    except ValueError:
+        pass
+    assert any('node="unit_test_failing",intent="other",appointment_state="none"' in line
+               for line in NODE_LATENCY.render())
+
+def test_mongo_listener_maps_collection():
+    timer = MongoCommandTimer()
+    started = SimpleNamespace(command_name="find", command={"find": "unit_test_coll"}, connection_id=("h", 1), request_id=7)
+    timer.started(started)
+    timer.succeeded(SimpleNamespace(command_name="find", connection_id=("h", 1), request_id=7, duration_micros=1500))
+    assert any('command="find",collection="unit_test_coll",outcome="success"' in line
+               for line in MONGO_LATENCY.render())
+
+if __name__ == "__main__":
+    test_histogram_exposition()
+    test_counter_and_label_escaping()
+    test_instrument_node_labels_from_returned_state()
+    test_instrument_node_clamps_unknown_intent_and_times_failures()
+    test_mongo_listener_maps_collection()
+    print("All metrics tests passed")
@@ -0,0 +1,84 @@
+import pytest
+from app.outbox import EmailOutbox, backoff_delay, PENDING, SENT, DEAD
+
+def make_outbox(sender, max_attempts=3):
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient()["medagent_test"]["email_outbox"]
+    return EmailOutbox(collection, sender, workers=1, max_attempts=max_attempts, poll_seconds=0.01)
+
+def test_backoff_is_exponential_and_capped():
+    assert [backoff_delay(n, base=2, cap=30) for n in range(1, 6)] == [2, 4, 8, 16, 30]
+
+def test_delivers_and_dedupes():
+    sent = []
+    outbox = make_outbox(lambda to, subject, html: sent.append((to, subject)) or True)
+    assert outbox.enqueue("pat@example.com", "Your Appointment Confirmation", "<p>hi</p>", dedupe_key="booking:MA-00001")
+    # The same notification queued again (e.g. a repeated turn) is ignored
+    assert not outbox.enqueue("pat@example.com", "Your Appointment Confirmation", "<p>hi</p>", dedupe_key="booking:MA-00001")
+
+    assert outbox.drain() == 1
+    assert sent == [("pat@example.com", "Your Appointment Confirmation")]
+    metrics = outbox.metrics()
+    assert metrics["depth"][SENT] == 1 and metrics["depth"][PENDING] == 0
+    assert metrics["counters"]["duplicates"] == 1
+    assert metrics["latency_seconds"]["samples"] == 1
+
+def test_retries_with_backoff_then_dead_letters():
+    def failing(to, subject, html):
+        raise ConnectionError("smtp down")
+
+    outbox = make_outbox(failing, max_attempts=2)
+    outbox.enqueue("pat@example.com", "Reminder", "<p>hi</p>")
+
+    assert outbox.drain() == 1
+    message = outbox.collection.find_one()
+    assert message["status"] == PENDING and message["attempts"] == 1
+    assert message["last_error"] == "smtp down"
+    # Not due again until the backoff has passed
+    assert outbox.drain() == 0
+
+    outbox.collection.update_one({"_id": message["_id"]}, {"$set": {"next_attempt_at": message["created_at"]}})
+    assert outbox.drain() == 1
+    assert outbox.collection.find_one()["status"] == DEAD
+    assert outbox.metrics()["counters"]["dead"] == 1
+
+def test_workers_deliver_in_background():
+    import threading
+    delivered = threading.Event()
+    outbox = make_outbox(lambda to, subject, html: delivered.set() or True)
+    outbox.start()
+    try:
+        outbox.enqueue("pat@example.com", "Your Appointment Confirmation", "<p>hi</p>")
+        assert delivered.wait(2)
+    finally:
+        outbox.stop()
+
+def test_notification_keys_never_collide_across_operations(app_modules, monkeypatch):
+    from app.agents import notification
+    keys = []
+    monkeypatch.setattr(notification, "queue_email", lambda **message: keys.append(message["dedupe_key"]) or True)
+
+    def notify(intent, details_key, **details):
+        notification.notification_agent({"intent": intent, details_key: {"patient_email": "pat@example.com", **details},
+                                         "appointment_context": {}})
+
+    # Without an appointment ID there's nothing to dedupe on
+    notify("schedule_appointment", "appointment_details")
+    notify("cancel_appointment", "cancellation_details")
+    notify("schedule_appointment", "appointment_details", appointment_id="MA-00001")
+    # Moving A -> B -> A is two reschedules, each confirmed
+    for reschedule_id in ("r1", "r2"):
+        notify("reschedule_appointment", "reschedule_details", appointment_id="MA-00001", reschedule_id=reschedule_id,
+               new_date="2030-01-10", new_time="10:00 AM")
+    assert keys == [None, None, "booking:MA-00001", "reschedule:MA-00001:r1", "reschedule:MA-00001:r2"]
+
+if __name__ == "__main__":
+    test_backoff_is_exponential_and_capped()
+    test_delivers_and_dedupes()
+    test_retries_with_backoff_then_dead_letters()
+    test_workers_deliver_in_background()
+    from benchmarks.suite import load_app
+    load_app()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_notification_keys_never_collide_across_operations(None, monkeypatch)
+    print("All outbox tests passed")
@@ -0,0 +1,82 @@
+import time
+import pstats
+from app.profiling import (ProfileStore, RequestProfiler, sign_profile_token, verify_profile_token, is_admin,
+                           PROFILE_TOKEN_MAX_SECONDS)
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+def test_signed_tokens_expire_and_resist_tampering():
+    now = 1_700_000_000
+    token = sign_profile_token("secret", ttl=60, now=now)
+    assert verify_profile_token(token, "secret", now=now)
+    assert not verify_profile_token(token, "other-secret", now=now)
+    assert not verify_profile_token(token, "secret", now=now + 61)
+    expires, signature = token.split(".")
+    assert not verify_profile_token(f"{int(expires) + 60}.{signature}", "secret", now=now)
+    # Tokens claiming a lifetime beyond the limit are refused even when correctly signed
+    assert not verify_profile_token(sign_profile_token("secret", ttl=PROFILE_TOKEN_MAX_SECONDS + 60, now=now),
+                                    "secret", now=now)
+    assert not verify_profile_token("garbage", "secret", now=now)
+    assert not verify_profile_token(token, "", now=now)
+    assert is_admin("secret", "secret") and not is_admin("guess", "secret") and not is_admin("", "")
+
+def test_capture_writes_pstats_and_collapsed_stacks(tmp_path):
+    profiler = RequestProfiler(ProfileStore(str(tmp_path), size=5), secret="secret", interval_ms=1)
+    profile = profiler.start("header")
+    busy(0.05)
+    meta = profiler.finish(profile, path="/api/text/c1", status=200)
+
+    assert meta["trigger"] == "header" and meta["path"] == "/api/text/c1" and meta["samples"] > 0
+    stats = pstats.Stats(profiler.store.path(profile.id, "pstats"))
+    assert any(name == "busy" for _, _, name in stats.stats)
+    with open(profiler.store.path(profile.id, "collapsed")) as f:
+        lines = f.read().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "test_profiling.py:busy" in stack.split(";") and int(count) > 0
+
+def test_one_capture_at_a_time(tmp_path):
+    profiler = RequestProfiler(ProfileStore(str(tmp_path)), secret="secret")
+    first = profiler.start("admin")
+    assert profiler.start("admin") is None
+    profiler.finish(first)
+    second = profiler.start("admin")
+    assert second is not None
+    profiler.finish(second)
+
+def test_ring_keeps_the_newest_profiles(tmp_path):
+    profiler = RequestProfiler(ProfileStore(str(tmp_path), size=2), secret="secret")
+    ids = []
+    for _ in range(3):
+        profile = profiler.start("admin")
+        ids.append(profile.id)
+        profiler.finish(profile)
+        time.sleep(0.002)
+    assert [meta["id"] for meta in profiler.store.list()] == [ids[2], ids[1]]
+    assert profiler.store.path(ids[0], "pstats") is None
+    assert len(list(tmp_path.iterdir())) == 6
+    assert profiler.store.path("../../etc/passwd", "pstats") is None
+    assert profiler.store.path(ids[2], "json") is None
+
+def test_armed_profiler_counts_down_matching_requests(tmp_path):
+    profiler = RequestProfiler(ProfileStore(str(tmp_path)), secret="secret")
+    assert profiler.trigger_for("/api/text/c1", None) is None
+    profiler.arm(2, "/api/text")
+    assert profiler.trigger_for("/metrics", None) is None
+    assert profiler.trigger_for("/api/text/c1", None) == "admin"
+    assert profiler.trigger_for("/api/text/c2", None) == "admin"
+    assert profiler.trigger_for("/api/text/c3", None) is None
+    assert profiler.trigger_for("/metrics", sign_profile_token("secret")) == "header"
+    assert profiler.trigger_for("/metrics", "1.forged") is None
+
+if __name__ == "__main__":
+    import tempfile, pathlib
+    test_signed_tokens_expire_and_resist_tampering()
+    for test in (test_capture_writes_pstats_and_collapsed_stacks, test_one_capture_at_a_time,
+                 test_ring_keeps_the_newest_profiles, test_armed_profiler_counts_down_matching_requests):
+        test(pathlib.Path(tempfile.mkdtemp()))
+    print("All profiling tests passed")
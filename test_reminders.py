@@ -0,0 +1,102 @@
+import pytest
+from app.reminders import ReminderJob, send_reminders_with_retries
+
+DAY = "2030-01-08"
+
+def make_job(send_batch, batch_size=2):
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient()["medagent_test"]
+    doctor_id = db.doctors.insert_one({"name": "Dr. Smith"}).inserted_id
+    with_email = db.patients.insert_one({"name": "Ann", "email": "ann@example.com"}).inserted_id
+    other = db.patients.insert_one({"name": "Bob", "email": "bob@example.com"}).inserted_id
+    no_email = db.patients.insert_one({"name": "Cat", "email": ""}).inserted_id
+    db.appointments.insert_many([
+        {"appointment_id": "MA-00001", "patient_id": with_email, "doctor_id": str(doctor_id),
+         "date": DAY, "time": "09:00", "status": "confirmed"},
+        {"appointment_id": "MA-00002", "patient_id": other, "doctor_id": doctor_id,
+         "date": DAY, "time": "14:00", "status": "rescheduled"},
+        {"appointment_id": "MA-00003", "patient_id": no_email, "doctor_id": doctor_id,
+         "date": DAY, "time": "15:00", "status": "confirmed"},
+        {"appointment_id": "MA-00004", "patient_id": other, "doctor_id": doctor_id,
+         "date": DAY, "time": "16:00", "status": "cancelled"},
+        {"appointment_id": "MA-00005", "patient_id": other, "doctor_id": doctor_id,
+         "date": "2030-01-09", "time": "09:00", "status": "confirmed"}
+    ])
+    render = lambda details: f"{details['patient_name']} {details['time']} {details['doctor_name']}"
+    return ReminderJob(db.appointments, db.patients, db.doctors, send_batch, render, batch_size=batch_size)
+
+def test_sends_each_reminder_once():
+    sent = []
+    def send_batch(emails):
+        sent.extend(emails)
+        return [True] * len(emails)
+
+    job = make_job(send_batch)
+    stats = job.run(DAY)
+    assert (stats["scanned"], stats["sent"], stats["skipped"], stats["failed"]) == (3, 2, 1, 0)
+    assert sorted(body for _, _, body in sent) == ["Ann 9:00 AM Dr. Smith", "Bob 2:00 PM Dr. Smith"]
+
+    # A second run finds nothing left to send
+    assert job.run(DAY)["scanned"] == 0
+    assert len(sent) == 2
+
+def test_failed_sends_are_retried_next_run():
+    outcomes = [False]
+    def send_batch(emails):
+        return [outcomes[0]] * len(emails)
+
+    job = make_job(send_batch, batch_size=10)
+    assert job.run(DAY)["failed"] == 2
+    outcomes[0] = True
+    assert job.run(DAY)["sent"] == 2
+
+def test_scheduler_retries_failed_sends_for_the_same_day():
+    outcomes = [False, False, True]
+    sent = []
+    def send_batch(emails):
+        ok = outcomes.pop(0)
+        if ok:
+            sent.extend(to for to, _, _ in emails)
+        return [ok] * len(emails)
+
+    job = make_job(send_batch, batch_size=10)
+    stats = send_reminders_with_retries(DAY, retries=3, retry_seconds=0, job=job)
+    assert (stats["sent"], stats["failed"]) == (2, 0)
+    assert sorted(sent) == ["ann@example.com", "bob@example.com"] and outcomes == []
+
+    # Gives up after the last retry
+    job = make_job(lambda emails: [False] * len(emails), batch_size=10)
+    assert send_reminders_with_retries(DAY, retries=2, retry_seconds=0, job=job)["failed"] == 2
+
+def test_dry_run_changes_nothing():
+    job = make_job(lambda emails: pytest.fail("dry run must not send"))
+    assert job.run(DAY, dry_run=True)["scanned"] == 3
+    assert job.appointments.count_documents({"reminder": {"$exists": True}}) == 0
+
+def test_rescheduled_appointments_are_reminded_again(app_modules, monkeypatch):
+    from app import models
+    sent = []
+    def send_batch(emails):
+        sent.extend(emails)
+        return [True] * len(emails)
+
+    job = make_job(send_batch)
+    assert job.run(DAY)["sent"] == 2
+    monkeypatch.setattr(models, "appointments_collection", job.appointments)
+    assert models.Appointment.reschedule("MA-00001", "2030-01-10", "10:00")
+
+    sent.clear()
+    stats = job.run("2030-01-10")
+    assert (stats["sent"], len(sent)) == (1, 1)
+    assert sent[0][0] == "ann@example.com"
+
+if __name__ == "__main__":
+    test_sends_each_reminder_once()
+    test_failed_sends_are_retried_next_run()
+    test_scheduler_retries_failed_sends_for_the_same_day()
+    test_dry_run_changes_nothing()
+    from benchmarks.suite import load_app
+    load_app()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_rescheduled_appointments_are_reminded_again(None, monkeypatch)
+    print("All reminder tests passed")
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import numpy as np
+import pytest
+from app import retrieval
+from app.retrieval import DocumentIndex, chunk_document
+
+def test_chunking_splits_long_sections():
+    text = "# Doc\n\n## Short\nOne sentence.\n\n## Long\n" + " ".join(["This is a sentence of words."] * 40)
+    chunks = chunk_document("Doc", text)
+    assert chunks[0] == {"title": "Doc", "section": "Short", "text": "One sentence."}
+    assert len(chunks) > 2
+    assert all(len(chunk["text"].split()) <= retrieval.CHUNK_WORDS for chunk in chunks)
+
+def test_search_and_mmap_round_trip():
+    index = DocumentIndex.build()
+    assert index.search("how do I cancel my appointment")[0][1]["section"] == "Cancelling"
+
+    with tempfile.TemporaryDirectory() as directory:
+        index.save(directory)
+        loaded = DocumentIndex.load(directory)
+        assert isinstance(loaded.embeddings, np.memmap)
+        assert loaded.fingerprint == index.fingerprint
+        assert loaded.search("where do I park")[0][1]["section"] == "Address and parking"
+
+def test_a_failed_save_leaves_the_previous_index(monkeypatch):
+    index = DocumentIndex.build()
+    with tempfile.TemporaryDirectory() as directory:
+        index.save(directory)
+        first = DocumentIndex.load(directory)
+
+        replacement = DocumentIndex(index.chunks[:1], np.asarray(index.embeddings[:1]), index.idf, "other")
+        def crash(*args, **kwargs):
+            raise OSError("disk full")
+        monkeypatch.setattr(retrieval.json, "dump", crash)
+        with pytest.raises(OSError):
+            replacement.save(directory)
+        loaded = DocumentIndex.load(directory)
+        assert loaded.fingerprint == index.fingerprint and len(loaded.chunks) == len(index.chunks)
+        assert loaded.embeddings.shape == index.embeddings.shape
+
+        # A completed save replaces the index whole and removes the arrays it no longer uses
+        monkeypatch.undo()
+        replacement.save(directory)
+        loaded = DocumentIndex.load(directory)
+        assert (loaded.fingerprint, len(loaded.chunks), loaded.embeddings.shape[0]) == ("other", 1, 1)
+        assert sorted(name.split(".")[0] for name in os.listdir(directory)) == ["chunks", "embeddings", "idf"]
+        # The index loaded before the swap is still readable
+        assert first.search("where do I park")[0][1]["section"] == "Address and parking"
+
+def test_answer_modes():
+    retrieval._index = DocumentIndex.build()
+    direct = retrieval.retrieve_answer("when will I get a confirmation email")
+    assert direct["mode"] == "direct" and "confirmation email" in direct["answer"]
+
+    assert retrieval.retrieve_answer("tell me a joke")["mode"] == "miss"
+
+    partial = retrieval.retrieve_answer("is there a cardiologist")
+    assert partial["mode"] == "llm"
+    assert 0 < sum(len(p) for p in partial["passages"]) <= retrieval.RETRIEVAL_CONTEXT_CHARS + 100
+
+    stats = retrieval.retrieval_stats()
+    assert stats["queries"] >= 3 and 0 < stats["answered_without_llm"] < 1
+
+if __name__ == "__main__":
+    test_chunking_splits_long_sections()
+    test_search_and_mmap_round_trip()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_a_failed_save_leaves_the_previous_index(monkeypatch)
+    test_answer_modes()
+    print("All retrieval tests passed")
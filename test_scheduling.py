@@ -0,0 +1,150 @@
+import datetime
+import pytest
+from app import scheduling
+from app.scheduling import DoctorSchedule, format_slot, slot_minutes, schedule_for, earliest_slots, filter_slots
+
+# 2030-01-07 is a Monday
+MONDAY = datetime.date(2030, 1, 7)
+
+def test_slot_formats():
+    """Storage and display formats map to the same minute of the day"""
+    assert format_slot("14:00") == "2:00 PM"
+    assert format_slot("09:30") == "9:30 AM"
+    assert format_slot("00:15") == "12:15 AM"
+    assert format_slot("12:00") == "12:00 PM"
+    assert format_slot("10") == "10:00 AM"
+    assert slot_minutes("2:00 PM") == slot_minutes("14:00")
+    assert slot_minutes("12:30 AM") == 30
+
+def test_weekly_template_and_exceptions():
+    """Templates repeat every week; exceptions replace them on a single date"""
+    schedule = DoctorSchedule(
+        weekly={"monday": ["14:00", "09:00"], "wednesday": ["10:00"]},
+        exceptions={
+            # Vacation on the second Monday, extra Sunday clinic
+            (MONDAY + datetime.timedelta(days=7)).isoformat(): [],
+            (MONDAY + datetime.timedelta(days=6)).isoformat(): ["11:00"]
+        }
+    )
+
+    assert schedule.slots_for(MONDAY) == ("9:00 AM", "2:00 PM")
+    assert schedule.slots_for(MONDAY.isoformat()) == ("9:00 AM", "2:00 PM")
+    assert schedule.slots_for(MONDAY + datetime.timedelta(days=1)) == ()
+    assert schedule.slots_for(MONDAY + datetime.timedelta(days=6)) == ("11:00 AM",)
+    assert not schedule.works_on(MONDAY + datetime.timedelta(days=7))
+    # Far-future dates are computed on demand from the template
+    assert schedule.slots_for(MONDAY + datetime.timedelta(days=7 * 52)) == ("9:00 AM", "2:00 PM")
+
+def test_free_slots_ignore_booked_in_either_format():
+    schedule = DoctorSchedule(weekly={"monday": ["09:00", "10:00", "14:00"]})
+    assert schedule.free_slots(MONDAY, {"10:00", "2:00 PM"}) == ["9:00 AM"]
+    assert schedule.free_slots(MONDAY) == ["9:00 AM", "10:00 AM", "2:00 PM"]
+
+def test_iter_days_only_visits_window():
+    schedule = DoctorSchedule(weekly={"monday": ["09:00"], "friday": ["09:00"]})
+    days = [date for date, _ in schedule.iter_days(MONDAY, 14)]
+    assert days == [
+        MONDAY,
+        MONDAY + datetime.timedelta(days=4),
+        MONDAY + datetime.timedelta(days=7),
+        MONDAY + datetime.timedelta(days=11)
+    ]
+
+def test_slot_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(scheduling, "SCHEDULE_MEMO_DATES", 10)
+    schedule = DoctorSchedule(weekly={"monday": ["09:00"]})
+    today = datetime.date.today()
+    for offset in range(-20, 40):
+        date = today + datetime.timedelta(days=offset)
+        assert schedule.slots_for(date) == (("9:00 AM",) if date.weekday() == 0 else ())
+        assert len(schedule._memo) <= 10
+    # Past dates are pruned before upcoming ones
+    schedule = DoctorSchedule(weekly={"monday": ["09:00"]})
+    for offset in range(-9, 1):
+        schedule.slots_for(today + datetime.timedelta(days=offset))
+    schedule.slots_for(today + datetime.timedelta(days=1))
+    assert sorted(schedule._memo) == [today, today + datetime.timedelta(days=1)]
+
+def test_legacy_available_slots_are_exceptions():
+    """Doctor documents with a literal dated slot map keep working"""
+    doctor = {"available_slots": {MONDAY.isoformat(): ["15:00"]}}
+    schedule = DoctorSchedule.from_doctor(doctor)
+    assert schedule.slots_for(MONDAY) == ("3:00 PM",)
+    assert schedule.slots_for(MONDAY + datetime.timedelta(days=7)) == ()
+
+def test_schedule_cache_follows_version():
+    doctor = {"_id": "doc-1", "schedule": {"weekly": {"monday": ["09:00"]}, "version": 1}}
+    assert schedule_for(doctor) is schedule_for(dict(doctor))
+
+    edited = {"_id": "doc-1", "schedule": {"weekly": {"monday": ["10:00"]}, "version": 2}}
+    assert schedule_for(edited) is not schedule_for(doctor)
+    assert schedule_for(edited).slots_for(MONDAY) == ("10:00 AM",)
+
+def test_earliest_slots_merge_across_doctors():
+    """The earliest slots come from whichever doctor has them, not the first one"""
+    schedules = {
+        "a": DoctorSchedule(weekly={"monday": ["14:00"], "tuesday": ["09:00"]}),
+        "b": DoctorSchedule(weekly={"monday": ["09:00", "10:00"]}),
+        "c": DoctorSchedule(weekly={"wednesday": ["08:00"]})
+    }
+    booked = {("b", MONDAY.isoformat()): {"9:00 AM"}}
+
+    found = earliest_slots(schedules, MONDAY, 90, k=4, booked_loader=lambda first, last: booked)
+    assert [(date, doctor_id, slot) for date, _, doctor_id, slot in found] == [
+        (MONDAY, "b", "10:00 AM"),
+        (MONDAY, "a", "2:00 PM"),
+        (MONDAY + datetime.timedelta(days=1), "a", "9:00 AM"),
+        (MONDAY + datetime.timedelta(days=2), "c", "8:00 AM")
+    ]
+
+def test_earliest_slots_preferences():
+    schedules = {
+        "a": DoctorSchedule(weekly={"monday": ["09:00", "14:00"], "friday": ["09:00", "14:00"]}),
+        "b": DoctorSchedule(weekly={"tuesday": ["15:00"]})
+    }
+
+    afternoon = earliest_slots(schedules, MONDAY, 14, k=3, part_of_day="afternoon")
+    assert [slot for _, _, _, slot in afternoon] == ["2:00 PM", "3:00 PM", "2:00 PM"]
+
+    fridays = earliest_slots(schedules, MONDAY, 14, k=10, weekdays=["friday"])
+    assert {date.weekday() for date, _, _, _ in fridays} == {4}
+    assert len(fridays) == 4
+
+def test_filter_slots_keeps_preferred_days_and_times():
+    slots = ["9:00 AM", "11:30 AM", "2:00 PM", "6:00 PM"]
+    assert filter_slots(MONDAY, slots) == slots
+    assert filter_slots(MONDAY, slots, part_of_day="morning") == ["9:00 AM", "11:30 AM"]
+    assert filter_slots(MONDAY, slots, part_of_day="evening", weekdays=["monday"]) == ["6:00 PM"]
+    assert filter_slots(MONDAY.isoformat(), slots, weekdays=["tuesday"]) == []
+
+def test_earliest_slots_loads_bookings_lazily():
+    """A search satisfied in the first window never loads later bookings"""
+    windows = []
+
+    def loader(first, last):
+        windows.append((first, last))
+        return {}
+
+    schedules = {"a": DoctorSchedule(weekly={"monday": ["09:00"]})}
+    earliest_slots(schedules, MONDAY, 90, k=1, booked_loader=loader)
+    assert windows == [(MONDAY, MONDAY + datetime.timedelta(days=6))]
+
+    windows.clear()
+    found = earliest_slots(schedules, MONDAY, 90, k=100, booked_loader=loader)
+    assert len(found) == 13
+    assert windows[-1][1] == MONDAY + datetime.timedelta(days=89)
+
+if __name__ == "__main__":
+    test_slot_formats()
+    test_weekly_template_and_exceptions()
+    test_free_slots_ignore_booked_in_either_format()
+    test_iter_days_only_visits_window()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_slot_memo_is_bounded(monkeypatch)
+    test_legacy_available_slots_are_exceptions()
+    test_schedule_cache_follows_version()
+    test_earliest_slots_merge_across_doctors()
+    test_earliest_slots_preferences()
+    test_filter_slots_keeps_preferred_days_and_times()
+    test_earliest_slots_loads_bookings_lazily()
+    print("All scheduling tests passed")
@@ -0,0 +1,101 @@
+import smtplib
+import pytest
+from app.smtp_pool import SMTPConnectionPool
+
+class FakeSMTP:
+    """Records handshakes and sends; can be told to drop the connection"""
+    connects = 0
+    max_connects = None
+    drop_next = False
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        if FakeSMTP.max_connects is not None and FakeSMTP.connects >= FakeSMTP.max_connects:
+            raise ConnectionRefusedError("connection refused")
+        FakeSMTP.connects += 1
+
+    def ehlo(self):
+        return 250, b"ok"
+
+    def starttls(self):
+        return 220, b"ok"
+
+    def login(self, user, password):
+        return 235, b"ok"
+
+    def noop(self):
+        return 250, b"ok"
+
+    def sendmail(self, from_email, to_email, message):
+        if FakeSMTP.drop_next:
+            FakeSMTP.drop_next = False
+            raise smtplib.SMTPServerDisconnected("connection dropped")
+        if to_email.startswith("drop"):
+            raise smtplib.SMTPServerDisconnected("connection dropped")
+        if to_email.startswith("bad"):
+            raise smtplib.SMTPRecipientsRefused({to_email: (550, b"no such user")})
+        FakeSMTP.sent.append(to_email)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+def reset():
+    FakeSMTP.connects = 0
+    FakeSMTP.max_connects = None
+    FakeSMTP.drop_next = False
+    FakeSMTP.sent = []
+    return SMTPConnectionPool("smtp.example.com", 587, "user", "secret", size=2, smtp_class=FakeSMTP)
+
+def test_sessions_are_reused():
+    pool = reset()
+    for n in range(5):
+        assert pool.send("clinic@example.com", f"p{n}@example.com", "hi")
+    assert FakeSMTP.connects == 1
+    assert pool.stats["reused"] == 4
+
+def test_reconnects_after_a_dropped_session():
+    pool = reset()
+    pool.send("clinic@example.com", "a@example.com", "hi")
+    FakeSMTP.drop_next = True
+    assert pool.send("clinic@example.com", "b@example.com", "hi")
+    assert FakeSMTP.sent == ["a@example.com", "b@example.com"]
+    assert FakeSMTP.connects == 2 and pool.stats["reconnects"] == 1
+
+def test_send_many_reports_per_message():
+    pool = reset()
+    FakeSMTP.drop_next = True
+    batch = [("clinic@example.com", to, "hi") for to in ("a@example.com", "bad@example.com", "c@example.com")]
+    assert pool.send_many(batch) == [True, False, True]
+    assert FakeSMTP.sent == ["a@example.com", "c@example.com"]
+
+def test_refused_recipients_keep_the_session():
+    pool = reset()
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send("clinic@example.com", "bad@example.com", "hi")
+    assert pool.send("clinic@example.com", "a@example.com", "hi")
+    assert FakeSMTP.connects == 1 and pool.stats["reconnects"] == 0
+
+def test_send_many_keeps_partial_results_when_reconnecting_fails():
+    pool = reset()
+    FakeSMTP.max_connects = 1
+    batch = [("clinic@example.com", to, "hi") for to in ("a@example.com", "drop@example.com", "c@example.com")]
+    # The second connection() can't reach the server; what was sent is still reported
+    assert pool.send_many(batch) == [True, False, False]
+    assert FakeSMTP.sent == ["a@example.com"] and pool.stats["failed"] == 2
+
+    pool = reset()
+    FakeSMTP.max_connects = 1
+    with pytest.raises(ConnectionRefusedError):
+        pool.send_many(batch[1:])
+    assert FakeSMTP.sent == []
+
+if __name__ == "__main__":
+    test_sessions_are_reused()
+    test_reconnects_after_a_dropped_session()
+    test_send_many_reports_per_message()
+    test_refused_recipients_keep_the_session()
+    test_send_many_keeps_partial_results_when_reconnecting_fails()
+    print("All SMTP pool tests passed")
@@ -0,0 +1,40 @@
+from app.specialty_matcher import SpecialtyMatcher, get_specialty_matcher
+from app.phrase_matcher import PhraseMatcher
+
+def test_word_boundaries():
+    """A term only matches whole words, so "heart" does not fire inside "heartburn\""""
+    matcher = get_specialty_matcher()
+    assert matcher.best("I have terrible heartburn after meals") == "Gastroenterologist"
+    assert matcher.best("chest pain and my heart races") == "Cardiologist"
+    assert matcher.best("my ear hurts") == "ENT Specialist"
+    assert matcher.best("I keep hearing things") == "General Practitioner"
+
+def test_plurals_and_default():
+    matcher = get_specialty_matcher()
+    assert matcher.best("recurring headaches") == "Neurologist"
+    assert matcher.best("just a routine checkup", default="General Practitioner") == "General Practitioner"
+    assert matcher.rank("") == ()
+
+def test_ranking_and_confidence():
+    matcher = SpecialtyMatcher({
+        "Cardiologist": ["heart", "chest pain"],
+        "Pulmonologist": ["cough"]
+    })
+    ranked = matcher.rank("chest pain with a cough")
+    assert [specialty for specialty, _ in ranked] == ["Cardiologist", "Pulmonologist"]
+    # Two-word phrases count double
+    assert abs(ranked[0][1] - 2 / 3) < 1e-9
+    assert abs(sum(confidence for _, confidence in ranked) - 1) < 1e-9
+
+def test_substring_mode_reports_overlaps():
+    matcher = PhraseMatcher(["heart", "heartburn", "burn"], mode="substring")
+    found = [phrase for _, _, phrase in matcher.finditer("heartburn")]
+    assert found == ["heartburn", "burn"]
+    assert matcher.prefixes("heartburn") == ["heart", "heartburn"]
+
+if __name__ == "__main__":
+    test_word_boundaries()
+    test_plurals_and_default()
+    test_ranking_and_confidence()
+    test_substring_mode_reports_overlaps()
+    print("All specialty matcher tests passed")
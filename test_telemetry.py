@@ -0,0 +1,33 @@
+import threading
+from app.telemetry import TelemetrySink
+
+def test_batches_and_flushes_on_shutdown():
+    batches = []
+    sink = TelemetrySink(batches.append, batch_size=10, flush_seconds=0.05)
+    for n in range(25):
+        assert sink.record({"name": f"call{n}"})
+    sink.shutdown()
+    assert sum(len(batch) for batch in batches) == 25
+    assert max(len(batch) for batch in batches) <= 10
+    assert sink.stats()["exported"] == 25
+
+def test_drops_instead_of_blocking_when_full():
+    release = threading.Event()
+    sink = TelemetrySink(lambda batch: release.wait(2), queue_size=5, batch_size=1, flush_seconds=0.01)
+    results = [sink.record({"name": f"call{n}"}) for n in range(20)]
+    assert not all(results)
+    assert sink.stats()["dropped"] == results.count(False)
+    release.set()
+    sink.shutdown()
+
+def test_sampling():
+    sink = TelemetrySink(lambda batch: None, sample_rate=0.0)
+    assert not sink.record({"name": "call"})
+    assert sink.stats()["sampled_out"] == 1
+    sink.shutdown()
+
+if __name__ == "__main__":
+    test_batches_and_flushes_on_shutdown()
+    test_drops_instead_of_blocking_when_full()
+    test_sampling()
+    print("All telemetry tests passed")
@@ -0,0 +1,73 @@
+import pytest
+from typing import TypedDict
+from langgraph.graph import StateGraph
+from app.dispatch import DirectDispatchGraph
+
+class State(TypedDict):
+    count: int
+    context: dict
+    response: str
+
+def first(state):
+    state["count"] += 1
+    state["context"]["seen"] = True
+    # Outside the schema: dropped from the state, but the next router sees it
+    state["needs_notification"] = True
+    return state
+
+def route(state):
+    state["count"] = 100
+    return "notify" if state.get("needs_notification") else "done"
+
+def notify(state):
+    assert "needs_notification" not in state
+    return {"response": f"count={state['count']}", "ignored": 1}
+
+def done(state):
+    return {"response": "done"}
+
+NODES = {"first": first, "notify": notify, "done": done}
+
+def langgraph_version():
+    builder = StateGraph(state_schema=State)
+    for name, fn in NODES.items():
+        builder.add_node(name, fn)
+    builder.add_conditional_edges("first", route, {"notify": "notify", "done": "done"})
+    builder.set_entry_point("first")
+    return builder.compile()
+
+def direct_version():
+    return DirectDispatchGraph(NODES, {"first": route}, "first", State.__annotations__)
+
+def test_direct_dispatch_matches_langgraph_state_semantics():
+    expected = langgraph_version().invoke({"count": 1, "context": {}, "conversation_id": "c1"})
+    actual = direct_version().invoke({"count": 1, "context": {}, "conversation_id": "c1"})
+    assert actual == expected == {"count": 2, "context": {"seen": True}, "response": "count=2"}
+
+def test_direct_dispatch_limits_steps_and_checks_routes():
+    looping = DirectDispatchGraph({"a": lambda state: state}, {"a": "a"}, "a", State.__annotations__, step_limit=5)
+    with pytest.raises(RuntimeError):
+        looping.invoke({})
+    with pytest.raises(ValueError):
+        DirectDispatchGraph({"a": lambda state: state}, {"a": "missing"}, "a", State.__annotations__)
+    with pytest.raises(ValueError):
+        DirectDispatchGraph({"a": lambda state: state}, {"a": lambda state: "missing"}, "a", ()).invoke({})
+
+def test_executors_agree_on_the_scenario_corpus(app_modules):
+    from benchmarks.bench_workflow import run_scenarios, SCENARIOS
+    expected = run_scenarios("langgraph")
+    assert run_scenarios("direct") == expected
+    # The corpus takes every edge of the graph
+    visited = {tuple(path) for _, path in expected}
+    assert ("receptionist", "call_center", "content_management") in visited
+    assert ("receptionist", "appointment", "content_management") in visited
+    assert ("receptionist", "appointment", "notification", "content_management") in visited
+    assert len(expected) == len(SCENARIOS)
+
+if __name__ == "__main__":
+    test_direct_dispatch_matches_langgraph_state_semantics()
+    test_direct_dispatch_limits_steps_and_checks_routes()
+    from benchmarks.suite import load_app
+    load_app()
+    test_executors_agree_on_the_scenario_corpus(None)
+    print("All workflow dispatch tests passed")